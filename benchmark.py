@@ -0,0 +1,249 @@
+# Benchmarks for core Wfst operations across alphabet size, context
+# length and machine size. Each (operation, parameters) case is run in
+# a fresh subprocess, timed over several repeats, then run once more
+# under tracemalloc for the peak Python-heap allocation (which does not
+# include memory allocated by OpenFst). The peak resident set size of
+# the subprocess is reported both before and after running the case,
+# so that memory used by the operation itself is not masked by earlier
+# cases. Results are written as one JSON object per line.
+# Usage:
+#   python benchmark.py --sigma 2 4 8 --context 1 2 --length 10 100
+#   python benchmark.py --label new --compare bench_output_old.txt
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pynini
+
+sys.path.append('..')
+from wynini import config
+from wynini.wfst import *
+
+ops = [
+    'ngram_acceptor_left', 'ngram_acceptor_right', 'ngram_acceptor_both',
+    'trellis_acceptor', 'compose', 'compose_ngram', 'compose_ngram_parallel',
+    'connect', 'delete_arcs', 'transduce', 'accepted_strings', 'randgen'
+]
+
+
+def cases(sigma_size, context_length, length, max_len):
+    """
+    Benchmark cases for one parameter setting: (op, function) pairs,
+    with machines used as inputs built outside of the timed functions.
+    """
+    sigma = [f'x{i}' for i in range(sigma_size)]
+    alphabet = config.Alphabet(sigma)
+    L = ngram_acceptor('left', context_length, alphabet=alphabet)
+    R = ngram_acceptor('right', context_length, alphabet=alphabet)
+    rng = random.Random(0)
+    x = ' '.join(rng.choice(sigma) for _ in range(length))
+    X = acceptor(x, alphabet=alphabet)
+    workers = max(2, os.cpu_count() or 1)
+    # Composition with arcs on first symbol removed (dead states / arcs)
+    M = compose(L, R, alphabet=alphabet)
+    sym = M.input_index(sigma[0])
+    dead_arcs = [(q, t) for q in M.states(labels=False) for t in M.arcs(q)
+                 if t.ilabel == sym]
+
+    def delete_arcs():
+        M_ = M.copy()
+        M_.delete_arcs(dead_arcs)
+        return M_
+
+    return [
+        ('ngram_acceptor_left',
+         lambda: ngram_acceptor('left', context_length, alphabet=alphabet)),
+        ('ngram_acceptor_right',
+         lambda: ngram_acceptor('right', context_length, alphabet=alphabet)),
+        ('ngram_acceptor_both',
+         lambda: ngram_acceptor('both', context_length, alphabet=alphabet)),
+        ('trellis_acceptor',
+         lambda: trellis_acceptor(length, alphabet=alphabet)),
+        ('compose', lambda: compose(X, M, alphabet=alphabet)),
+        # Serial vs. process-parallel composition of the same machines
+        # (the pool is only used with more than one CPU, see parallel)
+        ('compose_ngram', lambda: compose(L, R, alphabet=alphabet)),
+        ('compose_ngram_parallel',
+         lambda: compose(L, R, workers=workers, alphabet=alphabet)),
+        ('connect', lambda: M.connect()),
+        ('delete_arcs', delete_arcs),
+        ('transduce', lambda: list(L.transduce(x, alphabet=alphabet))),
+        ('accepted_strings',
+         lambda: L.accepted_strings(side='input', max_len=max_len)),
+        ('randgen',
+         lambda: list(L.randgen(npath=length, seed=1, max_length=max_len + 2)))
+    ]
+
+
+def run(func, repeat):
+    """
+    Best and mean time over repeats, peak traced Python-heap allocation
+    (KiB; excludes OpenFst allocations).
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        val = func()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), sum(times) / len(times), peak // 1024, val
+
+
+def size(val):
+    """ Number of states and arcs of machine (None otherwise). """
+    if isinstance(val, Wfst):
+        return val.num_states(), val.num_arcs()
+    return None, None
+
+
+def run_case(op, sigma_size, context_length, length, max_len, repeat):
+    """
+    Run one case in this process (see --case) and return its results:
+    times, peak Python-heap allocation and peak resident set size (KiB
+    on Linux) after building the input machines and after running.
+    """
+    for (op_, func) in cases(sigma_size, context_length, length, max_len):
+        if op_ == op:
+            break
+    else:
+        raise ValueError(f'Unknown operation {op}')
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best, mean, peak, val = run(func, repeat)
+    states, arcs = size(val)
+    return {
+        'time': best,
+        'mean_time': mean,
+        'py_heap_peak_kb': peak,
+        'base_maxrss_kb': base_rss,
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'states': states,
+        'arcs': arcs
+    }
+
+
+def run_subprocess(op, sigma_size, context_length, length, max_len, repeat):
+    """ Run one case in a fresh Python process (see run_case). """
+    cmd = [
+        sys.executable, __file__, '--case', op,
+        str(sigma_size),
+        str(context_length),
+        str(length),
+        str(max_len),
+        str(repeat)
+    ]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(path_old, results):
+    """ Print ratio of best times to those in earlier output file. """
+    old = {}
+    with open(path_old) as f:
+        for line in f:
+            r = json.loads(line)
+            old[_key(r)] = r['time']
+    print(f'{"op":<22} {"params":<16} {"old":>10} {"new":>10} {"ratio":>7}')
+    for r in results:
+        key = _key(r)
+        if key not in old:
+            continue
+        params = f'{r["sigma"]}/{r["context"]}/{r["length"]}'
+        ratio = r['time'] / old[key] if old[key] > 0 else float('inf')
+        print(f'{r["op"]:<22} {params:<16} {old[key]:>10.5f} '
+              f'{r["time"]:>10.5f} {ratio:>7.2f}')
+
+
+def _key(r):
+    return (r['op'], r['sigma'], r['context'], r['length'], r['max_len'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Wfst operations')
+    parser.add_argument('--sigma', type=int, nargs='+', default=[2, 4, 8],
+                        help='alphabet sizes')
+    parser.add_argument('--context', type=int, nargs='+', default=[1, 2],
+                        help='context lengths of ngram acceptors')
+    parser.add_argument('--length', type=int, nargs='+', default=[10, 100],
+                        help='input string / trellis length, randgen paths')
+    parser.add_argument('--max-len', type=int, default=3,
+                        help='max length for accepted_strings, randgen')
+    parser.add_argument('--ops', nargs='+', default=ops, choices=ops)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--label', default=None,
+                        help='label stored with results (e.g., engine)')
+    parser.add_argument('--output', default='bench_output.txt')
+    parser.add_argument('--compare', default=None,
+                        help='earlier output file to compare against')
+    parser.add_argument('--case', nargs=6, default=None,
+                        metavar=('OP', 'SIGMA', 'CONTEXT', 'LENGTH',
+                                 'MAX_LEN', 'REPEAT'),
+                        help='run one case and print its results '
+                        '(used internally for subprocesses)')
+    args = parser.parse_args()
+    if args.case is not None:
+        op, *params = args.case
+        print(json.dumps(run_case(op, *map(int, params))))
+        return
+
+    meta = {
+        'label': args.label,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pynini': pynini.__version__,
+        'cpus': os.cpu_count()
+    }
+    results = []
+    with open(args.output, 'w') as f:
+        for sigma_size in args.sigma:
+            for context_length in args.context:
+                for length in args.length:
+                    for op in ops:
+                        if op not in args.ops:
+                            continue
+                        r = {
+                            'op': op,
+                            'sigma': sigma_size,
+                            'context': context_length,
+                            'length': length,
+                            'max_len': args.max_len,
+                            'repeat': args.repeat,
+                            **run_subprocess(op, sigma_size, context_length,
+                                             length, args.max_len,
+                                             args.repeat),
+                            **meta
+                        }
+                        results.append(r)
+                        f.write(json.dumps(r) + '\n')
+                        f.flush()
+                        print(f'{op:<22} sigma={sigma_size} '
+                              f'context={context_length} length={length} '
+                              f'{r["time"]:.5f}s '
+                              f'{r["py_heap_peak_kb"]}KiB (Python heap) '
+                              f'{r["maxrss_kb"]}KiB (max RSS)')
+    if args.compare is not None:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+import pytest
+
+from wynini import config
+from wynini.simple_fst import SimpleArc, SimpleFst
+from wynini.strings import Interner
+from wynini.wfst import Wfst, acceptor, compose, ngram_acceptor
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b']})
+
+
+def test_alphabet_symbols():
+    A = config.Alphabet(['x', 'y'], ['#'],
+                        epsilon='<eps>',
+                        bos='<s>',
+                        eos='</s>')
+    assert A.syms == ['<eps>', '<s>', '</s>', '#', 'x', 'y']
+    assert A.sym2id == {sym: i for i, sym in enumerate(A.syms)}
+    assert [sym for (_, sym) in A.symtable] == A.syms
+    # Read-only symbol table
+    with pytest.raises(AttributeError):
+        A.symtable.add_symbol('z')
+    A2 = pickle.loads(pickle.dumps(A))
+    assert (A2.epsilon, A2.bos, A2.eos) == ('<eps>', '<s>', '</s>')
+    assert A2.syms == A.syms
+    # Globals are not changed
+    assert (config.epsilon, config.bos, config.eos) == ('ϵ', '⋊', '⋉')
+    assert config.alphabet.syms == ['ϵ', '⋊', '⋉', 'a', 'b']
+
+
+def test_alphabets_coexist():
+    A = config.Alphabet(['x', 'y'], epsilon='<eps>', bos='<s>', eos='</s>')
+    B = config.Alphabet(['u', 'v', 'w'])
+    L_A = ngram_acceptor('left', 1, alphabet=A)
+    L_B = ngram_acceptor('left', 1, alphabet=B)
+    X_A = acceptor('x y', alphabet=A)
+    X_B = acceptor('w u', alphabet=B)
+    M_A = compose(X_A, L_A, alphabet=A)
+    M_B = compose(X_B, L_B, alphabet=B)
+    assert M_A.accepted_strings(max_len=4) == {'<s> x y </s>'}
+    assert M_B.accepted_strings(max_len=4) == {'⋊ w u ⋉'}
+    assert M_A.input_symbols().find(0) == '<eps>'
+    assert M_B.input_symbols().find(0) == 'ϵ'
+    # Default symbol tables
+    assert [sym for (_, sym) in Wfst(alphabet=A).input_symbols()] == \
+        ['<eps>', '<s>', '</s>']
+    assert [sym for (_, sym) in Wfst().input_symbols()] == \
+        ['ϵ', '⋊', '⋉']
+
+
+def test_alphabet_epsilon_id():
+    A = config.Alphabet(['x', 'y'], epsilon='<eps>')
+    # Encoded symbols keep the name of epsilon in the original machine
+    M = acceptor('x y', alphabet=A)
+    _, encoder = M.encode(labels=True)
+    assert encoder.symbols().find(0) == '<eps>'
+    # Conversions to Wfst
+    fst = SimpleFst()
+    fst.set_start(0)
+    fst.add_arc(SimpleArc(0, 'x', '<eps>', 1))
+    fst.set_final(1)
+    wfst = fst.to_wfst(alphabet=A)
+    (t,) = wfst.arcs(0)
+    assert t.olabel == 0
+    assert wfst.output_symbols().find(0) == '<eps>'
+    assert Interner(alphabet=A).symtable.find(0) == '<eps>'
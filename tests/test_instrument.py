@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from wynini import config, instrument
+from wynini.random_wfst import random_wfst
+from wynini.wfst import compose
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b']})
+
+
+def test_callback_events():
+    M1 = random_wfst(6, weights='uniform', seed=0)
+    M2 = random_wfst(5, weights='uniform', seed=1)
+    events = []
+    callback = instrument.add_callback(events.append)
+    try:
+        assert instrument.enabled()
+        M = compose(M1, M2)
+        D = M.determinize()
+    finally:
+        instrument.remove_callback(callback)
+    assert not instrument.enabled()
+    ops = [(event['op'], event['depth']) for event in events]
+    # Nested events are reported when they finish, before the outer one
+    assert ops[-1] == ('determinize', 0)
+    assert ('compose', 0) in ops
+    assert ('connect', 1) in ops
+    (event,) = [event for event in events if event['op'] == 'compose']
+    assert event['states_in'] == M1.num_states() + M2.num_states()
+    assert event['arcs_in'] == M1.num_arcs() + M2.num_arcs()
+    assert event['states_out'] == M.num_states()
+    assert event['arcs_out'] == M.num_arcs()
+    assert event['time'] >= 0.0
+    assert len(event['frontier']) != 0
+    assert all(size > 0 for size in event['frontier'])
+    event = events[-1]
+    assert event['states_in'] == M.num_states()
+    assert event['states_out'] == D.num_states()
+    assert event['arcs_out'] == D.num_arcs()
+    # No events once removed
+    compose(M1, M2)
+    assert events[-1] is event
+
+
+def test_collector():
+    M1 = random_wfst(6, seed=0)
+    M2 = random_wfst(5, seed=1)
+    with instrument.Collector() as stats:
+        for _ in range(3):
+            M = compose(M1, M2)
+        M.determinize()
+    assert not instrument.enabled()
+    summary = stats.summary()
+    assert summary['compose']['calls'] == 3
+    assert summary['determinize']['calls'] == 1
+    assert summary['compose']['max_states_out'] == M.num_states()
+    assert summary['compose']['max_arcs_out'] == M.num_arcs()
+    assert summary['compose']['max_frontier'] >= 1
+    assert summary['compose']['time'] >= summary['compose']['max_time']
+    stats.clear()
+    assert stats.events == []
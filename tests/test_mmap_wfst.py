@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from wynini import config
+from wynini.mmap_wfst import open_mmap, write_mmap
+from wynini.random_wfst import diff, random_wfst
+from wynini.wfst import Wfst, compose
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b']})
+
+
+def assert_same_machine(M1, M2):
+    assert M1.num_states() == M2.num_states()
+    assert M1.num_arcs() == M2.num_arcs()
+    assert list(M1.states()) == list(M2.states())
+    assert M1.start() == M2.start()
+    assert list(M1.finals()) == list(M2.finals())
+    for q in M1.states(labels=False):
+        assert M1.state_id(M1.state_label(q)) == M2.state_id(M2.state_label(q))
+        assert float(M1.final(q)) == pytest.approx(float(M2.final(q)))
+        arcs1 = [(t.ilabel, t.olabel, float(t.weight), t.nextstate)
+                 for t in M1.arcs(q)]
+        arcs2 = [(t.ilabel, t.olabel, float(t.weight), t.nextstate)
+                 for t in M2.arcs(q)]
+        assert arcs1 == pytest.approx(arcs2)
+
+
+@pytest.mark.parametrize('labels', [False, True])
+def test_write_open_round_trip(tmp_path, labels):
+    M = random_wfst(20, weights='uniform', acceptor=False, labels=labels,
+                    seed=0)
+    path = write_mmap(M, tmp_path / 'M.wfst')
+    M_mmap = open_mmap(path)
+    try:
+        assert M_mmap.is_frozen()
+        assert_same_machine(M, M_mmap)
+        assert diff(M, M_mmap.to_wfst()) == []
+        with pytest.raises(TypeError):
+            M_mmap.add_state()
+    finally:
+        M_mmap.close()
+
+
+def test_write_open_structured_labels(tmp_path):
+    # Tuple labels from compose, frozensets of (label, float) from
+    # determinize
+    M1 = random_wfst(5, weights='uniform', seed=1)
+    M2 = random_wfst(4, weights='uniform', seed=2)
+    M = compose(M1, M2).determinize()
+    assert any(isinstance(label, frozenset) for label in M.states())
+    path = M.write_mmap(tmp_path / 'M.wfst')
+    M_mmap = Wfst.open_mmap(path)
+    try:
+        assert_same_machine(M, M_mmap)
+        assert set(M_mmap.states()) == set(M.states())
+    finally:
+        M_mmap.close()
+
+
+def test_write_unsupported_label(tmp_path):
+    M = Wfst(config.symtable)
+    M.add_state(('q', object()))
+    with pytest.raises(TypeError):
+        write_mmap(M, tmp_path / 'M.wfst')
+
+
+def test_open_invalid(tmp_path):
+    path = tmp_path / 'M.txt'
+    path.write_bytes(b'not a machine' * 4)
+    with pytest.raises(ValueError):
+        open_mmap(path)
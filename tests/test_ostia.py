@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import random
+
+import pytest
+
+from wynini import config
+from wynini.ostia import Ostia, ostia
+from wynini.prefix_tree import PrefixTree
+from wynini.strings import lcp
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b']})
+
+
+def sample(f, sigma='ab', max_len=5):
+    return [(' '.join(x), ' '.join(f(list(x))))
+            for n in range(1, max_len + 1)
+            for x in itertools.product(sigma, repeat=n)]
+
+
+def spread(x):
+    """ a -> c after b (left subsequential). """
+    return ['c' if (a == 'a' and i > 0 and x[i - 1] == 'b') else a
+            for i, a in enumerate(x)]
+
+
+def devoice(x):
+    """ Word-final b -> p. """
+    return x[:-1] + ['p'] if x[-1] == 'b' else x
+
+
+def apply(L, x):
+    """ Output of learner state machine for input x. """
+    q = 0
+    y = ()
+    for a in x.split():
+        z, r = L.arcs[q][a]
+        y += z
+        q = L.find(r)
+    return ' '.join(y + L.sigma[q])
+
+
+def onward_outputs(T):
+    """ Outputs of onward tree, recursively from the definition. """
+    children = T.children()
+    output = list(T.output)
+
+    def push(q):
+        # Output of q extended by the common prefix taken from below
+        for r in children[q]:
+            output[r] = output[r] + push(r)
+        if q == 0 or len(children[q]) == 0:
+            return ()
+        f = lcp([output[r] for r in children[q]])
+        for r in children[q]:
+            output[r] = output[r][len(f):]
+        return f
+
+    push(0)
+    return output
+
+
+def test_onward():
+    rng = random.Random(1)
+    for _ in range(20):
+        D = {}
+        for _ in range(30):
+            x = ' '.join(rng.choice('ab') for _ in range(rng.randint(1, 5)))
+            D[x] = ' '.join(rng.choice('xy') for _ in range(rng.randint(0, 4)))
+        T = PrefixTree(D.items())
+        expected = onward_outputs(T)
+        assert T.onward().output == expected
+    # Long chain: whole output moves to the arc leaving the root
+    T = PrefixTree([('a ' * 500, 'x y ' * 200)]).onward()
+    assert T.output[1] == ('x', 'y') * 200
+    assert all(len(y) == 0 for y in T.output[2:])
+
+
+def test_ostia_learns_subsequential():
+    for f in [spread, devoice]:
+        D = sample(f)
+        L = Ostia(PrefixTree(D).onward()).learn()
+        assert len(L.red) == 2
+        for (x, y) in D:
+            assert apply(L, x) == y
+
+
+def test_ostia_wfst():
+    D = sample(spread)
+    M = ostia(D)
+    assert M.num_states() == 3  # Two red states and final state
+    for (x, y) in D[:20]:
+        outputs = set(M.transduce(x + ' ' + config.eos, add_delim=False))
+        assert outputs == {y}
+
+
+def test_ostia_failed_merge_is_undone():
+    rng = random.Random(0)
+    D = {}
+    for _ in range(200):
+        x = ' '.join(rng.choice('ab') for _ in range(rng.randint(1, 6)))
+        D[x] = ' '.join(rng.choice('xy') for _ in range(rng.randint(0, 2)))
+    L = Ostia(PrefixTree(D.items()).onward())
+    for _ in range(20):
+        q = L._pop_blue()
+        if q is None:
+            break
+        for p in L.red:
+            state = ([L.find(r) for r in range(len(L.uf))],
+                     [dict(arcs) if arcs else arcs
+                      for arcs in L.arcs], list(L.sigma))
+            if L.merge(p, q):
+                break
+            assert [L.find(r) for r in range(len(L.uf))] == state[0]
+            assert [dict(arcs) if arcs else arcs
+                    for arcs in L.arcs] == state[1]
+            assert L.sigma == state[2]
+        else:
+            L._promote(q)
+    # Learned machine still reproduces the sample
+    L.learn()
+    for (x, y) in D.items():
+        assert apply(L, x) == y
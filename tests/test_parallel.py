@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from wynini import config, parallel
+from wynini.random_wfst import check, diff, random_wfst
+from wynini.wfst import Wfst, acceptor, compose
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b', 'c']})
+
+
+@pytest.fixture(params=[False, True])
+def use_pool(request, monkeypatch):
+    """ Expand in process, or in a pool even on a single CPU. """
+    if request.param:
+        monkeypatch.setattr(parallel, '_num_cpus', lambda: 2)
+        monkeypatch.setattr(parallel, 'min_parallel_frontier', 1)
+    return request.param
+
+
+def test_compose_parallel_random(use_pool):
+    failures = check(lambda M1, M2: compose(M1, M2, workers=2),
+                     trials=20,
+                     verbose=False,
+                     num_states=12,
+                     acceptor=False,
+                     epsilon_prob=0.2,
+                     cycle_density=0.3,
+                     weights='uniform')
+    assert failures == []
+
+
+def test_compose_parallel_tiers(use_pool):
+    A = Wfst(config.symtable, tier={'a'})
+    A.add_state('0')
+    A.add_state('1')
+    A.set_start('0')
+    A.set_final('0')
+    A.set_final('1')
+    A.add_arc('0', 'a', 'a', None, '1')
+    A.add_arc('1', 'a', 'b', None, '0')
+    B = Wfst(config.symtable, tier={'b', 'c'})
+    B.add_state('s')
+    B.set_start('s')
+    B.set_final('s')
+    B.add_arc('s', 'b', 'c', None, 's')
+    B.add_arc('s', 'c', 'c', None, 's')
+    X = acceptor('a b a c a')
+    for (M1, M2) in [(X, A), (A, B), (B, A)]:
+        M = compose(M1, M2)
+        M_par = compose(M1, M2, workers=2)
+        assert diff(M, M_par) == []
+        assert M_par.tier == M.tier
+
+
+def test_compose_parallel_empty(use_pool):
+    M1 = random_wfst(10, final_prob=0.0, seed=0)
+    M2 = Wfst(config.symtable)
+    M2.add_state('x')
+    M2.set_start('x')
+    assert compose(M1, M2, workers=2).num_states() == 0
+    # Operands without states or without a start state
+    E = Wfst(config.symtable)
+    F = Wfst(config.symtable)
+    F.add_state('x')
+    for (M1, M2) in [(E, M2), (M2, E), (E, E), (F, M1), (M1, F)]:
+        M = compose(M1, M2)
+        M_par = compose(M1, M2, workers=2)
+        assert M.num_states() == M_par.num_states() == 0
+        assert diff(M, M_par) == []
+        assert compose(M1, M2, beam=1.0).num_states() == 0
+        assert parallel.compose_parallel(M1, M2).num_states() == 0
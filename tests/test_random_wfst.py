@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import pynini
+import pytest
+
+from wynini import config
+from wynini.random_wfst import random_wfst
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b']})
+
+
+@pytest.mark.parametrize('num_states', [1, 2, 5, 30])
+def test_random_wfst_acyclic(num_states):
+    for seed in range(50):
+        M = random_wfst(num_states,
+                        arcs_per_state=3,
+                        cycle_density=0.0,
+                        seed=seed)
+        assert M.fst.properties(pynini.ACYCLIC, True) == pynini.ACYCLIC
+        assert M.num_states() == num_states
+
+
+def test_random_wfst_connected():
+    for seed in range(50):
+        M = random_wfst(10, arcs_per_state=2, final_prob=0.0, seed=seed)
+        qf = M.num_states() - 1
+        for q in range(qf):
+            assert any(t.nextstate == q + 1 for t in M.arcs(q))
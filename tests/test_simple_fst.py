@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import pytest
+
+from wynini import config, simple_fst
+from wynini.random_wfst import random_wfst
+from wynini.simple_fst import SimpleArc, SimpleFst
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b', 'c']})
+
+
+@pytest.fixture(params=[False, True])
+def bulk(request, monkeypatch):
+    """ Convert arc by arc, or in bulk even for small machines. """
+    if request.param:
+        monkeypatch.setattr(simple_fst, '_bulk_min_arcs', 0)
+    return request.param
+
+
+def assert_index(fst):
+    """ Index holds exactly the arcs of T, by (src, ilabel). """
+    index = {}
+    for T_q in fst.T.values():
+        for t in T_q:
+            index.setdefault((t.src, t.ilabel), []).append(t)
+    assert set(index) == set(fst.index)
+    for key, arcs in index.items():
+        assert sorted(arcs) == sorted(fst.index[key])
+
+
+def test_index():
+    fst = SimpleFst()
+    fst.set_start(0)
+    fst.add_arc(SimpleArc(0, 'a', 'x', 1))
+    fst.add_arc(SimpleArc(0, 'a', 'y', 2))
+    fst.add_arc(SimpleArc(0, 'b', 'x', 1))
+    fst.add_arc(SimpleArc(0, 'a', 'x', 1))  # Duplicate
+    fst.add_arc(SimpleArc(1, 'a', 'x', 2))
+    fst.set_final(2)
+    assert_index(fst)
+    assert sorted(fst.arcs(0, 'a')) == \
+        [SimpleArc(0, 'a', 'x', 1), SimpleArc(0, 'a', 'y', 2)]
+    assert list(fst.arcs(0, 'c')) == []
+    assert len(fst.arcs(0)) == 3
+    # Arc lists, arcs given to the constructor
+    fst2 = SimpleFst(fst.Q, fst.q0, fst.F,
+                     {q: sorted(T_q) for q, T_q in fst.T.items()})
+    fst2.add_arc(SimpleArc(2, 'c', 'c', 0))
+    assert_index(fst2)
+    # Derived machines
+    fst3 = fst2.copy()
+    fst3.add_arc(SimpleArc(1, 'b', 'b', 0))
+    assert_index(fst3)
+    assert_index(fst2)
+    assert list(fst2.arcs(1, 'b')) == []
+    # Arcs of copies are not shared
+    (t,) = fst3.arcs(1, 'a')
+    t.olabel = 'z'  # Arc lists, so need not rehash
+    assert fst3.T[1] == [SimpleArc(1, 'a', 'z', 2), SimpleArc(1, 'b', 'b', 0)]
+    assert fst2.T[1] == [SimpleArc(1, 'a', 'x', 2)]
+    assert list(fst2.arcs(1, 'a')) == [SimpleArc(1, 'a', 'x', 2)]
+    fst4 = fst3.delete_states([2])
+    assert_index(fst4)
+    assert sorted(fst4.arcs(0)) == \
+        [SimpleArc(0, 'a', 'x', 1), SimpleArc(0, 'b', 'x', 1)]
+
+
+def test_wfst_round_trip(bulk):
+    for seed in range(5):
+        M = random_wfst(30, acceptor=(seed % 2 == 0), labels=True,
+                        seed=seed)
+        fst = SimpleFst.from_wfst(M)
+        assert fst.Q == set(M.states())
+        assert fst.q0 == M.start()
+        assert fst.F == set(M.finals())
+        # Duplicate arcs of M are merged
+        arcs = {(M.state_label(q), M.input_label(t.ilabel),
+                 M.output_label(t.olabel), M.state_label(t.nextstate))
+                for q in M.states(labels=False) for t in M.arcs(q)}
+        assert {(t.src, t.ilabel, t.olabel, t.dest)
+                for T_q in fst.T.values() for t in T_q} == arcs
+        assert_index(fst)
+        M2 = fst.to_wfst()
+        assert M2.num_arcs() == len(arcs)
+        assert {(M2.state_label(q), M2.input_label(t.ilabel),
+                 M2.output_label(t.olabel), M2.state_label(t.nextstate))
+                for q in M2.states(labels=False)
+                for t in M2.arcs(q)} == arcs
+        assert set(M2.finals()) == set(M.finals())
+        assert M2.start() == M.start()
+        fst2 = SimpleFst.from_wfst(M2)
+        assert (fst2.Q, fst2.q0, fst2.F, fst2.T) == \
+            (fst.Q, fst.q0, fst.F, fst.T)
+
+
+def test_wfst_without_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    fst = SimpleFst()
+    fst.set_start('q0')
+    fst.add_arc(SimpleArc('q0', 'a', 'b', 'q1'))
+    fst.add_arc(SimpleArc('q1', 'c', 'c', 'q1'))
+    fst.set_final('q1')
+    wfst = fst.to_wfst()
+    assert set(wfst.states()) == {'q0', 'q1'}
+    assert wfst.num_arcs() == 2
+    fst2 = SimpleFst.from_wfst(wfst)
+    assert (fst2.Q, fst2.q0, fst2.F, fst2.T) == \
+        (fst.Q, fst.q0, fst.F, fst.T)
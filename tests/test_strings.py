@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from wynini.strings import Interner, lcp, lcs
+
+
+@pytest.mark.parametrize('size', [3, 40])
+def test_lcp_lcs(size):
+    F = [(1, 2, 3, 4, 5)] + [(1, 2, 7, 4, 5)] * (size - 1)
+    assert lcp(F) == (1, 2)
+    assert lcs(F) == (4, 5)
+    F_arr = [np.array(x) for x in F]
+    for u in (lcp(F_arr), lcs(F_arr)):
+        assert all(type(sym) is int for sym in u)
+    assert lcp(F_arr) == (1, 2)
+    assert lcs(F_arr) == (4, 5)
+
+
+@pytest.mark.parametrize('size', [3, 40])
+def test_lcp_lcs_symbols(size):
+    F = [('a', 'b', 'c')] * (size - 1) + [('a', 'c', 'c')]
+    assert lcp(F) == ('a', )
+    assert lcs(F) == ('c', )
+    assert lcp(F + [()]) == ()
+
+
+def test_interner():
+    interner = Interner()
+    x = interner.intern('a b a')
+    assert x[0] == x[2] != x[1]
+    assert interner.string(x) == 'a b a'
+
+
+def test_strings_without_numpy_import():
+    code = ('import sys; from wynini.strings import lcp; '
+            'assert lcp([(1, 2), (1, 3)]) == (1,); '
+            'assert "numpy" not in sys.modules')
+    subprocess.run([sys.executable, '-c', code],
+                   cwd=Path(__file__).resolve().parent.parent,
+                   check=True)
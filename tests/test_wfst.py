@@ -0,0 +1,654 @@
+# -*- coding: utf-8 -*-
+
+import math
+import pickle
+import random
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import pynini
+import pytest
+from pynini import Weight
+
+from wynini import config
+from wynini.random_wfst import diff, random_wfst
+from wynini.wfst import Wfst, acceptor, compose, ngram_acceptor
+
+
+@pytest.fixture(autouse=True)
+def alphabet():
+    config.init({'sigma': ['a', 'b']})
+
+
+def machine(arcs, finals, start='q0', arc_type='standard'):
+    """ Machine from (src, isym, osym, weight, dest) arcs and finals. """
+    M = Wfst(config.symtable, arc_type=arc_type)
+    weight_type = M.weight_type()
+    for (src, _, _, _, dest) in arcs:
+        M.add_state(src)
+        M.add_state(dest)
+    for q in finals:
+        M.add_state(q)
+    M.set_start(start)
+    for (src, isym, osym, w, dest) in arcs:
+        M.add_arc(src, isym, osym, Weight(weight_type, w), dest)
+    for q, w in finals.items():
+        M.set_final(q, Weight(weight_type, w))
+    return M
+
+
+def path_weights(M, max_len=4):
+    """ Weights of accepted (input, output) strings up to max_len. """
+    fst = M.fst
+    vals = {}
+    agenda = [(fst.start(), (), (), 0.0)]
+    for _ in range(max_len + 1):
+        agenda_new = []
+        for (q, x, y, w) in agenda:
+            final = float(fst.final(q))
+            if final != float('inf'):
+                vals[(x, y)] = min(vals.get((x, y), float('inf')), w + final)
+            for t in fst.arcs(q):
+                agenda_new.append(
+                    (t.nextstate, x + (M.input_label(t.ilabel),),
+                     y + (M.output_label(t.olabel),), w + float(t.weight)))
+        agenda = agenda_new
+    return vals
+
+
+def assert_same_weights(M1, M2, max_len=4):
+    vals1 = path_weights(M1, max_len)
+    vals2 = path_weights(M2, max_len)
+    assert set(vals1) == set(vals2)
+    for key in vals1:
+        assert vals1[key] == pytest.approx(vals2[key], abs=1e-4)
+
+
+# State labels
+
+
+def test_state_label_invalid_id():
+    M = Wfst(config.symtable)
+    with pytest.raises(KeyError):
+        M.start()  # No start state (NO_STATE_ID)
+    M.add_state('q0')
+    with pytest.raises(KeyError):
+        M.state_label(-1)
+    with pytest.raises(KeyError):
+        M.state_label(1)
+    assert M.state_label(0) == 'q0'
+
+
+def test_no_labels():
+    M = Wfst(config.symtable, labels=False)
+    assert [M.add_state() for _ in range(3)] == [0, 1, 2]
+    assert M.add_state('1') == 1  # Existing default label
+    assert M.add_state('3') == 3  # Next default label
+    assert M._state2label is None
+    assert list(M.states()) == ['0', '1', '2', '3']
+    assert M.state_label(2) == '2'
+    assert M.state_id('2') == 2
+    for label in ['4', '02', 'q0', 2]:
+        with pytest.raises(KeyError):
+            M.state_id(label)
+    with pytest.raises(KeyError):
+        M.state_label(4)
+    with pytest.raises(KeyError):
+        M.state_label(-1)
+    # Copies do not store labels; other labels are materialized
+    M2 = M.copy()
+    assert M2._state2label is None
+    assert M2.add_state('q4') == 4
+    assert list(M2.states()) == ['0', '1', '2', '3', 'q4']
+    assert M2.state_id('q4') == 4
+    assert M._state2label is None
+    assert M.num_states() == 4
+
+
+def test_from_fst_virtual_labels():
+    fst = pynini.accep('a b', token_type=config.symtable)
+    fst.set_input_symbols(config.symtable)
+    fst.set_output_symbols(config.symtable)
+    M = Wfst.from_fst(fst)
+    assert M.fst is fst
+    assert M._state2label is None
+    assert list(M.states()) == ['0', '1', '2']
+    assert M.start() == '0'
+    assert list(M.finals()) == ['2']
+    assert M.state_id('1') == 1
+    # Machine from transduce is wrapped in the same way
+    T = M.transduce('a b', add_delim=False, output_strings=False)
+    assert T._state2label is None
+    assert set(T.states()) == {str(q) for q in range(T.num_states())}
+    # Copy, then add a state with another label
+    M2 = M.copy()
+    assert M2.add_state('2') == 2
+    assert M2.add_state(('x', 1)) == 3
+    assert M2.state_label(3) == ('x', 1)
+    assert M2.state_id('1') == 1
+    assert M.num_states() == 3
+    assert M._state2label is None
+
+
+# Minimization
+
+
+def test_minimize_start_with_incoming_arcs():
+    # Weighted minimization pushes weights; the start state has a self-loop
+    M = machine([('s', 'a', 'a', 1.0, 's'), ('s', 'b', 'b', 1.0, 't')],
+                {'t': 2.0},
+                start='s')
+    M_min = M.minimize()
+    assert M_min.num_states() == 2
+    assert set(M_min.states()) == {frozenset({'s'}), frozenset({'t'})}
+    assert_same_weights(M, M_min)
+
+
+def test_minimize_merges_pushed_weights():
+    M = machine([('p', 'a', 'a', 1.0, 'q'), ('p', 'b', 'b', 3.0, 'r'),
+                 ('q', 'a', 'a', 2.0, 's'), ('r', 'a', 'a', 0.0, 't')],
+                {'s': 0.0, 't': 2.0},
+                start='p')
+    M_min = M.minimize()
+    assert set(M_min.states()) == \
+        {frozenset({'p'}), frozenset({'q', 'r'}), frozenset({'s', 't'})}
+    assert_same_weights(M, M_min)
+
+
+def test_minimize_encoded_transducer():
+    M = machine([('s', 'a', 'b', 1.0, 's'), ('s', 'b', 'a', 1.0, 't'),
+                 ('t', 'a', 'a', 0.5, 'u')], {'t': 2.0, 'u': 1.0},
+                start='s')
+    M_enc, encoder = M.encode(labels=True)
+    M_min = M_enc.minimize(representative=True)
+    assert set(M_min.states()) <= set(M.states())
+    assert_same_weights(M, M_min.decode(encoder))
+
+
+@pytest.mark.parametrize('arc_type', ['standard', 'log'])
+def test_minimize_random(arc_type):
+    for seed in range(20):
+        R = random_wfst(8,
+                        weights=lambda rng, k: 1 + rng.random(k),
+                        cycle_density=0.3,
+                        acceptor=(seed % 2 == 0),
+                        arc_type=arc_type,
+                        seed=seed)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            D = R.determinize(max_states=100)
+        if D.truncated:
+            continue
+        M_min = D.minimize()
+        assert M_min.num_states() <= D.connect().num_states()
+        assert pynini.randequivalent(D.fst, M_min.fst, npath=20, seed=seed,
+                                     delta=1e-3)
+        absorbed = set().union(*M_min.states())
+        assert absorbed == set(D.connect().states())
+
+
+def reweighted_twin(D, seed):
+    """
+    Machine reaching two copies of D from a new start state on a and b, 
+    the second reweighted by random potentials (equivalent states with 
+    float weights summed in different orders).
+    """
+    rng = random.Random(seed)
+    weight_type = D.weight_type()
+    c = [rng.uniform(0.0, 5.0) for _ in D.states(labels=False)]
+    M = Wfst(config.symtable, arc_type=D.arc_type())
+    M.set_start(M.add_state('s'))
+    for k in (0, 1):
+        for q in D.states(labels=False):
+            M.add_state((k, q))
+        for q in D.states(labels=False):
+            for t in D.arcs(q):
+                w = float(t.weight) + k * (c[t.nextstate] - c[q])
+                M.add_arc((k, q), t.ilabel, t.olabel, Weight(weight_type, w),
+                          (k, t.nextstate))
+            final = float(D.final(q))
+            if final != math.inf:
+                M.set_final((k, q), Weight(weight_type, final - k * c[q]))
+    q0 = D.start(label=False)
+    M.add_arc('s', 'a', 'a', None, (0, q0))
+    M.add_arc('s', 'b', 'b', Weight(weight_type, c[q0]), (1, q0))
+    return M
+
+
+def test_minimize_float_weights():
+    for seed in range(20):
+        R = random_wfst(8, weights='exponential', cycle_density=0.3,
+                        seed=seed)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            D = R.determinize(max_states=200)
+        if D.truncated:
+            continue
+        D = D.minimize()
+        M = reweighted_twin(D, seed)
+        M_min = M.minimize()
+        fst_min = M.fst.copy()
+        fst_min.minimize()
+        assert M_min.num_states() == D.num_states() + 1
+        assert M_min.num_states() <= fst_min.num_states()
+
+
+def test_minimize_nondeterministic():
+    M = machine([('q0', 'a', 'a', 0.0, 'q1'), ('q0', 'a', 'a', 1.0, 'q2')],
+                {'q1': 0.0, 'q2': 0.0})
+    with pytest.raises(ValueError):
+        M.minimize()
+
+
+# Determinization
+
+
+def test_determinize_truncated():
+    R = random_wfst(8, weights='uniform', cycle_density=0.5, acceptor=False,
+                    seed=3)
+    with pytest.warns(RuntimeWarning):
+        D = R.determinize(max_states=3)
+    assert D.truncated
+    assert D.num_states() == 3
+    assert D.copy().truncated
+    assert pickle.loads(pickle.dumps(D)).truncated
+    assert not R.truncated
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        D = R.determinize(max_states=10000)
+    assert not D.truncated
+
+
+def test_determinize_subset_labels():
+    # Subsets of states with residual weights one are labeled by
+    # frozensets of labels, otherwise of (label, residual) pairs
+    M = machine([('q0', 'a', 'a', 1.0, 'q1'), ('q0', 'a', 'a', 1.0, 'q2'),
+                 ('q0', 'b', 'b', 1.0, 'q3'), ('q0', 'b', 'b', 3.0, 'q4'),
+                 ('q1', 'a', 'a', 0.0, 'q5'), ('q2', 'a', 'a', 0.0, 'q5')],
+                {'q3': 0.0, 'q4': 0.0, 'q5': 0.0})
+    D = M.determinize()
+    assert not D.truncated
+    assert set(D.states()) == {
+        frozenset({'q0'}),
+        frozenset({'q1', 'q2'}),
+        frozenset({('q3', 0.0), ('q4', 2.0)}),
+        frozenset({'q5'})
+    }
+    assert D.start() == frozenset({'q0'})
+    assert_same_weights(M, D)
+
+
+def test_determinize_float_weights():
+    # Both copies of D reached on a: subsets of the two copies have
+    # residuals summed in different orders
+    for seed in range(20):
+        R = random_wfst(8, weights='exponential', cycle_density=0.3,
+                        seed=seed)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            D = R.determinize(max_states=200)
+        if D.truncated:
+            continue
+        D = D.minimize()
+        M = reweighted_twin(D, seed)
+        s = M.state_id('s')
+        t = next(t for t in M.arcs(s) if M.input_label(t.ilabel) == 'b')
+        M.delete_arcs([(s, t)])
+        M.add_arc(s, 'a', 'a', t.weight, t.nextstate)
+        M_det = M.determinize(max_states=1000)
+        assert not M_det.truncated
+        assert M_det.connect().num_states() == D.num_states() + 1
+
+
+# Encoding
+
+
+def test_encode_weights_unique_symbols():
+    R = random_wfst(2000, weights='uniform', acceptor=False, seed=0)
+    R_enc, encoder = R.encode(labels=True, weights=True)
+    symbols = encoder.symbols()
+    num_codes = len(set(t.ilabel for q in R_enc.fst.states()
+                        for t in R_enc.arcs(q)))
+    assert symbols.num_symbols() >= num_codes + 1
+    for q in R_enc.fst.states():
+        for t in R_enc.arcs(q):
+            assert symbols.find(t.ilabel) != ''
+    R_enc.print()
+    assert_same_weights(R_enc.decode(encoder), R, 3)
+
+
+# Deleting states and pruning
+
+
+def test_delete_states_connect():
+    # Deleting q1 leaves q2 unreachable and q3 unable to reach a final state
+    M = machine([('q0', 'a', 'a', 0.0, 'q1'), ('q1', 'a', 'a', 0.0, 'q2'),
+                 ('q2', 'b', 'b', 0.0, 'q4'), ('q0', 'b', 'b', 0.0, 'q3'),
+                 ('q0', 'b', 'b', 1.0, 'q4')], {'q4': 0.0})
+    dead = {M.state_id('q1')}
+    M1 = M.delete_states(dead, connect=True)
+    assert set(M1.states()) == {'q0', 'q4'}
+    assert M1.num_arcs() == 1
+    M2 = M.delete_states(dead, connect=False)
+    assert set(M2.states()) == {'q0', 'q2', 'q3', 'q4'}
+    assert M.num_states() == 5
+
+
+def test_prune():
+    M = machine([('q0', 'a', 'a', 0.0, 'q1'), ('q0', 'b', 'b', 5.0, 'q2'),
+                 ('q1', 'a', 'a', 1.0, 'q3'), ('q2', 'a', 'a', 0.0, 'q3')],
+                {'q3': 0.0})
+    M1 = M.prune(weight_threshold=2.0)
+    assert set(M1.states()) == {'q0', 'q1', 'q3'}
+    assert path_weights(M1) == {(('a', 'a'), ('a', 'a')): 1.0}
+    assert set(M.prune(weight_threshold=10.0).states()) == set(M.states())
+    # Final weight outside of threshold on a state that is kept
+    M = machine([('q0', 'a', 'a', 1.0, 'q1')], {'q0': 5.0, 'q1': 0.0})
+    M1 = M.prune(weight_threshold=1.0)
+    assert set(M1.states()) == {'q0', 'q1'}
+    assert not M1.is_final('q0')
+    assert path_weights(M1) == path_weights(
+        Wfst.from_fst(pynini.prune(M.fst, weight=1.0)))
+
+
+# Composition
+
+
+@pytest.mark.parametrize('beam', [0.0, 0.5, 2.0])
+def test_compose_beam(beam):
+    for seed in range(10):
+        M1 = random_wfst(6, weights='exponential', cycle_density=0.3,
+                         final_prob=0.5, seed=seed)
+        M2 = random_wfst(5, weights='exponential', cycle_density=0.3,
+                         final_prob=0.5, seed=seed + 100)
+        B = compose(M1, M2, beam=beam)
+        P = compose(M1, M2).prune(beam)
+        assert set(B.states()) == set(P.states())
+        if P.num_states() == 0:
+            continue  # Empty intersection
+        assert set(B.finals()) == set(P.finals())
+        assert B.num_arcs() == P.num_arcs()
+        assert_same_weights(B, P)
+
+
+# Epsilon closure
+
+
+@pytest.mark.parametrize('arc_type,w', [('standard', -1.0), ('log', -1.0),
+                                        ('log', 0.0)])
+def test_epsilon_closure_divergent(arc_type, w):
+    M = machine([('q0', config.epsilon, config.epsilon, 0.5, 'q1'),
+                 ('q1', config.epsilon, config.epsilon, w, 'q1'),
+                 ('q1', 'a', 'a', 0.0, 'q2')], {'q2': 0.0},
+                arc_type=arc_type)
+    with pytest.raises(ValueError):
+        M.epsilon_closure('q0')
+    with pytest.raises(ValueError):
+        M.rmepsilon()
+
+
+def test_epsilon_closure_log_cycle():
+    # Convergent cycle: 0.5 + (-log(1 / (1 - exp(-1))))
+    M = machine([('q0', config.epsilon, config.epsilon, 0.5, 'q1'),
+                 ('q1', config.epsilon, config.epsilon, 1.0, 'q1')],
+                {'q1': 0.0},
+                arc_type='log')
+    closure = M.epsilon_closure('q0')
+    q1 = M.state_id('q1')
+    assert closure[q1] == pytest.approx(0.5 + math.log(1 - math.exp(-1.0)),
+                                        abs=1e-5)
+
+
+@pytest.mark.parametrize('arc_type', ['standard', 'log'])
+def test_rmepsilon(arc_type):
+    M = machine([('q0', config.epsilon, config.epsilon, 0.5, 'q1'),
+                 ('q0', 'a', 'b', 1.0, 'q2'),
+                 ('q1', config.epsilon, config.epsilon, 0.25, 'q3'),
+                 ('q1', 'b', 'b', 2.0, 'q2'),
+                 ('q2', config.epsilon, config.epsilon, 1.5, 'q3'),
+                 ('q3', 'a', 'a', 0.0, 'q4')],
+                {'q1': 1.0, 'q3': 0.5, 'q4': 0.0},
+                arc_type=arc_type)
+    M_rm = M.rmepsilon()
+    assert all(t.ilabel != 0 or t.olabel != 0
+               for q in M_rm.states(labels=False) for t in M_rm.arcs(q))
+    # Start state and states entered by non-epsilon arcs keep labels
+    assert set(M_rm.states()) == {'q0', 'q2', 'q4'}
+    assert M_rm.start() == 'q0'
+    assert pynini.randequivalent(M.fst, M_rm.fst, npath=20, seed=0,
+                                 delta=1e-3)
+
+
+@pytest.mark.parametrize('arc_type,w', [('standard', -1.0), ('log', 0.0)])
+def test_accepted_strings_epsilon_cycle(arc_type, w):
+    # Divergent epsilon weights do not affect accepted strings
+    M = machine([('q0', 'a', 'a', 0.0, 'q1'),
+                 ('q1', config.epsilon, 'c', 0.0, 'q2'),
+                 ('q2', config.epsilon, config.epsilon, w, 'q2'),
+                 ('q2', 'b', 'b', 0.0, 'q3'),
+                 ('q3', config.epsilon, config.epsilon, w, 'q4')],
+                {'q4': 0.0},
+                arc_type=arc_type)
+    assert M.accepted_strings(max_len=4) == {'a b'}
+    assert M.accepted_strings('output', max_len=4) == {'a c b'}
+    M.freeze()
+    assert M.accepted_strings(max_len=4) == {'a b'}
+
+
+# Transduction
+
+
+def tier_acceptors(**kwargs):
+    sigma = [f'x{i}' for i in range(12)]
+    alphabet = config.Alphabet(sigma, **kwargs)
+    tier = set(sigma[:2])
+    L = ngram_acceptor('left', 1, sigma_tier=tier, alphabet=alphabet)
+    L_tier = ngram_acceptor('left', 1, sigma_tier=tier, alphabet=alphabet,
+                            tier=True)
+    return sigma, alphabet, L, L_tier
+
+
+@pytest.mark.parametrize('kwargs', [{}, {
+    'epsilon': '<eps>',
+    'bos': '<s>',
+    'eos': '</s>'
+}])
+def test_transduce_tier(kwargs):
+    sigma, alphabet, L, L_tier = tier_acceptors(**kwargs)
+    assert (L.num_arcs(), L_tier.num_arcs()) == (40, 10)
+    rng = random.Random(0)
+    for _ in range(20):
+        x = ' '.join(rng.choice(sigma) for _ in range(rng.randint(1, 6)))
+        assert set(L_tier.transduce(x, alphabet=alphabet)) == \
+            set(L.transduce(x, alphabet=alphabet))
+    # Pass-through machine is built once, and dropped on mutation
+    P = L_tier._pass[1]
+    L_tier.transduce(sigma[5], alphabet=alphabet)
+    assert L_tier._pass[1] is P
+    # No epsilon self-loops
+    assert all(t.ilabel != 0 for q in P.states(labels=False)
+               for t in P.arcs(q))
+    L_tier.set_final(L_tier.start(), None)
+    assert L_tier._pass is None
+
+
+def test_transduce_unknown_symbol():
+    _, alphabet, L, L_tier = tier_acceptors()
+    S = L_tier.share()
+    try:
+        for M in (L, L_tier, S):
+            with pytest.raises(ValueError):
+                list(M.transduce('x0 y', alphabet=alphabet))
+        assert list(S.transduce('x0 x5', alphabet=alphabet)) == \
+            list(L.transduce('x0 x5', alphabet=alphabet))
+    finally:
+        S.unlink()
+
+
+def test_freeze():
+    sigma, alphabet, L, L_tier = tier_acceptors()
+    L_tier.freeze()
+    # Pass-through machine is built before concurrent reads
+    P = L_tier._pass[1]
+    with pytest.raises(TypeError):
+        L_tier.fst = L.fst
+    with pytest.raises(TypeError):
+        L_tier.set_final(L_tier.start(), None)
+    # Fst member is an immutable view
+    assert L_tier.fst.fst_type() == 'const'
+    assert not hasattr(L_tier.fst, 'add_arc')
+    # Copies are mutable and do not force the frozen machine to unshare
+    M = L_tier.copy()
+    M.set_final(M.start(), None)
+    assert not L_tier._shared_fst
+    assert L_tier._pass[1] is P
+    xs = [' '.join(sigma[i:i + 3]) for i in range(len(sigma) - 2)]
+    with ThreadPoolExecutor(4) as pool:
+        outputs = list(pool.map(
+            lambda x: set(L_tier.transduce(x, alphabet=alphabet)), xs * 4))
+    assert outputs == [set(L.transduce(x, alphabet=alphabet))
+                       for x in xs * 4]
+
+
+def test_freeze_held_handles():
+    # Handles taken before freezing cannot modify the frozen machine
+    M = machine([('q0', 'a', 'a', 1.0, 'q1')], {'q1': 0.0})
+    fst = M.fst
+    arcs = M.mutable_arcs('q0')
+    isymbols = M.mutable_input_symbols()
+    M.freeze()
+    q1 = M.state_id('q1')
+    fst.add_arc(q1, pynini.Arc(1, 1, 0.0, q1))
+    arcs.set_value(pynini.Arc(2, 2, 5.0, q1))
+    isymbols.add_symbol('z')
+    fst.set_final(q1, Weight.zero(fst.weight_type()))
+    for F in (M.fst, M.to_fst()):
+        assert F.num_arcs(q1) == 0
+        t = next(F.arcs(F.start()))
+        assert (M.input_label(t.ilabel), float(t.weight)) == ('a', 1.0)
+    assert M.num_arcs() == 1
+    assert [float(t.weight) for t in M.arcs('q0')] == [1.0]
+    assert M.is_final('q1')
+    assert M.input_symbols().find('z') == pynini.NO_SYMBOL
+    assert list(M.transduce('a', add_delim=False)) == ['a']
+
+
+# Copying
+
+
+def test_copy_fst_is_private():
+    M = machine([('q0', 'a', 'a', 1.0, 'q1'), ('q1', 'b', 'b', 0.0, 'q2')],
+                {'q2': 0.0})
+    M2 = M.copy()
+    M2.fst.delete_arcs(M2.state_id('q1'))
+    assert M.num_arcs() == 2
+    assert M2.num_arcs() == 1
+    M3 = M.copy()
+    M.fst.delete_arcs(M.state_id('q0'))
+    assert M3.num_arcs() == 2
+    assert M.num_arcs() == 1
+
+
+def test_copy_on_write():
+    M = machine([('q0', 'a', 'a', 1.0, 'q1')], {'q1': 0.0})
+    M2 = M.copy()
+    assert M2._fst is M._fst
+    M2.push_weights()
+    assert M2._fst is M._fst
+    M2.add_state('q2')
+    M2.add_arc('q1', 'b', 'b', None, 'q2')
+    assert M2._fst is not M._fst
+    assert M.num_states() == 2
+    assert M.num_arcs() == 1
+    assert M2.num_arcs() == 2
+
+
+def test_copy_held_fst():
+    # Reference to the Fst taken before copying
+    M = machine([('q0', 'a', 'a', 1.0, 'q1')], {'q1': 0.0})
+    fst = M.fst
+    M2 = M.copy()
+    fst.delete_arcs(M.state_id('q0'))
+    assert M.num_arcs() == 0
+    assert M2.num_arcs() == 1
+    M3 = M2.copy()
+    assert M3._fst is M2._fst  # Not handed out, so shared
+    # Wrapped Fst
+    M4 = Wfst.from_fst(fst)
+    M5 = M4.copy()
+    fst.add_arc(0, pynini.Arc(1, 1, 0.0, 1))
+    assert M4.num_arcs() == 1
+    assert M5.num_arcs() == 0
+    # Freezing also detaches
+    M4.freeze()
+    fst.delete_arcs(0)
+    assert M4.num_arcs() == 1
+    # Mutable arc iterator taken before copying
+    arcs = M2.mutable_arcs('q0')
+    M6 = M2.copy()
+    arcs.set_value(pynini.Arc(1, 1, 5.0, M2.state_id('q1')))
+    assert float(next(M2.arcs('q0')).weight) == 5.0
+    assert float(next(M6.arcs('q0')).weight) == 1.0
+    # Machines built here share their Fst with copies
+    X = acceptor('a b')
+    assert X.copy()._fst is X._fst
+
+
+# Pickling and arrays
+
+
+@pytest.mark.parametrize('kind', ['plain', 'frozen', 'no_labels'])
+def test_pickle_round_trip(kind):
+    M = random_wfst(30, weights='uniform', acceptor=False,
+                    labels=(kind != 'no_labels'), seed=0)
+    M.sigma = {0: 'a b'}
+    if kind == 'frozen':
+        M.freeze()
+    M2 = pickle.loads(pickle.dumps(M))
+    assert diff(M, M2) == []
+    assert list(M2.states()) == list(M.states())
+    assert M2.sigma == M.sigma
+    assert M2.is_frozen() == (kind == 'frozen')
+    assert (M2._state2label is None) == (kind == 'no_labels')
+    assert M2.input_symbols().num_symbols() == \
+        M.input_symbols().num_symbols()
+    if kind == 'frozen':
+        with pytest.raises(TypeError):
+            M2.add_state()
+    else:
+        M2.add_state('new')
+        assert M2.state_id('new') == M.num_states()
+        assert M.num_states() == 30
+
+
+def test_from_arrays_round_trip():
+    R = random_wfst(50, weights='uniform', acceptor=False, seed=0)
+    M = Wfst.from_arrays(**R.to_arrays(), input_symtable=config.symtable)
+    assert_same_weights(M, R, 3)
+    assert list(M.states()) == list(R.states())
+
+
+@pytest.mark.parametrize('arcs,final,start', [
+    (([0], [1], [1], [0.0], [5]), [0.0], 0),
+    (([0], [1], [1], [0.0], [-1]), [0.0], 0),
+    (([1], [1], [1], [0.0], [0]), [0.0], 0),
+    (([-1], [1], [1], [0.0], [0]), [0.0], 0),
+    (([0], [1], [1], [0.0], [0]), [0.0], 1),
+    (([0], [1], [1], [0.0], [0]), [0.0], -2),
+    (([0, 0], [1], [1], [0.0], [0]), [0.0], 0),
+    (([0], [1], [1, 1], [0.0], [0]), [0.0], 0),
+    (([0], [-1], [1], [0.0], [0]), [0.0], 0),
+    (([0], [1], [-3], [0.0], [0]), [0.0], 0),
+    (([0], [99], [1], [0.0], [0]), [0.0], 0),
+    (([0], [1], [99], [0.0], [0]), [0.0], 0),
+])
+def test_from_arrays_invalid(arcs, final, start):
+    with pytest.raises(ValueError):
+        Wfst.from_arrays(*arcs, final, start, input_symtable=config.symtable)
+
+
+def test_from_arrays_empty():
+    M = Wfst.from_arrays([], [], [], [], [], [], -1)
+    assert M.num_states() == 0
+    M = Wfst.from_arrays([], [], [], [], [], [0.0], 0)
+    assert M.num_states() == 1
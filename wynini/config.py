@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from pynini import SymbolTable
+from pynini import Fst, SymbolTable
 
 epsilon = 'ϵ'  # <eps>
 bos = '⋊'  # '>' | <s>
@@ -11,6 +11,8 @@ sigma = ['a', 'b']  # Ordinary symbols
 special_syms = []  # Special symbols
 syms = []  # All symbols in symtable
 symtable = None  # SymbolTable
+sym2id = {}  # Symbol -> id in symtable
+alphabet = None  # Alphabet for the globals above (set by init)
 
 verbosity = 0
 
@@ -19,7 +21,7 @@ def init(config):
     """ Set globals with dictionary or module """
     global epsilon, bos, eos
     global sigma, special_syms
-    global syms, symtable
+    global syms, symtable, sym2id, alphabet
     #if not isinstance(config, dict):
     #    print(config)
     #    config = vars(config)
@@ -33,13 +35,57 @@ def init(config):
         sigma = config['sigma']
     if 'special_syms' in config:
         special_syms = config['special_syms']
-    symtable = SymbolTable()
-    symtable.add_symbol(epsilon)
-    symtable.add_symbol(bos)
-    symtable.add_symbol(eos)
-    for sym in special_syms:
-        symtable.add_symbol(sym)
-    for sym in sigma:
-        symtable.add_symbol(sym)
-    syms = [sym for (sym_id, sym) in symtable]
-    #print(syms)
\ No newline at end of file
+    alphabet = Alphabet(sigma, special_syms, epsilon, bos, eos)
+    symtable = alphabet.symtable.copy()  # Mutable copy
+    syms = alphabet.syms
+    sym2id = alphabet.sym2id
+    #print(syms)
+
+
+class Alphabet():
+    """
+    Symbols (epsilon, bos, eos, special symbols, sigma) and read-only 
+    symbol table built once, as an alternative to the module globals set 
+    by init(). An alphabet can be passed to the machine constructors and 
+    compose() in wfst.py, so machines over different alphabets can be 
+    built in one process (and from several threads) without re-init.
+    """
+
+    def __init__(self,
+                 sigma,
+                 special_syms=(),
+                 epsilon='ϵ',
+                 bos='⋊',
+                 eos='⋉'):
+        self.epsilon = epsilon
+        self.bos = bos
+        self.eos = eos
+        self.sigma = list(sigma)
+        self.special_syms = list(special_syms)
+        symtable = SymbolTable()
+        symtable.add_symbol(epsilon)
+        symtable.add_symbol(bos)
+        symtable.add_symbol(eos)
+        for sym in self.special_syms:
+            symtable.add_symbol(sym)
+        for sym in self.sigma:
+            symtable.add_symbol(sym)
+        # Read-only view of symbol table (held by placeholder Fst)
+        fst = Fst()
+        fst.set_input_symbols(symtable)
+        self._fst = fst
+        self.symtable = fst.input_symbols()
+        self.syms = [sym for (sym_id, sym) in symtable]  # All symbols
+        self.sym2id = {sym: sym_id for (sym_id, sym) in symtable}
+
+    def __getstate__(self):
+        return {
+            'sigma': self.sigma,
+            'special_syms': self.special_syms,
+            'epsilon': self.epsilon,
+            'bos': self.bos,
+            'eos': self.eos
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import threading
+import time
+
+# Profiling and statistics hooks for the main operations (compose,
+# connect, accessible, delete_states, delete_arcs, determinize,
+# minimize, transduce, acceptor constructors). Each call of an
+# operation produces an event dict
+#   op: operation name
+#   time: wall time (seconds)
+#   depth: nesting level (e.g., connect within compose has depth 1)
+#   states_in, arcs_in: total size of machine arguments
+#   states_out, arcs_out: size of machine result (None otherwise)
+#   frontier: sizes of successive breadth-first frontiers (if any)
+# that is passed to each registered callback (see add_callback,
+# Collector). With no callbacks registered, operations only check an
+# empty list; sizes are computed only while callbacks are registered.
+
+_callbacks = []  # Registered callbacks
+_local = threading.local()  # Stack of open events in this thread
+
+
+def add_callback(callback):
+    """ Register function called with each event. """
+    _callbacks.append(callback)
+    return callback
+
+
+def remove_callback(callback):
+    """ Unregister function added by add_callback(). """
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+def enabled():
+    """ Check whether any callback is registered. """
+    return len(_callbacks) != 0
+
+
+def operation(name):
+    """ Decorator recording events for operation with given name. """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _callbacks:
+                return func(*args, **kwargs)
+            return _record(name, func, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def frontier(size):
+    """ Note size of breadth-first frontier in the current operation. """
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1]['frontier'].append(size)
+
+
+def _record(name, func, args, kwargs):
+    """ Call func and pass event for the call to callbacks. """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    machines = [x for x in args if _is_machine(x)]
+    event = {
+        'op': name,
+        'time': None,
+        'depth': len(stack),
+        'states_in': sum(x.num_states() for x in machines),
+        'arcs_in': sum(x.num_arcs() for x in machines),
+        'states_out': None,
+        'arcs_out': None,
+        'frontier': []
+    }
+    stack.append(event)
+    t0 = time.perf_counter()
+    try:
+        val = func(*args, **kwargs)
+    finally:
+        event['time'] = time.perf_counter() - t0
+        stack.pop()
+    if _is_machine(val):
+        event['states_out'] = val.num_states()
+        event['arcs_out'] = val.num_arcs()
+    for callback in list(_callbacks):
+        callback(event)
+    return val
+
+
+def _is_machine(x):
+    # Class attribute, so that the fst property is not evaluated
+    return hasattr(type(x), 'fst') and hasattr(x, 'num_states')
+
+
+class Collector():
+    """
+    Callback that stores events, usable as context manager:
+        with instrument.Collector() as stats:
+            M = wfst.compose(M1, M2)
+        stats.report()
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def __enter__(self):
+        add_callback(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_callback(self)
+        return False
+
+    def clear(self):
+        self.events = []
+
+    def summary(self):
+        """
+        Totals by operation: number of calls, total / max time,
+        max states and arcs out, max frontier size.
+        """
+        stats = {}
+        for event in self.events:
+            op = event['op']
+            if op not in stats:
+                stats[op] = {
+                    'calls': 0,
+                    'time': 0.0,
+                    'max_time': 0.0,
+                    'max_states_out': None,
+                    'max_arcs_out': None,
+                    'max_frontier': None
+                }
+            s = stats[op]
+            s['calls'] += 1
+            s['time'] += event['time']
+            s['max_time'] = max(s['max_time'], event['time'])
+            for (key, val) in [('max_states_out', event['states_out']),
+                               ('max_arcs_out', event['arcs_out']),
+                               ('max_frontier', max(event['frontier'],
+                                                    default=None))]:
+                if val is not None:
+                    s[key] = val if s[key] is None else max(s[key], val)
+        return stats
+
+    def report(self):
+        """ Print summary(), slowest operations first. """
+        stats = self.summary()
+        print(f'{"op":<20} {"calls":>6} {"time":>10} {"max_time":>10} '
+              f'{"states":>8} {"arcs":>8} {"frontier":>8}')
+        for op, s in sorted(stats.items(), key=lambda item: -item[1]['time']):
+            vals = [
+                '-' if s[key] is None else s[key]
+                for key in ('max_states_out', 'max_arcs_out', 'max_frontier')
+            ]
+            print(f'{op:<20} {s["calls"]:>6} {s["time"]:>10.4f} '
+                  f'{s["max_time"]:>10.4f} {vals[0]:>8} {vals[1]:>8} '
+                  f'{vals[2]:>8}')
@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from multiprocessing import shared_memory
+
+import pynini
+import pywrapfst
+from pynini import Arc, Weight
+from . import config, instrument
+from .wfst import Wfst
+
+# File layout: magic, header length (uint64), json header, then
+# 8-byte aligned arrays whose byte offsets (relative to the start of
+# the data section) and typecodes are listed in the header. State
+# labels are stored as json (see _dump_label), so opening a file never
+# executes code from it.
+MAGIC = b'WYNMMAP2'
+_ALIGN = 8
+
+
+def write_mmap(wfst, path):
+    """
+    Write machine to file in the layout read by MmapWfst /
+    Wfst.open_mmap(): arcs in CSR order (arc_index, ilabel, olabel,
+    weight, nextstate), final weights, and state labels as json.
+    State labels must be strings, numbers, booleans, None, or tuples /
+    frozensets of these (as created by compose, determinize, etc.).
+    """
+    with open(path, 'wb') as f:
+        f.write(pack_mmap(wfst))
+    return path
+
+
+def pack_mmap(wfst):
+    """ Bytes of machine in mmap layout (see write_mmap). """
+    fst = wfst._fst
+    n = fst.num_states()
+
+    arc_index = array('q', [0])
+    ilabels = array('i')
+    olabels = array('i')
+    weights = array('d')
+    nextstates = array('i')
+    finals = array('d')
+    for q in range(n):
+        for t in fst.arcs(q):
+            ilabels.append(t.ilabel)
+            olabels.append(t.olabel)
+            weights.append(float(t.weight))
+            nextstates.append(t.nextstate)
+        arc_index.append(len(ilabels))
+        finals.append(float(fst.final(q)))
+
+    # State labels (omitted if all are default str(q) labels)
+    labels = [wfst.state_label(q) for q in range(n)]
+    label_index = array('q', [0])
+    label_data = bytearray()
+    if any(label != str(q) for q, label in enumerate(labels)):
+        for label in labels:
+            label_data += _dump_label(label)
+            label_index.append(len(label_data))
+    else:
+        label_index = array('q')
+
+    isymbols = [[k, sym] for (k, sym) in fst.input_symbols()]
+    osymbols = [[k, sym] for (k, sym) in fst.output_symbols()]
+    if osymbols == isymbols:
+        osymbols = None
+
+    arrays = [('arc_index', arc_index), ('ilabel', ilabels),
+              ('olabel', olabels), ('weight', weights),
+              ('nextstate', nextstates), ('final', finals),
+              ('label_index', label_index),
+              ('label_data', array('B', label_data))]
+    layout = {}
+    data = bytearray()
+    for (name, arr) in arrays:
+        data += bytes(-len(data) % _ALIGN)
+        layout[name] = [arr.typecode, len(data), len(arr)]
+        data += arr.tobytes()
+
+    header = {
+        'arc_type': fst.arc_type(),
+        'weight_type': fst.weight_type(),
+        'start': fst.start(),
+        'num_states': n,
+        'num_arcs': len(ilabels),
+        'isymbols': isymbols,
+        'osymbols': osymbols,
+        'tier': None if wfst.tier is None else sorted(wfst.tier),
+        'truncated': wfst.truncated,
+        'arrays': layout
+    }
+    header = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % _ALIGN)
+    return MAGIC + struct.pack('<Q', len(header)) + header + bytes(data)
+
+
+def open_mmap(path):
+    """ Open machine written by write_mmap() as read-only MmapWfst. """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    wfst = MmapWfst(buf)
+    wfst._source = ('file', path)
+    return wfst
+
+
+def share_mmap(wfst):
+    """
+    Copy machine into a new shared memory block in mmap layout and
+    return read-only MmapWfst over it. The returned machine pickles as
+    the name of the block, so process-pool workers attach to it instead
+    of receiving a copy; the creating process should call unlink() when
+    the block is no longer needed.
+    """
+    data = pack_mmap(wfst)
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    wfst = MmapWfst(shm.buf)
+    wfst._shm = shm
+    wfst._source = ('shm', shm.name)
+    return wfst
+
+
+def attach_mmap(name):
+    """ Attach read-only to shared memory block created by share_mmap(). """
+    buf, shm = _attach(name)
+    wfst = MmapWfst(buf)
+    wfst._shm = shm
+    wfst._source = ('shm', name)
+    return wfst
+
+
+def _attach(name):
+    """
+    Buffer (and SharedMemory, if used) for shared memory block. On POSIX
+    the block is mapped directly rather than through SharedMemory, which
+    would register it with the resource tracker and unlink it when the
+    attaching process exits (Python < 3.13).
+    """
+    try:
+        import _posixshmem
+    except ImportError:
+        shm = shared_memory.SharedMemory(name=name)
+        return shm.buf, shm
+    fd = _posixshmem.shm_open('/' + name, os.O_RDONLY, mode=0o600)
+    try:
+        buf = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+    return buf, None
+
+
+class MmapWfst(Wfst):
+    """
+    Read-only Wfst backed by a buffer in mmap layout (see write_mmap),
+    typically a memory-mapped file shared by many processes through the
+    page cache. Arcs, final weights and state labels are decoded on
+    demand; state_id() builds its label index on first use. The wrapped
+    pynini Fst (fst member) is only materialized if accessed, e.g., by
+    operations inherited from Wfst. Mutators raise TypeError; use
+    to_wfst() for a mutable in-memory copy.
+    """
+
+    def __init__(self, buf):
+        view = memoryview(buf)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a wynini mmap file')
+        (header_len, ) = struct.unpack_from('<Q', view, len(MAGIC))
+        pos = len(MAGIC) + 8
+        header = json.loads(bytes(view[pos:(pos + header_len)]))
+        pos += header_len
+
+        self._buf = buf  # Keep mapping alive
+        self._shm = None  # Shared memory block, if any
+        self._source = None  # ('file', path) or ('shm', name), if any
+        self._views = [view]
+        self._header = header
+        self._arc_type = header['arc_type']
+        self._weight_type = header['weight_type']
+        self._start = header['start']
+        self._num_states = header['num_states']
+        self._num_arcs = header['num_arcs']
+        arrays = {}
+        for name, (typecode, offset, length) in header['arrays'].items():
+            start = pos + offset
+            size = length * array(typecode).itemsize
+            arrays[name] = view[start:(start + size)].cast(typecode)
+            self._views.append(arrays[name])
+        self._arc_index = arrays['arc_index']
+        self._ilabel = arrays['ilabel']
+        self._olabel = arrays['olabel']
+        self._weight = arrays['weight']
+        self._nextstate = arrays['nextstate']
+        self._final = arrays['final']
+        self._label_index = arrays['label_index']
+        self._label_data = arrays['label_data']
+
+        # Symbol tables (small, held per process)
+        isymbols = _symtable(header['isymbols'])
+        if header['osymbols'] is None:
+            osymbols = isymbols
+        else:
+            osymbols = _symtable(header['osymbols'])
+        self._isymbols = isymbols
+        self._osymbols = osymbols
+        self._label2state_ = None  # Built by state_id() on first use
+        self._fst_cache = None  # Built by _fst property on first use
+        self._const_fst = None  # Built by fst property on first use
+        self.sigma = {}
+        tier = header.get('tier', None)
+        self.tier = None if tier is None else frozenset(tier)
+        self.truncated = header.get('truncated', False)
+        self._closure = {}
+        self._frozen = True  # Always read-only
+        self._lock = threading.Lock()
+
+    @property
+    def fst(self):
+        """
+        Immutable ConstFst view of the machine, materialized on first 
+        access (see Wfst.freeze).
+        """
+        if self._const_fst is None:
+            self._const_fst = pywrapfst.convert(self._fst, 'const')
+        return self._const_fst
+
+    @property
+    def _fst(self):
+        if self._fst_cache is None:
+            self._fst_cache = self._materialize()
+        return self._fst_cache
+
+    def _materialize(self):
+        fst = pynini.Fst(self._arc_type)
+        fst.set_input_symbols(self._isymbols)
+        fst.set_output_symbols(self._osymbols)
+        fst.add_states(self._num_states)
+        if self._start >= 0:
+            fst.set_start(self._start)
+        weight_type = self._weight_type
+        for q in range(self._num_states):
+            fst.set_final(q, Weight(weight_type, self._final[q]))
+            for t in self.arcs(q):
+                fst.add_arc(q, t)
+        return fst
+
+    # Input/output labels.
+
+    def input_symbols(self):
+        """ Get input symbol table. """
+        return self._isymbols
+
+    def output_symbols(self):
+        """ Get output symbol table. """
+        return self._osymbols
+
+    def input_label(self, sym):
+        """ Get input label for symbol id. """
+        return self._isymbols.find(sym)
+
+    def input_index(self, sym):
+        """ Get input id for symbol label. """
+        return self._isymbols.find(sym)
+
+    def output_label(self, sym):
+        """ Get output label for symbol id. """
+        return self._osymbols.find(sym)
+
+    def output_index(self, sym):
+        """ Get output id for symbol label. """
+        return self._osymbols.find(sym)
+
+    # States.
+
+    def states(self, labels=True):
+        """ Iterator over state labels (or ids). """
+        if not labels:
+            return iter(range(self._num_states))
+        return map(self.state_label, range(self._num_states))
+
+    def num_states(self):
+        return self._num_states
+
+    def start(self, label=True):
+        """ Start state label (or id). """
+        if not label:
+            return self._start
+        return self.state_label(self._start)
+
+    def is_start(self, q):
+        """ Check start status by id or label. """
+        if not isinstance(q, int):
+            q = self.state_id(q)
+        return q == self._start
+
+    def is_final(self, q):
+        """ Check final status by id or label. """
+        if not isinstance(q, int):
+            q = self.state_id(q)
+        return self._final[q] != float('inf')
+
+    def final(self, q):
+        """ Final weight of state by id or label. """
+        if not isinstance(q, int):
+            q = self.state_id(q)
+        return Weight(self._weight_type, self._final[q])
+
+    def finals(self, labels=True):
+        """
+        Iterator over states with non-zero final weights.
+        """
+        inf = float('inf')
+        final = self._final
+        state_iter = filter(lambda q: final[q] != inf,
+                            range(self._num_states))
+        if labels:
+            state_iter = map(self.state_label, state_iter)
+        return state_iter
+
+    def state_label(self, q):
+        """ State label from id (decoded from buffer). """
+        if not 0 <= q < self._num_states:
+            raise KeyError(q)
+        label_index = self._label_index
+        if len(label_index) == 0:
+            return str(q)
+        data = self._label_data[label_index[q]:label_index[q + 1]]
+        return _load_label(data)
+
+    def state_id(self, q):
+        """ State id from label (index built on first call). """
+        if self._label2state_ is None:
+            self._label2state_ = {
+                self.state_label(q1): q1
+                for q1 in range(self._num_states)
+            }
+        return self._label2state_[q]
+
+    @property
+    def _state2label(self):
+        return [self.state_label(q) for q in range(self._num_states)]
+
+    @property
+    def _label2state(self):
+        return {v: k for k, v in enumerate(self._state2label)}
+
+    # Arcs.
+
+    def arcs(self, src):
+        """ Iterator over arcs from a state (decoded from buffer). """
+        if not isinstance(src, int):
+            src = self.state_id(src)
+        ilabel, olabel = self._ilabel, self._olabel
+        weight, nextstate = self._weight, self._nextstate
+        weight_type = self._weight_type
+        for i in range(self._arc_index[src], self._arc_index[src + 1]):
+            yield Arc(ilabel[i], olabel[i], Weight(weight_type, weight[i]),
+                      nextstate[i])
+
+    def num_arcs(self, src=None):
+        """ Number of arcs from state, or total count of arcs. """
+        if src is None:
+            return self._num_arcs
+        if not isinstance(src, int):
+            src = self.state_id(src)
+        return self._arc_index[src + 1] - self._arc_index[src]
+
+    def num_input_epsilons(self, src):
+        """ Number of arcs with input epsilon from state. """
+        if not isinstance(src, int):
+            src = self.state_id(src)
+        ilabel = self._ilabel
+        return sum(1 for i in range(self._arc_index[src],
+                                    self._arc_index[src + 1])
+                   if ilabel[i] == 0)
+
+    def num_output_epsilons(self, src):
+        """ Number of arcs with output epsilon from state. """
+        if not isinstance(src, int):
+            src = self.state_id(src)
+        olabel = self._olabel
+        return sum(1 for i in range(self._arc_index[src],
+                                    self._arc_index[src + 1])
+                   if olabel[i] == 0)
+
+    def arc_type(self):
+        """ Arc type (standard, log, log64). """
+        return self._arc_type
+
+    def weight_type(self):
+        """ Weight type (tropical, log, log64). """
+        return self._weight_type
+
+    # Algorithms.
+
+    @instrument.operation('transduce')
+    def transduce(self, x, add_delim=True, output_strings=True,
+                  alphabet=None):
+        """
+        Transduce space-separated sequence x with this machine by lazy
+        composition over the mapped arcs, returning iterator over output
+        strings (default) or resulting machine with states labeled
+        (position in x, state id). Delimiters are from alphabet
+        (config.Alphabet) if specified. Raises ValueError if x has
+        symbols not in the input symbol table.
+        """
+        if alphabet is None:
+            alphabet = config
+        isymbols = self._isymbols
+        osymbols = self._osymbols
+        if not isinstance(x, str):
+            x = ' '.join(x)
+        if add_delim:
+            x = alphabet.bos + ' ' + x + ' ' + alphabet.eos
+        x = x.split()
+        for sym in x:
+            if not isymbols.member(sym):
+                raise ValueError(f'Unknown input symbol {sym}')
+        x = [isymbols.find(sym) for sym in x]
+        n = len(x)
+        # Positions of off-tier symbols, which pass through (see Wfst)
+        if self.tier is None:
+            skip = [False] * n
+        else:
+            tier = {isymbols.find(sym) for sym in self.tier}
+            skip = [sym != 0 and sym not in tier for sym in x]
+
+        wfst = Wfst(isymbols, osymbols, self._arc_type)
+        inf = float('inf')
+        arc_index, final = self._arc_index, self._final
+        ilabel, olabel = self._ilabel, self._olabel
+        weight, nextstate = self._weight, self._nextstate
+        weight_type = self._weight_type
+
+        if self._start >= 0:
+            q0 = (0, self._start)
+            wfst.add_state(q0)
+            wfst.set_start(q0)
+            stack = [q0]
+        else:
+            stack = []
+        while len(stack) != 0:
+            src = stack.pop()
+            (i, q) = src
+            if i == n and final[q] != inf:
+                wfst.set_final(src, Weight(weight_type, final[q]))
+            if i < n and skip[i]:
+                dest = (i + 1, q)
+                if dest not in wfst._label2state:
+                    wfst.add_state(dest)
+                    stack.append(dest)
+                wfst.add_arc(src, x[i], x[i], None, dest)
+            for j in range(arc_index[q], arc_index[q + 1]):
+                if ilabel[j] == 0:
+                    dest = (i, nextstate[j])
+                elif i < n and ilabel[j] == x[i]:
+                    dest = (i + 1, nextstate[j])
+                else:
+                    continue
+                if dest not in wfst._label2state:
+                    wfst.add_state(dest)
+                    stack.append(dest)
+                wfst.add_arc(src, ilabel[j], olabel[j],
+                             Weight(weight_type, weight[j]), dest)
+        wfst = wfst.connect()
+
+        if output_strings:
+            fst_out = wfst._fst
+            strpath_iter = fst_out.paths(output_token_type=osymbols)
+            return strpath_iter.ostrings()
+        return wfst
+
+    # Copying/creating
+
+    def copy(self):
+        """ Mutable in-memory copy (see to_wfst). """
+        return self.to_wfst()
+
+    def to_wfst(self):
+        """ Materialize as mutable in-memory Wfst. """
+        wfst = Wfst(self._isymbols,
+                    self._osymbols,
+                    self._arc_type,
+                    tier=self.tier)
+        wfst._fst = self._fst.copy()
+        wfst._state2label = self._state2label
+        wfst._label2state = self._label2state
+        wfst.truncated = self.truncated
+        return wfst
+
+    # Pickling / releasing
+
+    def __getstate__(self):
+        """
+        Pickle as file path or shared memory name if available,
+        otherwise as the raw buffer.
+        """
+        if self._source is not None:
+            return {'source': self._source}
+        return {'data': bytes(self._buf)}
+
+    def __setstate__(self, state):
+        if 'data' in state:
+            self.__init__(state['data'])
+            return
+        (kind, name) = state['source']
+        shm = None
+        if kind == 'file':
+            with open(name, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf, shm = _attach(name)
+        self.__init__(buf)
+        self._shm = shm
+        self._source = (kind, name)
+
+    def close(self):
+        """ Release buffer views and close mapping. """
+        self._fst_cache = self._const_fst = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._shm is not None:
+            self._shm.close()
+        elif isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def __del__(self):
+        # Release views before the mapping itself is collected
+        try:
+            self.close()
+        except (AttributeError, BufferError):
+            pass
+
+    def unlink(self):
+        """ Close and destroy shared memory block (creator only). """
+        shm = self._shm
+        self.close()
+        if shm is not None:
+            shm.unlink()
+
+    # Mutators (read-only).
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('MmapWfst is read-only (see to_wfst)')
+
+    mutable_input_symbols = _read_only
+    mutable_output_symbols = _read_only
+    set_input_symbols = _read_only
+    set_output_symbols = _read_only
+    add_state = _read_only
+    set_start = _read_only
+    set_final = _read_only
+    add_arc = _read_only
+    mutable_arcs = _read_only
+    arcsort = _read_only
+    map_weights = _read_only
+    project = _read_only
+    delete_arcs = _read_only
+    push_weights = _read_only
+    push_labels = _read_only
+    invert = _read_only
+
+
+def _dump_label(label):
+    """
+    Json bytes of state label: tuples and frozensets become lists
+    tagged with "t" / "f" (lists are not hashable, so never labels).
+    """
+
+    def encode(x):
+        if x is None or isinstance(x, (str, bool, int, float)):
+            return x
+        if isinstance(x, tuple):
+            return ['t'] + [encode(y) for y in x]
+        if isinstance(x, frozenset):
+            items = [encode(y) for y in x]
+            items.sort(key=lambda y: json.dumps(y, ensure_ascii=False))
+            return ['f'] + items
+        raise TypeError(f'Cannot store state label of type {type(x)}')
+
+    return json.dumps(encode(label), ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _load_label(data):
+    """ State label from json bytes (see _dump_label). """
+
+    def decode(x):
+        if not isinstance(x, list):
+            return x
+        items = [decode(y) for y in x[1:]]
+        return tuple(items) if x[0] == 't' else frozenset(items)
+
+    return decode(json.loads(bytes(data)))
+
+
+def _symtable(items):
+    """ SymbolTable from list of [id, symbol] pairs. """
+    symtable = pynini.SymbolTable()
+    for (k, sym) in items:
+        symtable.add_symbol(sym, k)
+    return symtable
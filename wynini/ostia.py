@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+from . import config
+from .prefix_tree import PrefixTree
+from .simple_fst import _symtable
+from .strings import lcp
+from .wfst import Wfst
+
+# State-merging learner for subsequential functions, as in OSTIA
+# (Oncina, García & Vidal 1993; de la Higuera Algorithms 18.4-18.7).
+# Starting from the onward prefix tree of a sample, blue states (children
+# of red states) are visited in length-lexicographic order and merged
+# with the first compatible red state, or else promoted to red.
+# States of the tree are grouped into merged states with union-find;
+# each merge attempt records its changes in an undo log and is rolled
+# back if the fold fails, instead of copying the machine. Blue states
+# are kept in a heap keyed by rank and updated on promotion and merge.
+
+
+class Ostia():
+    """
+    OSTIA learner over an onward PrefixTree T. Merged states are
+    represented by tree states (union-find roots) with
+        arcs[q]: input symbol -> (output tokens, destination tree state)
+        sigma[q]: final output (tokens) or None if not final
+    where the final output of a tree state is the output of its eos arc.
+    """
+
+    def __init__(self, T, verbose=0):
+        self.T = T
+        self.eos = T.eos
+        self.verbose = verbose
+        n = T.num_states()
+        self.uf = list(range(n))  # Union-find parents
+        self.arcs = [None] * n
+        self.sigma = [None] * n
+        for r in range(1, n):
+            q = T.parent[r]
+            a = T.ilabel[r]
+            if a == self.eos:
+                self.sigma[q] = T.output[r]
+                continue
+            if self.arcs[q] is None:
+                self.arcs[q] = {}
+            self.arcs[q][a] = (T.output[r], r)
+        self.rank = self._rank()
+        self.red = []
+        self.is_red = set()
+        self._blue = []  # Heap of (rank, state), with stale entries
+        self._new_blue = []  # States reached by arcs added to red states
+        self.log = None
+        self._promote(0)
+
+    def _rank(self):
+        """ Length-lexicographic rank of tree states (breadth-first). """
+        T = self.T
+        children = T.children()
+        rank = [None] * T.num_states()
+        queue = [0]
+        for i, q in enumerate(queue):
+            rank[q] = i
+            kids = [r for r in children[q] if T.ilabel[r] != self.eos]
+            kids.sort(key=lambda r: str(T.ilabel[r]))
+            queue.extend(kids)
+        return rank
+
+    def find(self, q):
+        """
+        Representative of merged state containing tree state q, with
+        path compression (logged, so that it is undone with the merge
+        attempt in which it happens).
+        """
+        uf = self.uf
+        r = uf[q]
+        if uf[r] == r:
+            return r
+        while uf[r] != r:
+            r = uf[r]
+        log = self.log
+        while uf[q] != r:
+            if log is not None:
+                log.append(('uf', q, uf[q]))
+            uf[q], q = r, uf[q]
+        return r
+
+    # Logged updates
+
+    def _set_arc(self, q, a, val):
+        arcs = self.arcs[q]
+        if arcs is None:
+            arcs = self.arcs[q] = {}
+            if self.log is not None:
+                self.log.append(('arcs', q, None))
+        if self.log is not None:
+            self.log.append(('arc', (q, a), arcs.get(a)))
+        arcs[a] = val
+
+    def _set_sigma(self, q, val):
+        if self.log is not None:
+            self.log.append(('sigma', q, self.sigma[q]))
+        self.sigma[q] = val
+
+    def _union(self, q, p):
+        """ Merge root q into root p. """
+        if self.log is not None:
+            self.log.append(('uf', q, q))
+        self.uf[q] = p
+        if p in self.is_red and self.arcs[q] is not None:
+            # Arcs of q not already on p will be added to red state p
+            self._new_blue.extend(r for (_, r) in self.arcs[q].values())
+
+    def _undo(self):
+        """ Roll back all updates in the log. """
+        for (kind, key, old) in reversed(self.log):
+            if kind == 'arc':
+                (q, a) = key
+                if old is None:
+                    del self.arcs[q][a]
+                else:
+                    self.arcs[q][a] = old
+            elif kind == 'arcs':
+                self.arcs[key] = old
+            elif kind == 'sigma':
+                self.sigma[key] = old
+            else:
+                self.uf[key] = old
+        self.log = None
+        self._new_blue = []
+
+    # Merging
+
+    def _prepend(self, q, u):
+        """ Prepend output u to final output and arcs of state q. """
+        if self.sigma[q] is not None:
+            self._set_sigma(q, u + self.sigma[q])
+        if self.arcs[q] is not None:
+            for a, (y, r) in list(self.arcs[q].items()):
+                self._set_arc(q, a, (u + y, r))
+
+    def merge(self, p, q):
+        """
+        Try to merge blue state q into red state p: redirect the arc
+        into q to p and fold the subtree of q into p. Returns True on
+        success, otherwise rolls back changes and returns False.
+        """
+        T = self.T
+        src = self.find(T.parent[q])
+        a = T.ilabel[q]
+        y, _ = self.arcs[src][a]
+        if not self._compatible(p, q, src, a, y):
+            return False
+        self.log = []
+        self._set_arc(src, a, (y, p))
+        if self._fold(p, q):
+            self.log = None
+            for r in self._new_blue:
+                self._push_blue(r)
+            self._new_blue = []
+            return True
+        self._undo()
+        return False
+
+    def _compatible(self, p, q, src, a, y):
+        """
+        Quick check of the first step of folding q into red state p
+        (final outputs, pushback into red states), without logging.
+        """
+        if self.sigma[q] is not None and self.sigma[p] is not None \
+                and self.sigma[q] != self.sigma[p]:
+            return False
+        arcs1 = self.arcs[p]
+        arcs2 = self.arcs[q]
+        if arcs1 is None or arcs2 is None:
+            return True
+        for b, (y2, _) in arcs2.items():
+            if p == src and b == a:
+                y1, p1 = y, p  # Arc redirected by merge
+            else:
+                arc = arcs1.get(b)
+                if arc is None:
+                    continue
+                y1, r1 = arc
+                p1 = self.find(r1)
+            if len(y1) > len(y2) or y2[:len(y1)] != y1:
+                if p1 in self.is_red:
+                    return False
+        return True
+
+    def _fold(self, p, q):
+        """ Fold tree rooted at q into merged state p (iterative). """
+        stack = [(p, q)]
+        while stack:
+            p, q = stack.pop()
+            self._union(q, p)
+            # Final outputs
+            if self.sigma[q] is not None:
+                if self.sigma[p] is None:
+                    self._set_sigma(p, self.sigma[q])
+                elif self.sigma[p] != self.sigma[q]:
+                    return False
+            if self.arcs[q] is None:
+                continue
+            for a, (y2, r2) in self.arcs[q].items():
+                arc = None if self.arcs[p] is None else self.arcs[p].get(a)
+                if arc is None:
+                    self._set_arc(p, a, (y2, r2))
+                    continue
+                y1, r1 = arc
+                p1 = self.find(r1)
+                if y1 != y2:
+                    # Push back suffixes of outputs beyond their lcp
+                    u = lcp([y1, y2])
+                    k = len(u)
+                    if len(y1) != k:
+                        if p1 in self.is_red:
+                            return False
+                        self._prepend(p1, y1[k:])
+                        self._set_arc(p, a, (u, r1))
+                    if len(y2) != k:
+                        self._prepend(r2, y2[k:])
+                if p1 != r2:
+                    stack.append((p1, r2))
+        return True
+
+    def _push_blue(self, r):
+        q = self.find(r)
+        if q not in self.is_red:
+            heapq.heappush(self._blue, (self.rank[q], q))
+
+    def _pop_blue(self):
+        """ Blue state of lowest rank, or None if there are none. """
+        while self._blue:
+            _, q = heapq.heappop(self._blue)
+            if q not in self.is_red and self.uf[q] == q:
+                return q
+        return None
+
+    def _promote(self, q):
+        self.red.append(q)
+        self.is_red.add(q)
+        if self.arcs[q] is not None:
+            for (_, r) in self.arcs[q].values():
+                self._push_blue(r)
+
+    def blue(self):
+        """ Unmerged states reached from red states, by rank. """
+        blue = set(q for (_, q) in self._blue
+                   if q not in self.is_red and self.uf[q] == q)
+        return sorted(blue, key=lambda q: self.rank[q])
+
+    def learn(self):
+        """ Run OSTIA to completion, returning self. """
+        while True:
+            q = self._pop_blue()
+            if q is None:
+                break
+            for p in self.red:
+                if self.merge(p, q):
+                    if self.verbose > 0:
+                        print(f'merge {self.T.prefix(q)} into '
+                              f'{self.T.prefix(p)}')
+                    break
+            else:
+                if self.verbose > 0:
+                    print(f'promote {self.T.prefix(q)}')
+                self._promote(q)
+        return self
+
+    def to_wfst(self, alphabet=None):
+        """
+        Convert red states to Wfst, labeled by their input prefixes
+        ('λ' for the initial state), with final outputs on eos arcs to
+        a single final state labeled eos (cf. PrefixTree.to_wfst).
+        Epsilon is that of alphabet (config.Alphabet) if specified,
+        otherwise config.epsilon.
+        """
+        if alphabet is None:
+            alphabet = config
+        T = self.T
+        eos = str(self.eos)
+        state_ids = {p: i for i, p in enumerate(self.red)}
+        qf = len(self.red)
+        labels = [' '.join(map(str, T.prefix(p))) or 'λ' for p in self.red]
+        labels.append(eos)
+        isymbols = {alphabet.epsilon: 0}
+        osymbols = {alphabet.epsilon: 0}
+        src, ilabel, olabel, dest = [], [], [], []
+        for p in self.red:
+            arcs = [] if self.arcs[p] is None else \
+                [(a, y, state_ids[self.find(r)])
+                 for a, (y, r) in self.arcs[p].items()]
+            if self.sigma[p] is not None:
+                arcs.append((eos, self.sigma[p], qf))
+            for (a, y, r) in arcs:
+                src.append(state_ids[p])
+                ilabel.append(isymbols.setdefault(str(a), len(isymbols)))
+                olabel.append(
+                    osymbols.setdefault(' '.join(map(str, y)), len(osymbols))
+                    if len(y) != 0 else 0)
+                dest.append(r)
+        final = [float('inf')] * qf + [0.0]
+        return Wfst.from_arrays(src,
+                                ilabel,
+                                olabel,
+                                [0.0] * len(src),
+                                dest,
+                                final,
+                                0,
+                                labels=labels,
+                                input_symtable=_symtable(isymbols),
+                                output_symtable=_symtable(osymbols))
+
+
+def ostia(D, eos=None, verbose=0, alphabet=None):
+    """
+    Learn subsequential transducer (Wfst) from sample
+    D = {(x, y) | f(x) = y} with OSTIA. Epsilon and (by default) eos
+    are those of alphabet (config.Alphabet) if specified, otherwise
+    the config globals.
+    """
+    if eos is None and alphabet is not None:
+        eos = alphabet.eos
+    T = PrefixTree(D, eos).onward()
+    return Ostia(T, verbose).learn().to_wfst(alphabet)
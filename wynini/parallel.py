@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import os
+
+from . import config, instrument
+from .wfst import Wfst, _compose_tier, _tier_ids
+
+# Frontiers smaller than this are expanded in the calling process
+min_parallel_frontier = 256
+
+# Read-only operands and arc indexes held by each worker process
+_operands = None
+
+
+def compose_parallel(wfst1, wfst2, workers=2, alphabet=None):
+    """
+    Composition as in wfst.compose(), with each breadth-first frontier
+    partitioned by state across a pool of worker processes. States of
+    the composition are integer keys q1 * n2 + q2 of state ids of wfst1
+    and wfst2 (n2 states). Each worker receives one read-only copy of
+    wfst1 and wfst2 when started (pass machines from Wfst.share() to
+    avoid copying large operands), expands its part of the frontier,
+    and returns compact arrays of arcs (source and destination keys,
+    labels, float weights) together with the distinct destination keys
+    it found. This process only merges the destination keys into the
+    set of visited states; state ids, final weights, trimming of states
+    that cannot reach a final state, and the result machine are then
+    computed in bulk with numpy (see Wfst.from_arrays). Only the Python
+    work of expanding arcs is divided among the workers, and it is
+    skipped in favor of in-process expansion if fewer than two CPUs are
+    available, since the pool could not speed it up. The result has the
+    same state labels, arcs, and final states as the serial version.
+    """
+    import numpy as np
+    if alphabet is None:
+        alphabet = config
+    if wfst1.start(label=False) == -1 or wfst2.start(label=False) == -1:
+        # Empty operand (no start state)
+        return Wfst(alphabet.symtable,
+                    arc_type=wfst1.arc_type(),
+                    tier=_compose_tier(wfst1, wfst2))
+    n2 = wfst2.num_states()
+    q0 = wfst1.start(label=False) * n2 + wfst2.start(label=False)
+
+    pool = None
+    if workers > 1 and _num_cpus() > 1:
+        pool = ProcessPoolExecutor(
+            workers, initializer=_init, initargs=(wfst1, wfst2))
+    local = _Operands(wfst1, wfst2)
+    try:
+        # Breadth-first expansion of integer keys
+        keys = [q0]
+        visited = {q0}
+        frontier = [q0]
+        chunks = []
+        while len(frontier) != 0:
+            instrument.frontier(len(frontier))
+            if pool is None or len(frontier) < min_parallel_frontier:
+                results = [local.expand(frontier)]
+            else:
+                parts = [frontier[i::workers] for i in range(workers)]
+                results = list(pool.map(_expand, parts))
+            chunks.extend(arcs for (arcs, _) in results)
+            frontier = []
+            for (_, dests) in results:
+                for dest in dests.tolist():
+                    if dest not in visited:
+                        visited.add(dest)
+                        frontier.append(dest)
+            keys.extend(frontier)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Arc columns, with keys replaced by state ids in order of discovery
+    keys = np.array(keys, dtype=np.int64)
+    key_order = np.argsort(keys)
+    sorted_keys = keys[key_order]
+    src, ilabel, olabel, weight, dest = [
+        np.concatenate([arcs[i] for arcs in chunks]) for i in range(5)
+    ]
+    src = key_order[np.searchsorted(sorted_keys, src)]
+    dest = key_order[np.searchsorted(sorted_keys, dest)]
+    q1, q2 = np.divmod(keys, n2)
+    final = local.finals1(q1) + local.finals2(q2)
+
+    # Trim states that cannot reach a final state (all are accessible)
+    live = _coaccessible(src, dest, final)
+    state_ids = np.cumsum(live) - 1
+    arc_live = live[src] & live[dest]
+    labels = [(wfst1.state_label(int(r1)), wfst2.state_label(int(r2)))
+              for (r1, r2) in zip(q1[live].tolist(), q2[live].tolist())]
+    wfst = Wfst.from_arrays(state_ids[src[arc_live]],
+                            ilabel[arc_live],
+                            olabel[arc_live],
+                            weight[arc_live],
+                            state_ids[dest[arc_live]],
+                            final[live],
+                            start=0 if live[0] else -1,
+                            labels=labels,
+                            input_symtable=alphabet.symtable,
+                            arc_type=wfst1.arc_type())
+    wfst.tier = _compose_tier(wfst1, wfst2)
+    return wfst
+
+
+def _num_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _coaccessible(src, dest, final):
+    """
+    Boolean mask of states from which some final state is reachable,
+    by breadth-first search backward over arcs, one frontier per step.
+    """
+    import numpy as np
+    n = len(final)
+    order = np.argsort(dest, kind='stable')
+    preds = src[order]
+    starts = np.searchsorted(dest[order], np.arange(n + 1))
+    live = final != np.inf
+    frontier = np.flatnonzero(live)
+    while len(frontier) != 0:
+        lo = starts[frontier]
+        counts = starts[frontier + 1] - lo
+        total = counts.sum()
+        if total == 0:
+            break
+        # Positions of predecessors of all frontier states
+        offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        frontier = preds[np.arange(total) + offsets]
+        frontier = np.unique(frontier[~live[frontier]])
+        live[frontier] = True
+    return live
+
+
+def _init(wfst1, wfst2):
+    """ Worker initializer: hold read-only operands. """
+    global _operands
+    _operands = _Operands(wfst1, wfst2)
+
+
+def _expand(frontier):
+    """ Worker task: arcs from each state in part of frontier. """
+    return _operands.expand(frontier)
+
+
+class _Operands():
+    """
+    Operands of compose_parallel() with arcs of each state cached on
+    first use: arcs of wfst1 as (ilabel, olabel, weight, dest) tuples,
+    arcs of wfst2 grouped by ilabel as (olabel, weight, dest) tuples.
+    """
+
+    def __init__(self, wfst1, wfst2):
+        self.wfst1 = wfst1
+        self.wfst2 = wfst2
+        self.n2 = wfst2.num_states()
+        self.tiers = (_tier_ids(wfst1), _tier_ids(wfst2))
+        self._arcs1 = {}
+        self._arcs2 = {}
+
+    def arcs1(self, q):
+        arcs = self._arcs1.get(q)
+        if arcs is None:
+            arcs = self._arcs1[q] = [
+                (t.ilabel, t.olabel, float(t.weight), t.nextstate)
+                for t in self.wfst1.arcs(q)
+            ]
+        return arcs
+
+    def arcs2(self, q):
+        arcs = self._arcs2.get(q)
+        if arcs is None:
+            arcs = self._arcs2[q] = {}
+            for t in self.wfst2.arcs(q):
+                arcs.setdefault(t.ilabel, []).append(
+                    (t.olabel, float(t.weight), t.nextstate))
+        return arcs
+
+    def expand(self, frontier):
+        """
+        Arcs from states (integer keys) in frontier, as a tuple of
+        arrays (src, ilabel, olabel, weight, dest), and the distinct
+        destination keys (see compose_parallel; cf. wfst._compose_arcs).
+        """
+        import numpy as np
+        n2 = self.n2
+        tier1, tier2 = self.tiers
+        src_out, dest_out = array('q'), array('q')
+        ilabel_out, olabel_out = array('i'), array('i')
+        weight_out = array('d')
+        for src in frontier:
+            q1, q2 = divmod(src, n2)
+            arcs2 = self.arcs2(q2)
+            for (ilabel, olabel, w1, dest1) in self.arcs1(q1):
+                if tier2 is not None and olabel != 0 and \
+                        olabel not in tier2:
+                    # Off-tier output of wfst1 passes through wfst2
+                    src_out.append(src)
+                    ilabel_out.append(ilabel)
+                    olabel_out.append(olabel)
+                    weight_out.append(w1)
+                    dest_out.append(dest1 * n2 + q2)
+                    continue
+                for (olabel2, w2, dest2) in arcs2.get(olabel, ()):
+                    src_out.append(src)
+                    ilabel_out.append(ilabel)
+                    olabel_out.append(olabel2)
+                    weight_out.append(w1 + w2)
+                    dest_out.append(dest1 * n2 + dest2)
+            if tier1 is None:
+                continue
+            for (ilabel, arcs) in arcs2.items():
+                if ilabel == 0 or ilabel in tier1:
+                    continue
+                # Off-tier input of wfst2 passes through wfst1
+                for (olabel2, w2, dest2) in arcs:
+                    src_out.append(src)
+                    ilabel_out.append(ilabel)
+                    olabel_out.append(olabel2)
+                    weight_out.append(w2)
+                    dest_out.append(q1 * n2 + dest2)
+        dest_out = np.frombuffer(dest_out, dtype=np.int64)
+        arcs = (np.frombuffer(src_out, dtype=np.int64),
+                np.frombuffer(ilabel_out, dtype=np.int32),
+                np.frombuffer(olabel_out, dtype=np.int32),
+                np.frombuffer(weight_out, dtype=np.float64), dest_out)
+        return arcs, np.unique(dest_out)
+
+    def finals1(self, q1):
+        return self._finals(self.wfst1, q1)
+
+    def finals2(self, q2):
+        return self._finals(self.wfst2, q2)
+
+    def _finals(self, wfst, q):
+        """ Float final weights of states q (array of ids). """
+        import numpy as np
+        ids, index = np.unique(q, return_inverse=True)
+        finals = np.array([float(wfst.final(int(r))) for r in ids.tolist()],
+                          dtype=np.float64)
+        return finals[index]
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+from . import config
+from .simple_fst import _symtable
+from .wfst import Wfst
+
+
+class PrefixTree():
+    """
+    Prefix tree transducer for a sample D = {(x, y) | f(x) = y}, as in
+    Chandlee (2014:116), Chandlee, Eyraud & Heinz (2014:497),
+    de la Higuera Algorithm 18.1 (cf. prefix_tree in zzz/proc.py).
+    Inputs and outputs are sequences of tokens (space-separated strings
+    or tuples of hashable symbols, e.g., symbol ids). Each prefix u of
+    an input is a state; each sample (x, y) adds an arc from x labeled
+    eos : y to a final state. States are ids 0 (root λ), 1, ... in
+    order of creation, so every state has a larger id than its parent
+    (reverse id order is a post-order traversal). Stored as flat lists
+    indexed by state (parent, input symbol and output of incoming arc)
+    plus a dict from (state, input symbol) to child, so building takes
+    time linear in the total length of the sample.
+    """
+
+    def __init__(self, D=None, eos=None):
+        self.eos = config.eos if eos is None else eos
+        self.parent = [-1]  # State -> parent state
+        self.ilabel = [None]  # State -> input symbol of incoming arc
+        self.output = [()]  # State -> output tokens of incoming arc
+        self.child = {}  # (state, input symbol) -> child state
+        if D is not None:
+            for (x, y) in D:
+                self.add(x, y)
+
+    def add(self, x, y):
+        """ Add sample pair (input x, output y). """
+        q = 0
+        for a in tokens(x):
+            q = self._add_arc(q, a)
+        y = tokens(y)
+        r = self.child.get((q, self.eos))
+        if r is None:
+            r = self._add_arc(q, self.eos)
+            self.output[r] = y
+        elif self.output[r] != y:
+            raise ValueError(f'Sample is not a function: {x} -> '
+                             f'{self.output[r]} and {y}')
+        return r
+
+    def _add_arc(self, q, a):
+        """ Child of state q by input symbol a (created if needed). """
+        key = (q, a)
+        r = self.child.get(key)
+        if r is None:
+            r = len(self.parent)
+            self.parent.append(q)
+            self.ilabel.append(a)
+            self.output.append(())
+            self.child[key] = r
+        return r
+
+    def num_states(self):
+        return len(self.parent)
+
+    def is_final(self, q):
+        """ Final states are those reached by eos. """
+        return self.ilabel[q] == self.eos
+
+    def state(self, x):
+        """ State for input prefix x (None if not in tree). """
+        q = 0
+        for a in tokens(x):
+            q = self.child.get((q, a))
+            if q is None:
+                return None
+        return q
+
+    def prefix(self, q):
+        """ Input prefix (tuple of tokens) of state q. """
+        u = []
+        while q > 0:
+            u.append(self.ilabel[q])
+            q = self.parent[q]
+        return tuple(reversed(u))
+
+    def children(self):
+        """ Lists of child states, indexed by state. """
+        children = [[] for _ in self.parent]
+        for r in range(1, len(self.parent)):
+            children[self.parent[r]].append(r)
+        return children
+
+    def onward(self):
+        """
+        Make tree onward in place, as in Chandlee, Eyraud & Heinz
+        (2014:498) (cf. onward_tree in zzz/proc.py): the longest common
+        prefix of the outputs leaving each non-root state is moved onto
+        its incoming arc. Iterative, visiting states in reverse id order
+        (children before parents) with an index of children. Outputs
+        are held as reversed lists, so a prefix moved up is removed from
+        the ends of the lists of the children and the list of the parent
+        is joined to its end, without copying outputs at every level;
+        time is linear in the size of the tree and its outputs.
+        """
+        children = self.children()
+        output = self.output
+        rev = [list(reversed(y)) for y in output]  # Reversed outputs
+        for q in range(len(self.parent) - 1, 0, -1):
+            kids = children[q]
+            if len(kids) == 0:
+                continue
+            if len(kids) == 1:
+                # Entire output of only child moves up
+                r = kids[0]
+                f, rev[r] = rev[r], []
+            else:
+                f = _common_tail([rev[r] for r in kids])
+                if len(f) != 0:
+                    for r in kids:
+                        del rev[r][-len(f):]
+            if len(f) != 0:
+                f.extend(rev[q])
+                rev[q] = f
+        for q, x in enumerate(rev):
+            output[q] = tuple(reversed(x))
+        return self
+
+    def to_wfst(self, labels=True, alphabet=None):
+        """
+        Convert to Wfst, with each arc output as a single symbol
+        (tokens joined by spaces, epsilon if empty) as in
+        SimpleFst.to_wfst. States are labeled by their input prefixes
+        (space-separated, 'λ' for the root) unless labels is False, in
+        which case state ids are kept as default labels. Epsilon is
+        that of alphabet (config.Alphabet) if specified, otherwise
+        config.epsilon.
+        """
+        if alphabet is None:
+            alphabet = config
+        n = len(self.parent)
+        isymbols = {alphabet.epsilon: 0}
+        osymbols = {alphabet.epsilon: 0}
+        ilabel = [
+            isymbols.setdefault(str(a), len(isymbols))
+            for a in self.ilabel[1:]
+        ]
+        olabel = [
+            osymbols.setdefault(' '.join(map(str, y)), len(osymbols))
+            if len(y) != 0 else 0 for y in self.output[1:]
+        ]
+        final = [0.0 if self.is_final(q) else float('inf') for q in range(n)]
+        state_labels = None
+        if labels:
+            state_labels = ['λ'] * n
+            for q in range(1, n):
+                p = self.parent[q]
+                a = str(self.ilabel[q])
+                state_labels[q] = a if p == 0 else state_labels[p] + ' ' + a
+        return Wfst.from_arrays(self.parent[1:],
+                                ilabel,
+                                olabel,
+                                [0.0] * (n - 1),
+                                range(1, n),
+                                final,
+                                0,
+                                labels=state_labels,
+                                input_symtable=_symtable(isymbols),
+                                output_symtable=_symtable(osymbols))
+
+
+def prefix_tree(D, eos=None):
+    """ Prefix tree transducer for sample D (see PrefixTree). """
+    return PrefixTree(D, eos)
+
+
+def onward_tree(D, eos=None):
+    """ Onward prefix tree transducer for sample D. """
+    return PrefixTree(D, eos).onward()
+
+
+def tokens(x):
+    """ Tuple of tokens of space-separated string or sequence x. """
+    if isinstance(x, str):
+        return tuple(x.split())
+    return tuple(x)
+
+
+def _common_tail(F):
+    """ Longest common suffix (as a list) of the lists in F. """
+    x0 = F[0]
+    n = min(len(x) for x in F)
+    k = 0
+    while k < n and all(x[-1 - k] == x0[-1 - k] for x in F):
+        k += 1
+    return x0[len(x0) - k:]
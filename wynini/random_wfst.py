@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from . import config
+from .wfst import Wfst, compose
+
+# Random machines for benchmarking and stress tests, built in bulk
+# with Wfst.from_arrays(), and a harness that checks operations
+# against reference implementations on many random machines.
+
+
+def random_wfst(num_states,
+                arcs_per_state=2,
+                cycle_density=0.1,
+                final_prob=0.1,
+                epsilon_prob=0.0,
+                acceptor=True,
+                weights=None,
+                connected=True,
+                labels=True,
+                arc_type='standard',
+                alphabet=None,
+                seed=None):
+    """
+    Random machine with states 0, ..., num_states-1 (labeled 'q0', ...
+    unless labels=False) and arcs_per_state arcs from each state. Each
+    arc goes backward (to the same or an earlier state) with probability
+    cycle_density, otherwise forward (forward arcs from the last state
+    are dropped); cycle_density=0 gives an acyclic machine. With
+    connected=True the first arc from each state q < n-1 goes to q+1,
+    so all states are accessible and coaccessible. State 0 is initial;
+    the last state and each other state with probability final_prob
+    are final. Arc labels are drawn uniformly from sigma of alphabet
+    (config if not specified), or epsilon with probability
+    epsilon_prob; output labels equal input labels if acceptor.
+    Weights (of arcs and finals) are one (weights=None), "uniform"
+    in [0, 1), "exponential" with mean 1, or given by a function
+    f(rng, size) of a numpy Generator and array size.
+    """
+    if alphabet is None:
+        alphabet = config
+    rng = np.random.default_rng(seed)
+    n = num_states
+    k = arcs_per_state
+    if n == 0:
+        return Wfst(alphabet.symtable, arc_type=arc_type)
+
+    # Arcs
+    src = np.repeat(np.arange(n), k)
+    m = len(src)
+    backward = rng.random(m) < cycle_density
+    forward_max = n - 1 - src
+    dest = np.where(backward,
+                    (rng.random(m) * (src + 1)).astype(np.int64),
+                    src + 1 + (rng.random(m) * forward_max).astype(np.int64))
+    if connected and k > 0:
+        spine = np.arange(0, m, k)[:-1]
+        dest[spine] = src[spine] + 1
+    # Forward arcs from the last state have no destination
+    keep = dest < n
+    src = src[keep]
+    dest = dest[keep]
+    m = len(src)
+
+    sigma = [alphabet.sym2id[x] for x in alphabet.sigma]
+    ilabel = rng.choice(sigma, m) if m > 0 else np.zeros(0, np.int64)
+    if epsilon_prob > 0.0:
+        eps = alphabet.sym2id[alphabet.epsilon]
+        ilabel = np.where(rng.random(m) < epsilon_prob, eps, ilabel)
+    if acceptor:
+        olabel = ilabel
+    else:
+        olabel = rng.choice(sigma, m) if m > 0 else np.zeros(0, np.int64)
+
+    # Final states
+    is_final = rng.random(n) < final_prob
+    is_final[-1] = True
+    final = np.where(is_final, _weights(weights, rng, n), np.inf)
+
+    wfst = Wfst.from_arrays(src,
+                            ilabel,
+                            olabel,
+                            _weights(weights, rng, m),
+                            dest,
+                            final,
+                            start=0,
+                            labels=[f'q{q}' for q in range(n)]
+                            if labels else None,
+                            input_symtable=alphabet.symtable,
+                            arc_type=arc_type)
+    return wfst
+
+
+def _weights(weights, rng, size):
+    if weights is None:
+        return np.zeros(size)
+    if weights == 'uniform':
+        return rng.random(size)
+    if weights == 'exponential':
+        return rng.exponential(1.0, size)
+    return np.asarray(weights(rng, size), dtype=np.float64)
+
+
+def random_string(length, alphabet=None, seed=None):
+    """ Random space-separated string over sigma of alphabet. """
+    if alphabet is None:
+        alphabet = config
+    rng = np.random.default_rng(seed)
+    sigma = list(alphabet.sigma)
+    return ' '.join(sigma[i] for i in rng.integers(0, len(sigma), length))
+
+
+# Reference-equivalence harness
+
+
+def diff(wfst1, wfst2, delta=1e-6):
+    """
+    Differences between two machines in terms of state labels, symbols
+    and float weights (within delta): start state, final states and
+    weights, and multisets of arcs. Returns list of messages, empty if
+    the machines are identical up to state ids.
+    """
+    msgs = []
+    labels1 = set(wfst1.states())
+    labels2 = set(wfst2.states())
+    if labels1 != labels2:
+        msgs.append(f'states only in first: {labels1 - labels2}; '
+                    f'only in second: {labels2 - labels1}')
+    if wfst1.num_states() != 0 and wfst2.num_states() != 0:
+        if wfst1.start() != wfst2.start():
+            msgs.append(f'start: {wfst1.start()} != {wfst2.start()}')
+
+    finals1 = {q: float(wfst1.final(q)) for q in wfst1.finals()}
+    finals2 = {q: float(wfst2.final(q)) for q in wfst2.finals()}
+    for q in set(finals1) | set(finals2):
+        w1 = finals1.get(q, float('inf'))
+        w2 = finals2.get(q, float('inf'))
+        if not _weight_equal(w1, w2, delta):
+            msgs.append(f'final weight of {q}: {w1} != {w2}')
+
+    arcs1 = _arc_multiset(wfst1)
+    arcs2 = _arc_multiset(wfst2)
+    for key in set(arcs1) | set(arcs2):
+        ws1 = sorted(arcs1.get(key, []))
+        ws2 = sorted(arcs2.get(key, []))
+        if len(ws1) != len(ws2) or \
+                not all(_weight_equal(w1, w2, delta)
+                        for (w1, w2) in zip(ws1, ws2)):
+            msgs.append(f'arcs {key}: weights {ws1} != {ws2}')
+    return msgs
+
+
+def _arc_multiset(wfst):
+    """ Arc weights grouped by (src, isym, osym, dest) labels. """
+    arcs = {}
+    isymbols = wfst.input_symbols()
+    osymbols = wfst.output_symbols()
+    for q in range(wfst.num_states()):
+        src = wfst.state_label(q)
+        for t in wfst.arcs(q):
+            key = (src, isymbols.find(t.ilabel), osymbols.find(t.olabel),
+                   wfst.state_label(t.nextstate))
+            arcs.setdefault(key, []).append(float(t.weight))
+    return arcs
+
+
+def _weight_equal(w1, w2, delta):
+    if w1 == w2:
+        return True
+    return abs(w1 - w2) <= delta
+
+
+def check(candidate,
+          reference=compose,
+          arity=2,
+          trials=100,
+          seed=0,
+          delta=1e-6,
+          verbose=True,
+          **kwargs):
+    """
+    Run candidate and reference operations on the same random machines
+    (arity machines per trial, shapes given by random_wfst() kwargs with
+    num_states default 10) and compare results with diff(). Returns list
+    of failures (trial seed, messages); trial seeds reproduce the input
+    machines with random_wfst(seed=...). Examples:
+        check(lambda M1, M2: compose(M1, M2, workers=2))
+        check(fast_connect, Wfst.connect, arity=1, cycle_density=0.5)
+    """
+    kwargs.setdefault('num_states', 10)
+    failures = []
+    for trial in range(trials):
+        seeds = [seed + trial * arity + i for i in range(arity)]
+        machines = [random_wfst(seed=s, **kwargs) for s in seeds]
+        val = reference(*machines)
+        val_ = candidate(*machines)
+        msgs = diff(val, val_, delta)
+        if len(msgs) != 0:
+            failures.append((seeds, msgs))
+            if verbose:
+                print(f'trial {trial} (seeds {seeds}): {len(msgs)} '
+                      f'differences, e.g., {msgs[0]}')
+    if verbose:
+        print(f'{trials - len(failures)} / {trials} trials passed')
+    return failures
@@ -11,6 +11,8 @@ from .wfst import Wfst
 class SimpleFst():
     """
     Bare-bones unweighted FST implementation
+    Arcs are also indexed by (src, ilabel) (see arcs), so arc src and 
+    ilabel must not be changed after adding an arc to the machine.
     """
 
     def __init__(self, Q=None, q0=None, F=None, T=None):
@@ -19,13 +21,18 @@ class SimpleFst():
         self.F = set(F) if F is not None else set()  # Final states
         self.T = T if T is not None else {}  # mapping state -> outgoing arcs
         # (outgoing arc collection is Set [default] or List)
+        self.index = {}  # mapping (src, ilabel) -> list of outgoing arcs
+        for T_q in self.T.values():
+            for t in T_q:
+                self._index_arc(t)
 
     def add_state(self, q):
         """
         Add to set of states
         """
         self.Q.add(q)
-        self.T[q] = set()
+        if q not in self.T:
+            self.T[q] = set()
 
     def set_start(self, q):
         """
@@ -55,42 +62,59 @@ class SimpleFst():
             self.add_state(t.dest)
         if t.src not in self.T:  # xxx
             self.T[t.src] = set()
-        if isinstance(self.T[t.src], set):
-            self.T[t.src].add(t)
+        T_q = self.T[t.src]
+        if isinstance(T_q, set):
+            if t in T_q:
+                return
+            T_q.add(t)
+        else:
+            T_q.append(t)
+        self._index_arc(t)
+
+    def _index_arc(self, t):
+        key = (t.src, t.ilabel)
+        arcs = self.index.get(key)
+        if arcs is None:
+            self.index[key] = [t]
         else:
-            self.T[t.src].append(t)
+            arcs.append(t)
+
+    def arcs(self, q, ilabel=None):
+        """
+        Outgoing arcs of state q, or only those with input label ilabel 
+        (constant-time lookup in index)
+        """
+        if ilabel is None:
+            return self.T.get(q, ())
+        return self.index.get((q, ilabel), ())
 
     def delete_states(self, dead_states):
         """
         Delete states and their outgoing/incoming arcs [nondestructive]
         """
+        dead_states = set(dead_states)
         Q = self.Q.difference(dead_states)
         q0 = self.q0 if self.q0 not in dead_states else -1
         F = self.F.difference(dead_states)
-        for q in dead_states:
-            del T[q]
-        dead_arcs = []
-        for q in T:
-            dead_arcs += [t for t in T[q] if t.dest in dead_states]
-        for t in dead_arcs:
-            T[q].remove(t)
+        T = {}
+        for q, T_q in self.T.items():
+            if q in dead_states:
+                continue
+            T[q] = type(T_q)(t for t in T_q if t.dest not in dead_states)
         fst = SimpleFst(Q, q0, F, T)
         return fst
 
     def copy(self):
         """
-        Deep copy of this machine
+        Deep copy of this machine (arcs are copied, so output labels 
+        may be modified in place, cf. onward_tree in zzz/proc.py)
         """
-        Q = {q for q in self.Q}
+        Q = set(self.Q)
         q0 = self.q0
-        F = {q for q in self.F}
-        T = {}
-        for q, T_q in self.T.items():
-            T[q] = set()
-            for t in T_q:
-                t_new = SimpleArc(t.src, t.ilabel, t.olabel, t.dest)
-                T[q].add(t_new)
-        return SimpleFst(Q, q0, F, T)
+        F = set(self.F)
+        T = {q: type(T_q)(copy(t) for t in T_q) for q, T_q in self.T.items()}
+        fst = SimpleFst(Q, q0, F, T)
+        return fst
 
     def print(self):
         """
@@ -105,38 +129,131 @@ class SimpleFst():
         val += f'T {[str(t) for t in _T]}\n'
         return val
 
-    def to_wfst(self):
+    def to_wfst(self, alphabet=None):
         """
-        Convert to Wfst
+        Convert to Wfst with states labeled by the states of this machine: 
+        state ids are assigned in one pass, symbols are resolved with 
+        dicts, and larger machines are built in bulk (see 
+        Wfst.from_arrays, requires numpy) rather than arc by arc. 
+        Epsilon is that of alphabet (config.Alphabet) if specified, 
+        otherwise config.epsilon.
         """
-        # Starter symbol table
-        input_symbols = SymbolTable()
-        output_symbols = SymbolTable()
-        input_symbols.add_symbol(config.epsilon)
-        output_symbols.add_symbol(config.epsilon)
-        wfst = Wfst(input_symbols, output_symbols)
+        if alphabet is None:
+            alphabet = config
+        # Symbol tables (epsilon first, then symbols in order of use)
+        isymbols = {alphabet.epsilon: 0}
+        osymbols = {alphabet.epsilon: 0}
 
         # States
-        for q in self.Q:
-            wfst.add_state(q)
+        states = list(self.Q)
+        state2id = {q: i for i, q in enumerate(states)}
+
+        # Transitions
+        arcs = [t for T_q in self.T.values() for t in T_q]
+        src = [state2id[t.src] for t in arcs]
+        ilabel = [isymbols.setdefault(t.ilabel, len(isymbols)) for t in arcs]
+        olabel = [osymbols.setdefault(t.olabel, len(osymbols)) for t in arcs]
+        dest = [state2id[t.dest] for t in arcs]
+        weight = [0.0] * len(arcs)
 
         # Initial and final states
-        wfst.set_start(self.q0)
+        start = state2id.get(self.q0, -1)
+        final = [float('inf')] * len(states)
         for q in self.F:
-            wfst.set_final(q)
+            final[state2id[q]] = 0.0
 
-        # Transitions
-        for q in self.T:
-            for t in self.T[q]:
-                wfst.add_arc(t.src, t.ilabel, t.olabel, None, t.dest)
+        if len(arcs) < _bulk_min_arcs:
+            wfst = Wfst(_symtable(isymbols), _symtable(osymbols))
+            for q in states:
+                wfst.add_state(q)
+            if start != -1:
+                wfst.set_start(start)
+            for q in self.F:
+                wfst.set_final(state2id[q])
+            for (q, a, b, r) in zip(src, ilabel, olabel, dest):
+                wfst.add_arc(q, a, b, None, r)
+            return wfst
+
+        wfst = Wfst.from_arrays(src,
+                                ilabel,
+                                olabel,
+                                weight,
+                                dest,
+                                final,
+                                start,
+                                labels=states,
+                                input_symtable=_symtable(isymbols),
+                                output_symtable=_symtable(osymbols))
         return wfst
 
+    @classmethod
+    def from_wfst(cls, wfst):
+        """
+        Convert from Wfst, with states labeled as in wfst, arc labels 
+        as symbols, and weights ignored (states with non-zero final 
+        weights are final); larger machines are read in bulk (see 
+        Wfst.to_arrays, requires numpy)
+        """
+        isymbols = dict(wfst.input_symbols())
+        osymbols = dict(wfst.output_symbols())
+        if wfst.num_arcs() < _bulk_min_arcs:
+            labels = list(wfst.states())
+            fst = SimpleFst(labels)
+            for q in labels:
+                fst.T[q] = set()
+            for q in wfst.states(labels=False):
+                for t in wfst.arcs(q):
+                    fst.add_arc(
+                        SimpleArc(labels[q], isymbols[t.ilabel],
+                                  osymbols[t.olabel], labels[t.nextstate]))
+                if wfst.is_final(q):
+                    fst.F.add(labels[q])
+            q0 = wfst.start(label=False)
+            if q0 != -1:
+                fst.q0 = labels[q0]
+            return fst
+
+        arrays = wfst.to_arrays()
+        labels = [wfst.state_label(q) for q in range(len(arrays['final']))]
+
+        fst = SimpleFst(labels)
+        for q in labels:
+            fst.T[q] = set()
+        for (q, a, b, r) in zip(arrays['src'].tolist(),
+                                arrays['ilabel'].tolist(),
+                                arrays['olabel'].tolist(),
+                                arrays['dest'].tolist()):
+            t = SimpleArc(labels[q], isymbols[a], osymbols[b], labels[r])
+            T_q = fst.T[t.src]
+            if t not in T_q:  # Duplicates are merged, as in add_arc
+                T_q.add(t)
+                fst._index_arc(t)
+        if arrays['start'] >= 0:
+            fst.q0 = labels[arrays['start']]
+        for q, w in enumerate(arrays['final'].tolist()):
+            if w != float('inf'):
+                fst.F.add(labels[q])
+        return fst
+
+
+# Machines with fewer arcs are converted arc by arc, without numpy.
+_bulk_min_arcs = 1000
+
+
+def _symtable(sym2id):
+    """ SymbolTable from dict of symbols to ids. """
+    symtable = SymbolTable()
+    for sym, i in sym2id.items():
+        symtable.add_symbol(sym, i)
+    return symtable
+
 
 @total_ordering
 class SimpleArc():
     """
     Arc of SimpleFST
     """
+    __slots__ = ('src', 'ilabel', 'olabel', 'dest')
 
     def __init__(self, src, ilabel, olabel, dest):
         self.src = src
@@ -157,7 +274,7 @@ class SimpleArc():
 
     def __lt__(self, other):
         if not isinstance(other, type(self)):
-            raise Error('Incorrect type for SimpleArc lt()')
+            raise TypeError('Incorrect type for SimpleArc lt()')
         return (self.src, self.ilabel, self.olabel,
                 self.dest) < (other.src, other.ilabel, other.olabel, other.dest)
 
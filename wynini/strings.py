@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+from pynini import SymbolTable
+
+from . import config
+
+# Strings as tuples of token ids, interned through a symbol table,
+# with the string operations of zzz/proc.py (concat, delete_prefix,
+# suffix, lcp, lcs). The empty string λ is the empty tuple. Operations
+# also accept tuples of tokens (e.g., symbols) or 1-d integer arrays.
+
+
+class Interner():
+    """
+    Map between space-separated strings and tuples of token ids in a
+    symbol table (by default a new table with epsilon as id 0, from
+    alphabet (config.Alphabet) if specified, otherwise config.epsilon);
+    tokens not in the table are added.
+    """
+
+    def __init__(self, symtable=None, alphabet=None):
+        if symtable is None:
+            if alphabet is None:
+                alphabet = config
+            symtable = SymbolTable()
+            symtable.add_symbol(alphabet.epsilon)
+        else:
+            symtable = symtable.copy()
+        self.symtable = symtable
+        self.sym2id = {sym: sym_id for (sym_id, sym) in symtable}
+        self.syms = {sym_id: sym for (sym, sym_id) in self.sym2id.items()}
+
+    def intern(self, x):
+        """ Tuple of token ids of space-separated string or sequence x. """
+        if isinstance(x, str):
+            x = x.split()
+        sym2id = self.sym2id
+        ids = []
+        for sym in x:
+            sym_id = sym2id.get(sym)
+            if sym_id is None:
+                sym_id = sym2id[sym] = self.symtable.add_symbol(sym)
+                self.syms[sym_id] = sym
+            ids.append(sym_id)
+        return tuple(ids)
+
+    def string(self, x):
+        """ Space-separated string of tuple of token ids x. """
+        return ' '.join(self.syms[int(sym_id)] for sym_id in x)
+
+
+def concat(u, v):
+    """ Concatenation of strings u and v. """
+    return tuple(u) + tuple(v)
+
+
+def delete_prefix(x, u):
+    """ Delete prefix u from string x. """
+    k = len(u)
+    if tuple(x[:k]) != tuple(u):
+        raise ValueError(f'{tuple(u)} not a prefix of {tuple(x)}')
+    return tuple(x[k:])
+
+
+def suffix(x, k):
+    """ Suffix of length k of string x (all of x if shorter). """
+    if k <= 0:
+        return ()
+    return tuple(x[-k:])
+
+
+def lcp(F):
+    """ Longest common prefix of strings in F (() if F is empty). """
+    return _common(F, False)
+
+
+def lcs(F):
+    """ Longest common suffix of strings in F (() if F is empty). """
+    return _common(F, True)
+
+
+# Small sets are scanned directly; larger sets of id strings are
+# compared at once as an array of their first (or last) n tokens.
+_vectorize_min = 32
+
+
+def _common(F, reverse):
+    F = list(F)
+    if len(F) == 0:
+        return ()
+    n = min(len(x) for x in F)
+    # Plain ints (not numpy scalars) if F[0] is an integer array
+    f = tuple(sym.item() if hasattr(sym, 'item') else sym for sym in F[0])
+    if n == 0:
+        return ()
+    if len(F) < _vectorize_min:
+        k = n
+        for x in F[1:]:
+            i = 0
+            if reverse:
+                while i < k and x[-1 - i] == f[-1 - i]:
+                    i += 1
+            else:
+                while i < k and x[i] == f[i]:
+                    i += 1
+            k = i
+            if k == 0:
+                break
+    else:
+        import numpy as np
+        if reverse:
+            A = np.array([x[len(x) - n:] for x in F])[:, ::-1]
+        else:
+            A = np.array([x[:n] for x in F])
+        mismatch = np.any(A != A[0], axis=0)
+        k = int(np.argmax(mismatch)) if mismatch.any() else n
+    if reverse:
+        return f[len(f) - k:]
+    return f[:k]
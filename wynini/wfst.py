@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import heapq
+import math
+import struct
+import threading
+import warnings
+from collections import deque
+
 import pynini
+import pywrapfst
 from pynini import Fst, Arc, Weight
-from . import config
+from . import config, instrument
+
+# Quantization step for comparing float weights (OpenFst kDelta); float32
+# weights summed along different paths differ by more than 1e-6
+_DELTA = 1.0 / 1024
 
 
 class Wfst():
@@ -13,18 +25,34 @@ class Wfst():
     generally lose track of state ids and symbol labels, so some operations 
     are reimplemented here (e.g., connect, compose).
     Fst() arguments: arc_type ("standard", "log", or "log64")
+    State labels are stored in a list indexed by state id (plus a dict 
+    from labels to ids); with labels=False nothing is stored and the 
+    label of state q is str(q) until some state is added with another 
+    label, at which point the default labels are materialized.
+    Without input_symtable, the input symbol table holds epsilon, bos 
+    and eos of alphabet (config.Alphabet) if specified, otherwise of 
+    the config globals.
+    A machine can declare its tier, the set of symbols on which it has 
+    explicit arcs: input symbols outside of the tier (other than epsilon) 
+    then pass through every state implicitly, as if by identity 
+    self-loops with weight one, in compose() and transduce().
     """
 
     def __init__(self,
                  input_symtable=None,
                  output_symtable=None,
-                 arc_type='standard'):
+                 arc_type='standard',
+                 labels=True,
+                 tier=None,
+                 alphabet=None):
         # Symbol tables
         if input_symtable is None:
+            if alphabet is None:
+                alphabet = config
             input_symtable = pynini.SymbolTable()
-            input_symtable.add_symbol(config.epsilon)
-            input_symtable.add_symbol(config.bos)
-            input_symtable.add_symbol(config.eos)
+            input_symtable.add_symbol(alphabet.epsilon)
+            input_symtable.add_symbol(alphabet.bos)
+            input_symtable.add_symbol(alphabet.eos)
         if output_symtable is None:
             output_symtable = input_symtable
         # Empty Fst
@@ -32,113 +60,254 @@ class Wfst():
         fst.set_input_symbols(input_symtable)
         fst.set_output_symbols(output_symtable)
         # Empty Wfst
-        self.fst = fst  # Wrapped Fst
-        self._state2label = {}  # State id -> state label
-        self._label2state = {}  # State label -> state id
+        self._fst = fst  # Wrapped Fst
+        if labels:
+            self._state2label = []  # State id -> state label
+            self._label2state = {}  # State label -> state id
+        else:
+            self._state2label = None  # Labels are str(q)
+            self._label2state = None
         self.sigma = {}  # State id -> output string
+        if tier is not None:
+            tier = frozenset(tier)
+        self.tier = tier  # Symbols with explicit arcs (None for all)
+        self.truncated = False  # Partial result (see determinize)
+        self._closure = {}  # Cached epsilon closures (see epsilon_closure)
+        self._pass = None  # Cached pass-through machine (see transduce)
+        self._frozen = False  # Read-only (see freeze)
+        self._shared_fst = False  # Fst shared with copies (see copy)
+        self._exposed_fst = None  # Fst handed out by fst member
+        self._shared_labels = False  # State labels shared with copies
+
+    def _mutate(self, labels=False):
+        """
+        Prepare for mutation: reject if frozen, take a private Fst (and 
+        state labels if they will change) if shared with copies, clear 
+        cached epsilon closures.
+        """
+        if self._frozen:
+            raise TypeError('Wfst is frozen (see freeze, copy)')
+        if self._shared_fst:
+            self._fst = self._fst.copy()
+            self._shared_fst = False
+        if labels and self._shared_labels:
+            if self._state2label is not None:
+                self._state2label = list(self._state2label)
+                self._label2state = dict(self._label2state)
+            self._shared_labels = False
+        if self._closure:
+            self._closure = {}
+        if self._pass is not None:
+            self._pass = None
+
+    @property
+    def fst(self):
+        """
+        Wrapped pynini Fst. Callers may modify it in place, so a private 
+        Fst is taken first if shared with copies (see copy), and cached 
+        epsilon closures and pass-through machines are cleared on every 
+        access. A reference to the Fst held across calls that fill these 
+        caches (epsilon_closure, rmepsilon, transduce) must not be 
+        modified afterwards; access the fst member again instead. Later 
+        copies do not share an Fst handed out here (nor by mutable_arcs 
+        or mutable_input/output_symbols): copy-on-write only covers 
+        machines copied before they are mutated through such handles, 
+        so code in this package uses the private _fst. A frozen machine 
+        returns an immutable ConstFst view instead (see freeze).
+        """
+        if self._frozen:
+            return self._const_fst
+        if self._shared_fst:
+            self._fst = self._fst.copy()
+            self._shared_fst = False
+        self._closure = {}
+        self._pass = None
+        self._exposed_fst = self._fst
+        return self._fst
+
+    @fst.setter
+    def fst(self, fst):
+        if self._frozen:
+            raise TypeError('Wfst is frozen (see freeze, copy)')
+        self._fst = fst
+        self._shared_fst = False
+        self._exposed_fst = fst
+        self._closure = {}
+        self._pass = None
+
+    def freeze(self):
+        """
+        Make this machine read-only, with arcs and final weights of each 
+        state precomputed as tuples / lists indexed by state id (cf. 
+        ConstFst). Mutators (including assignment to the fst member) then 
+        raise TypeError, and the fst member is an immutable ConstFst; 
+        copy() returns a mutable copy. An Fst handed out before freezing 
+        (by the fst member, from_fst, mutable_arcs, etc.) is detached 
+        first, so no handle held by callers can modify the frozen 
+        machine: the indexes are built from the ConstFst, and other 
+        reads use an Fst that is never handed out. Concurrent reads from 
+        multiple threads (e.g., transduce, paths, accessible, arcs, 
+        epsilon_closure) are safe on a frozen machine: indexes and the 
+        pass-through machine of transduce() (for machines with a tier) 
+        are built here, and the caches of epsilon closures and 
+        pass-through machines are guarded by a lock.
+        """
+        if self._frozen:
+            return self
+        if self._fst is self._exposed_fst:
+            # Detach from references held by callers (see fst)
+            self._fst = _detached_copy(self._fst)
+            self._exposed_fst = None
+        fst = pywrapfst.convert(self._fst, 'const')
+        self._arcs = [tuple(fst.arcs(q)) for q in fst.states()]
+        self._finals = [fst.final(q) for q in fst.states()]
+        self._const_fst = fst
+        self._lock = threading.Lock()
+        self._frozen = True
+        if self.tier is not None:
+            self._pass_through(())
+        return self
+
+    def is_frozen(self):
+        """ Check read-only status (see freeze). """
+        return self._frozen
 
     # Input/output labels (delegate to Fst).
 
     def input_symbols(self):
         """ Get input symbol table. """
-        return self.fst.input_symbols()
+        return self._fst.input_symbols()
 
     def output_symbols(self):
         """ Get output symbol table. """
-        return self.fst.output_symbols()
+        return self._fst.output_symbols()
 
     def mutable_input_symbols(self):
-        """ Get mutable input symbol table. """
-        return self.fst.mutable_input_symbols()
+        """ Get mutable input symbol table (see fst member). """
+        self._mutate()
+        self._exposed_fst = self._fst
+        return self._fst.mutable_input_symbols()
 
     def mutable_output_symbols(self):
-        """ Get mutable output symbol table. """
-        return self.fst.mutable_output_symbols()
+        """ Get mutable output symbol table (see fst member). """
+        self._mutate()
+        self._exposed_fst = self._fst
+        return self._fst.mutable_output_symbols()
 
     def set_input_symbols(self, symbols):
         """ Set input symbol table. """
-        self.fst.set_input_symbols(symbols)
+        self._mutate()
+        self._fst.set_input_symbols(symbols)
         return self
 
     def set_output_symbols(self, symbols):
         """ Set output symbol table. """
-        self.fst.set_output_symbols(symbols)
+        self._mutate()
+        self._fst.set_output_symbols(symbols)
         return self
 
     def input_label(self, sym):
         """ Get input label for symbol id. """
-        return self.fst.input_symbols().find(sym)
+        return self._fst.input_symbols().find(sym)
 
     def input_index(self, sym):
         """ Get input id for symbol label. """
-        return self.fst.input_symbols().find(sym)
+        return self._fst.input_symbols().find(sym)
 
     def output_label(self, sym):
         """ Get output label for symbol id. """
-        return self.fst.output_symbols().find(sym)
+        return self._fst.output_symbols().find(sym)
 
     def output_index(self, sym):
         """ Get output id for symbol label. """
-        return self.fst.output_symbols().find(sym)
+        return self._fst.output_symbols().find(sym)
 
     # States.
 
     def add_state(self, label=None):
         """ Add new state, optionally specifying its label. """
+        self._mutate(labels=True)
+        if self._state2label is None:
+            return self._add_unlabeled_state(label)
         # Enforce unique labels
         if label is not None:
             if label in self._label2state:
                 return self._label2state[label]
         # Create new state
-        q = self.fst.add_state()
+        q = self._fst.add_state()
         # Self-labeling by string as default
         if label is None:
             label = str(q)
         # State <-> label
-        self._state2label[q] = label
+        self._state2label.append(label)
         self._label2state[label] = q
         return q
 
+    def _add_unlabeled_state(self, label=None):
+        """ Add state to machine without stored labels. """
+        if label is not None:
+            try:
+                return self.state_id(label)
+            except KeyError:
+                pass
+            if label != str(self._fst.num_states()):
+                # Materialize default labels, then add labeled state
+                self._materialize_labels()
+                return self.add_state(label)
+        return self._fst.add_state()
+
+    def _materialize_labels(self):
+        """ Store default labels str(q) of machine without labels. """
+        if self._state2label is not None:
+            return
+        self._state2label = [str(q) for q in range(self._fst.num_states())]
+        self._label2state = {
+            label: q
+            for q, label in enumerate(self._state2label)
+        }
+
     def states(self, labels=True):
         """ Iterator over state labels (or ids). """
-        fst = self.fst
+        fst = self._fst
         if not labels:
             return fst.states()
         return map(lambda q: self.state_label(q), fst.states())
 
     def num_states(self):
-        return self.fst.num_states()
+        return self._fst.num_states()
 
     def set_start(self, q):
         """ Set start state by id or label. """
+        self._mutate()
         if not isinstance(q, int):
             q = self.state_id(q)
-        return self.fst.set_start(q)
+        return self._fst.set_start(q)
 
     def start(self, label=True):
         """ Start state label (or id). """
         if not label:
-            return self.fst.start()
-        return self.state_label(self.fst.start())
+            return self._fst.start()
+        return self.state_label(self._fst.start())
 
     def is_start(self, q):
         """ Check start status by id or label. """
         if not isinstance(q, int):
             q = self.state_id(q)
-        return q == self.fst.start()
+        return q == self._fst.start()
 
     def set_final(self, q, weight=None):
         """ Set final weight of state by id or label. """
+        self._mutate()
         if not isinstance(q, int):
             q = self.state_id(q)
         if weight is None:
             weight = Weight.one(self.weight_type())
-        return self.fst.set_final(q, weight)
+        return self._fst.set_final(q, weight)
 
     def is_final(self, q):
         """ Check final status by id or label. """
         if not isinstance(q, int):
-            q = self.state_id(state)
+            q = self.state_id(q)
         zero = Weight.zero(self.weight_type())
         return self.final(q) != zero
 
@@ -146,13 +315,15 @@ class Wfst():
         """ Final weight of state by id or label. """
         if not isinstance(q, int):
             q = self.state_id(q)
-        return self.fst.final(q)
+        if self._frozen:
+            return self._finals[q]
+        return self._fst.final(q)
 
     def finals(self, labels=True):
         """
         Iterator over states with non-zero final weights.
         """
-        fst = self.fst
+        fst = self._fst
         zero = pynini.Weight.zero(fst.weight_type())
         state_iter = fst.states()
         state_iter = filter(lambda q: fst.final(q) != zero, state_iter)
@@ -162,10 +333,23 @@ class Wfst():
 
     def state_label(self, q):
         """ State label from id. """
-        return self._state2label[q]
+        labels = self._state2label
+        if labels is None:
+            if not 0 <= q < self._fst.num_states():
+                raise KeyError(q)
+            return str(q)
+        if not 0 <= q < len(labels):
+            raise KeyError(q)  # Includes NO_STATE_ID
+        return labels[q]
 
     def state_id(self, q):
         """ State id from label. """
+        if self._label2state is None:
+            # Default label str(q)
+            if isinstance(q, str) and q.isdigit() and q == str(int(q)) \
+                    and int(q) < self._fst.num_states():
+                return int(q)
+            raise KeyError(q)
         return self._label2state[q]
 
     # Arcs.
@@ -177,7 +361,8 @@ class Wfst():
                 weight=None,
                 dest=None):
         """ Add arc (accepts id or label for src/ilabel/olabel/dest). """
-        fst = self.fst
+        self._mutate()
+        fst = self._fst
         if not isinstance(src, int):
             src = self.state_id(src)
         if olabel is None:
@@ -199,28 +384,33 @@ class Wfst():
         # todo: decorate arcs with input/output labels if requested.
         if not isinstance(src, int):
             src = self.state_id(src)
-        return self.fst.arcs(src)
+        if self._frozen:
+            return iter(self._arcs[src])
+        return self._fst.arcs(src)
 
     def mutable_arcs(self, src):
-        """ Mutable iterator over arcs from a state. """
+        """ Mutable iterator over arcs from a state (see fst member). """
+        self._mutate()
         if not isinstance(src, int):
             src = self.state_id(src)
-        return self.fst.mutable_arcs(src)
+        self._exposed_fst = self._fst
+        return self._fst.mutable_arcs(src)
 
     def arcsort(self, sort_type='ilabel'):
         """ Sort arcs from each state. """
-        self.fst.arcsort(sort_type)
+        self._mutate()
+        self._fst.arcsort(sort_type)
         return self
 
     def num_arcs(self, src):
         """ Number of arcs from state. """
         if not isinstance(src, int):
             src = self.state_id(src)
-        return self.fst.num_arcs(src)
+        return self._fst.num_arcs(src)
 
     def num_arcs(self):
         """ Total count of arcs. """
-        fst = self.fst
+        fst = self._fst
         n = 0
         for q in fst.states():
             n += fst.num_arcs(q)
@@ -230,21 +420,21 @@ class Wfst():
         """ Number of arcs with input epsilon from state. """
         if not isinstance(src, int):
             src = self.state_id(src)
-        return self.fst.num_input_epsilons(src)
+        return self._fst.num_input_epsilons(src)
 
     def num_output_epsilons(self, src):
         """ Number of arcs with output epsilon from state. """
         if not isinstance(src, int):
             src = self.state_id(src)
-        return self.fst.num_output_epsilons(src)
+        return self._fst.num_output_epsilons(src)
 
     def arc_type(self):
         """ Arc type (standard, log, log64). """
-        return self.fst.arc_type()
+        return self._fst.arc_type()
 
     def weight_type(self):
         """ Weight type (tropical, log, log64). """
-        return self.fst.weight_type()
+        return self._fst.weight_type()
 
     def map_weights(self, map_type='identity', **kwargs):
         """
@@ -255,19 +445,21 @@ class Wfst():
         # assumption: pynini.arcmap() does not reindex states.
         if map_type == 'identity':
             return self
-        fst = self.fst
+        self._mutate()
+        fst = self._fst
         isymbols = fst.input_symbols()
         osymbols = fst.output_symbols()
         fst_out = pynini.arcmap(fst, map_type=map_type, **kwargs)
         fst_out.set_input_symbols(isymbols)
         fst_out.set_output_symbols(osymbols)
-        self.fst = fst_out
+        self._fst = fst_out
         return self
 
     def project(self, project_type):
         """ Project input or output labels. """
+        self._mutate()
         # assumption: Fst.project() does not reindex states.
-        fst = self.fst
+        fst = self._fst
         if project_type == 'input':
             isymbols = fst.input_symbols()
             fst.set_output_symbols(isymbols)
@@ -285,7 +477,7 @@ class Wfst():
         Path iterator has methods: ilabels(), istring(), labels(), 
         ostring(), weights(), items(); istrings(), ostrings().
         """
-        fst = self.fst
+        fst = self._fst
         isymbols = fst.input_symbols()
         osymbols = fst.output_symbols()
         strpath_iter = fst.paths(
@@ -310,9 +502,10 @@ class Wfst():
         """
         Strings accepted on input (default) or output, up to max_len 
         (not including bos/eos); cf. paths() for acyclic machines. 
-        todo: epsilon handling
+        Epsilons on the given side are skipped, following epsilon arcs 
+        without regard to their weights (see _reachable_closure).
         """
-        fst = self.fst
+        fst = self._fst
         q0 = fst.start()
         Zero = Weight.zero(fst.weight_type())
 
@@ -321,25 +514,193 @@ class Wfst():
         prefixes_new = set()
         for _ in range(max_len + 2):
             for (src, prefix) in prefixes:
-                for t in fst.arcs(src):
-                    dest = t.nextstate
-                    if side == 'input':
-                        tlabel = self.input_label(t.ilabel)
-                    else:
-                        tlabel = self.output_label(t.olabel)
-                    if prefix is None:
-                        prefix_new = tlabel
-                    else:
-                        prefix_new = prefix + ' ' + tlabel
-                    prefixes_new.add((dest, prefix_new))
-                    if fst.final(dest) != Zero:
-                        accepted.add(prefix_new)
-                        #print(prefix_new)
+                for q in self._reachable_closure(src, side):
+                    for t in fst.arcs(q):
+                        if side == 'input':
+                            if t.ilabel == 0:
+                                continue
+                            tlabel = self.input_label(t.ilabel)
+                        else:
+                            if t.olabel == 0:
+                                continue
+                            tlabel = self.output_label(t.olabel)
+                        dest = t.nextstate
+                        if prefix is None:
+                            prefix_new = tlabel
+                        else:
+                            prefix_new = prefix + ' ' + tlabel
+                        prefixes_new.add((dest, prefix_new))
+                        for q2 in self._reachable_closure(dest, side):
+                            if fst.final(q2) != Zero:
+                                accepted.add(prefix_new)
+                                break
             prefixes, prefixes_new = prefixes_new, prefixes
             prefixes_new.clear()
 
         return accepted
 
+    def epsilon_closure(self, q, side=None):
+        """
+        Epsilon closure of state (by id or label) as dictionary from ids 
+        of states reachable on epsilon arcs (including q itself) to 
+        shortest distances (float weights). Arcs must have epsilon on 
+        both sides (side=None), or only on the 'input' or 'output' side. 
+        Closures are cached per state until the machine is modified. 
+        Raises ValueError if an epsilon cycle makes distances diverge 
+        (negative weight, or non-positive weight in the log semiring).
+        """
+        if not isinstance(q, int):
+            q = self.state_id(q)
+        if self._frozen:
+            # Cache shared by concurrent readers
+            with self._lock:
+                return self._epsilon_closure(q, side)
+        return self._epsilon_closure(q, side)
+
+    def _epsilon_closure(self, q, side):
+        if side not in self._closure:
+            self._closure[side] = {}
+        cache = self._closure[side]
+        if q in cache:
+            return cache[q]
+
+        # Epsilon arcs of states reachable from q on them
+        fst = self._fst
+        weight_type = fst.weight_type()
+        eps_arcs = {}
+        stack = [q]
+        while len(stack) != 0:
+            src = stack.pop()
+            if src in eps_arcs:
+                continue
+            eps_arcs[src] = arcs = []
+            for t in fst.arcs(src):
+                if side != 'output' and t.ilabel != 0:
+                    continue
+                if side != 'input' and t.olabel != 0:
+                    continue
+                arcs.append((t.nextstate, float(t.weight)))
+                stack.append(t.nextstate)
+
+        # Generic single-source shortest distance (Mohri 2002)
+        # restricted to epsilon arcs, with at most |Q|·|E| relaxations
+        # (Bellman-Ford bound) times the passes allowed for cycles to
+        # converge in the log semiring
+        num_arcs = sum(len(arcs) for arcs in eps_arcs.values())
+        max_relax = len(eps_arcs) * num_arcs
+        if weight_type != 'tropical':
+            max_relax *= _closure_passes
+        relax = 0
+        plus = _plus(weight_type)
+        inf = float('inf')
+        dist = {q: 0.0}
+        resid = {q: 0.0}
+        queue = deque([q])
+        while len(queue) != 0:
+            src = queue.popleft()
+            r = resid.pop(src)
+            for (dest, weight) in eps_arcs[src]:
+                w = r + weight
+                d_old = dist.get(dest, inf)
+                d_new = plus(d_old, w)
+                if d_old != inf and abs(d_new - d_old) <= 1e-6:
+                    continue
+                relax += 1
+                if relax > max_relax or not d_new > -inf:
+                    raise ValueError(
+                        f'Epsilon closure of state {self.state_label(q)} '
+                        f'does not converge (divergent epsilon cycle)')
+                dist[dest] = d_new
+                if dest in resid:
+                    resid[dest] = plus(resid[dest], w)
+                else:
+                    resid[dest] = w
+                    queue.append(dest)
+        cache[q] = dist
+        return dist
+
+    def _reachable_closure(self, q, side):
+        """
+        Ids of states reachable from state id q on arcs with epsilon on 
+        the given side (unweighted, so any epsilon cycle is allowed), 
+        cached per side along with epsilon closures.
+        """
+        if self._frozen:
+            with self._lock:
+                return self._reachable_closure_(q, side)
+        return self._reachable_closure_(q, side)
+
+    def _reachable_closure_(self, q, side):
+        key = ('reachable', side)
+        if key not in self._closure:
+            self._closure[key] = {}
+        cache = self._closure[key]
+        if q in cache:
+            return cache[q]
+        fst = self._fst
+        closure = {q}
+        stack = [q]
+        while len(stack) != 0:
+            src = stack.pop()
+            for t in fst.arcs(src):
+                label = t.ilabel if side == 'input' else t.olabel
+                if label == 0 and t.nextstate not in closure:
+                    closure.add(t.nextstate)
+                    stack.append(t.nextstate)
+        closure = cache[q] = frozenset(closure)
+        return closure
+
+    def rmepsilon(self):
+        """
+        Remove arcs with epsilon on both sides, preserving the labels of 
+        surviving states (the start state and states with incoming 
+        non-epsilon arcs). [nondestructive]
+        """
+        fst = self._fst
+        weight_type = fst.weight_type()
+        plus = _plus(weight_type)
+        inf = float('inf')
+        q0 = fst.start()
+        wfst = Wfst(fst.input_symbols(),
+                    fst.output_symbols(),
+                    fst.arc_type(),
+                    tier=self.tier)
+        if q0 == pynini.NO_STATE_ID:
+            return wfst
+
+        # Surviving states
+        live_states = {q0}
+        for q in fst.states():
+            for t in fst.arcs(q):
+                if t.ilabel != 0 or t.olabel != 0:
+                    live_states.add(t.nextstate)
+        for q in sorted(live_states):
+            wfst.add_state(self.state_label(q))
+        wfst.set_start(self.state_label(q0))
+
+        # Arcs and final weights through epsilon closures
+        for q in sorted(live_states):
+            src = wfst.state_id(self.state_label(q))
+            arcs = {}
+            final = inf
+            for (p, d) in self.epsilon_closure(q).items():
+                final = plus(final, d + float(fst.final(p)))
+                for t in fst.arcs(p):
+                    if t.ilabel == 0 and t.olabel == 0:
+                        continue
+                    key = (t.ilabel, t.olabel, t.nextstate)
+                    arcs[key] = plus(
+                        arcs.get(key, inf), d + float(t.weight))
+            if final != inf:
+                wfst.set_final(src, Weight(weight_type, final))
+            for (ilabel, olabel, q2), w in arcs.items():
+                dest = wfst.state_id(self.state_label(q2))
+                wfst.add_arc(src, ilabel, olabel, Weight(weight_type, w),
+                             dest)
+
+        return wfst.connect()
+
+    @instrument.operation('connect')
     def connect(self):
         """
         Remove states and arcs not on successful paths. [nondestructive]
@@ -347,16 +708,17 @@ class Wfst():
         accessible = self.accessible(forward=True)
         coaccessible = self.accessible(forward=False)
         live_states = accessible & coaccessible
-        dead_states = set(self.fst.states()) - live_states
+        dead_states = set(self._fst.states()) - live_states
         wfst = self.delete_states(dead_states, connect=False)
         return wfst
 
+    @instrument.operation('accessible')
     def accessible(self, forward=True):
         """
         Ids of states accessible from initial state (forward) 
         -or- coaccessible from final states (backward).
         """
-        fst = self.fst
+        fst = self._fst
 
         if forward:
             # Initial state id; forward transitions
@@ -382,6 +744,7 @@ class Wfst():
         Q_old = set()
         Q_new = set(Q)
         while len(Q_new) != 0:
+            instrument.frontier(len(Q_new))
             Q_old, Q_new = Q_new, Q_old
             Q_new.clear()
             for src in filter(lambda q1: q1 in T, Q_old):
@@ -390,15 +753,19 @@ class Wfst():
                     Q_new.add(dest)
         return Q
 
+    @instrument.operation('delete_states')
     def delete_states(self, states, connect=True):
         """
         Remove states by id while preserving labels. [nondestructive]
         """
-        fst = self.fst
+        fst = self._fst
         live_states = set(fst.states()) - states
 
-        # Preserve input/output symbols and weight type
-        wfst = Wfst(fst.input_symbols(), fst.output_symbols(), fst.arc_type())
+        # Preserve input/output symbols, weight type and tier
+        wfst = Wfst(fst.input_symbols(),
+                    fst.output_symbols(),
+                    fst.arc_type(),
+                    tier=self.tier)
 
         # Reindex live states, copying labels
         state_map = {}
@@ -419,9 +786,10 @@ class Wfst():
                 wfst.add_arc(src, t.ilabel, t.olabel, t.weight, dest)
 
         if connect:
-            wfst.connect()
+            wfst = wfst.connect()
         return wfst
 
+    @instrument.operation('delete_arcs')
     def delete_arcs(self, dead_arcs):
         """
         Remove arcs. [destructive]
@@ -429,7 +797,8 @@ class Wfst():
         back all non-dead arcs, as suggested in the OpenFst forum: 
         https://www.openfst.org/twiki/bin/view/Forum/FstForumArchive2014
         """
-        fst = self.fst
+        self._mutate()
+        fst = self._fst
 
         # Group dead arcs by source state
         dead_arcs_ = {}
@@ -455,23 +824,37 @@ class Wfst():
                                  t1.nextstate)
         return self
 
-    def transduce(self, x, add_delim=True, output_strings=True):
+    @instrument.operation('transduce')
+    def transduce(self, x, add_delim=True, output_strings=True,
+                  alphabet=None):
         """
         Transduce space-separated sequence x with this machine, 
         returning iterator over output strings (default) or resulting 
         machine that preserves input/output labels but not state labels. 
         Alternative: create acceptor for string with accep(), then 
         compose() with this machine to preserve input/output/state labels.
+        Delimiters are from alphabet (config.Alphabet) if specified. 
+        Symbols of x outside of the tier of this machine pass through. 
+        Raises ValueError if x has symbols not in the input symbol table.
         """
-        fst = self.fst
+        if alphabet is None:
+            alphabet = config
+        fst = self._fst
         isymbols = fst.input_symbols()
         osymbols = fst.output_symbols()
 
         if not isinstance(x, str):
             x = ' '.join(x)
         if add_delim:
-            x = config.bos + ' ' + x + ' ' + config.eos
+            x = alphabet.bos + ' ' + x + ' ' + alphabet.eos
+        syms = set(x.split())
+        for sym in syms:
+            if not isymbols.member(sym):
+                raise ValueError(f'Unknown input symbol {sym}')
         fst_in = pynini.accep(x, token_type=isymbols)
+        if self.tier is not None:
+            # Explicit self-loops for off-tier symbols of x
+            fst = self._pass_through(syms - self.tier)._fst
 
         fst_out = fst_in @ fst
         fst_out.set_input_symbols(isymbols)
@@ -479,9 +862,142 @@ class Wfst():
         if output_strings:
             strpath_iter = fst_out.paths(output_token_type=osymbols)
             return strpath_iter.ostrings()
-        wfst = Wfst.from_fst(fst_out)
+        wfst = Wfst._wrap_fst(fst_out)
         return wfst
 
+    def _pass_through(self, syms):
+        """
+        Copy with identity self-loops on every state (explicit form of 
+        off-tier symbols, see tier) for all off-tier symbols of the input 
+        symbol table, including syms. The copy is cached until this 
+        machine is modified, and rebuilt only if syms are not covered 
+        (e.g., symbols were added to the table). Epsilon is symbol id 0 
+        of the input symbol table, whatever its name.
+        """
+        syms = set(syms)
+        syms.discard(self._fst.input_symbols().find(0))
+        cache = self._pass
+        if cache is not None and syms <= cache[0]:
+            return cache[1]
+        if self._frozen:
+            # Cache shared by concurrent readers
+            with self._lock:
+                cache = self._pass
+                if cache is not None and syms <= cache[0]:
+                    return cache[1]
+                return self._build_pass_through(syms)
+        return self._build_pass_through(syms)
+
+    def _build_pass_through(self, syms):
+        syms |= set(sym for (sym_id, sym) in self._fst.input_symbols()
+                    if sym_id != 0) - self.tier
+        wfst = self.copy()
+        isymbols = wfst.input_symbols()
+        sym_ids = [isymbols.find(sym) for sym in syms]
+        wfst._mutate()
+        fst = wfst._fst
+        one = Weight.one(fst.weight_type())
+        for q in fst.states():
+            for sym_id in sym_ids:
+                fst.add_arc(q, Arc(sym_id, sym_id, one, q))
+        fst.arcsort('ilabel')
+        self._pass = (frozenset(syms), wfst)
+        return wfst
+
+    def potentials(self, reverse=False):
+        """
+        Shortest (Viterbi / tropical) distances as floats, indexed by 
+        state id, from the start state (forward) -or- to final states 
+        including final weights (reverse). Weights of log machines are 
+        treated as tropical. Unreachable states have distance inf.
+        """
+        fst = self._fst
+        inf = float('inf')
+        n = fst.num_states()
+        dist = [inf] * n
+        if reverse:
+            # Backward transitions
+            T = [[] for _ in range(n)]
+            for src in fst.states():
+                for t in fst.arcs(src):
+                    T[t.nextstate].append((src, float(t.weight)))
+            for q in fst.states():
+                dist[q] = float(fst.final(q))
+            queue = deque(q for q in fst.states() if dist[q] != inf)
+        else:
+            T = [[(t.nextstate, float(t.weight)) for t in fst.arcs(src)]
+                 for src in fst.states()]
+            q0 = fst.start()
+            if q0 == pynini.NO_STATE_ID:
+                return dist
+            dist[q0] = 0.0
+            queue = deque([q0])
+
+        # Label-correcting relaxation (handles cycles and negative weights
+        # without negative cycles)
+        queued = set(queue)
+        while len(queue) != 0:
+            src = queue.popleft()
+            queued.discard(src)
+            d = dist[src]
+            for (dest, w) in T[src]:
+                if d + w < dist[dest]:
+                    dist[dest] = d + w
+                    if dest not in queued:
+                        queued.add(dest)
+                        queue.append(dest)
+        return dist
+
+    def prune(self, weight_threshold=None, state_threshold=None):
+        """
+        Remove arcs, final weights, and states that are not on any 
+        path within weight_threshold of the best (Viterbi) path, and keep 
+        at most state_threshold states (those on the best paths), 
+        preserving labels. Uses forward and backward potentials (see 
+        potentials). [nondestructive]
+        """
+        fst = self._fst
+        inf = float('inf')
+        alpha = self.potentials()
+        beta = self.potentials(reverse=True)
+        q0 = fst.start()
+        if q0 == pynini.NO_STATE_ID or beta[q0] == inf:
+            return self.connect()
+        best = beta[q0]
+        if weight_threshold is None:
+            limit = inf
+        else:
+            limit = best + weight_threshold
+
+        # States and arcs outside of threshold
+        dead_states = set()
+        for q in fst.states():
+            if not alpha[q] + beta[q] <= limit:
+                dead_states.add(q)
+        if state_threshold is not None:
+            live_states = sorted(
+                set(fst.states()) - dead_states,
+                key=lambda q: (alpha[q] + beta[q], q))
+            dead_states |= set(live_states[state_threshold:])
+        dead_arcs = []
+        dead_finals = []
+        for q in fst.states():
+            if q in dead_states:
+                continue
+            for t in fst.arcs(q):
+                if not alpha[q] + float(t.weight) + beta[t.nextstate] <= limit:
+                    dead_arcs.append((q, t))
+            final = float(fst.final(q))
+            if final != inf and not alpha[q] + final <= limit:
+                dead_finals.append(q)
+
+        wfst = self.copy()
+        wfst.delete_arcs(dead_arcs)
+        zero = Weight.zero(wfst.weight_type())
+        for q in dead_finals:
+            wfst.set_final(q, zero)
+        return wfst.delete_states(dead_states)
+
     def push_weights(self, reweight_type='to_initial', **kwargs):
         """
         Push weights (see Fst.push, pynini.push). [destructive]
@@ -497,10 +1013,11 @@ class Wfst():
         pynini.push() arguments: remove_common_affix (False), 
         reweight_type ("to_initial" or "to_final")
         """
+        self._mutate()
         # assumption: pynini.push() does not reindex states.
         # todo: test
-        self.fst = pynini.push(
-            self.fst, push_labels=True, reweight_type=reweight_type, **kwargs)
+        self._fst = pynini.push(
+            self._fst, push_labels=True, reweight_type=reweight_type, **kwargs)
         return self
 
     def randgen(self, npath=1, select=None, output_strings=True, **kwargs):
@@ -511,7 +1028,7 @@ class Wfst():
         "log_prob", or "fast_log_prob"), max_length, weighted, 
         remove_total_weight
         """
-        fst = self.fst
+        fst = self._fst
         if select is None:
             if fst.weight_type() == 'log' or fst.weight_type() == 'log64':
                 select = 'log_prob'
@@ -524,13 +1041,14 @@ class Wfst():
             osymbols = fst.output_symbols()
             strpath_iter = fst_samp.paths(output_token_type=osymbols)
             return strpath_iter.ostrings()
-        wfst_samp = Wfst.from_fst(fst_samp)
+        wfst_samp = Wfst._wrap_fst(fst_samp)
         return wfst_samp
 
     def invert(self):
         """ Invert mapping (exchange input and output labels). """
+        self._mutate()
         # assumption: Fst.invert() does not reindex states.
-        fst = self.fst
+        fst = self._fst
         isymbols = fst.input_symbols()
         osymbols = fst.output_symbols()
         fst.invert()
@@ -538,44 +1056,551 @@ class Wfst():
         fst.set_output_symbols(osymbols)
         return self
 
+    @instrument.operation('determinize')
+    def determinize(self, max_states=None, delta=_DELTA):
+        """
+        Determinize by weighted subset construction over input/output
+        label pairs (transducers are determinized as acceptors of label
+        pairs; epsilons are treated as ordinary labels). Each state of the
+        result is labeled with the frozenset of labels of the original
+        states it represents, or the frozenset of (label, residual weight)
+        pairs if some residual weight is not one (residuals are quantized
+        by delta, 1/1024 as in OpenFst). If max_states is given,
+        construction stops once the result has that many states and the
+        partial machine is returned, with unexpanded states lacking
+        outgoing arcs; truncated is then True for the result (False for
+        machines otherwise, kept by copy and pickling) and a
+        RuntimeWarning is issued. [nondestructive]
+        """
+        fst = self._fst
+        isymbols = fst.input_symbols()
+        osymbols = fst.output_symbols()
+        weight_type = fst.weight_type()
+        plus = _plus(weight_type)
+        inf = float('inf')
+        wfst = Wfst(isymbols, osymbols, fst.arc_type(), tier=self.tier)
+        if fst.start() == pynini.NO_STATE_ID:
+            return wfst
+
+        def add_subset(subset):
+            # Subset: list of (state id, residual weight); keyed by
+            # states and residuals quantized by delta
+            subset.sort()
+            key = tuple((q, round(r / delta)) for (q, r) in subset)
+            if key in subset_ids:
+                return subset_ids[key], False
+            if max_states is not None and len(subset_ids) >= max_states:
+                return None, False
+            if all(k == 0 for (_, k) in key):
+                label = frozenset(self.state_label(q) for (q, _) in subset)
+            else:
+                label = frozenset((self.state_label(q), k * delta)
+                                  for (q, k) in key)
+            q_new = wfst.add_state(label)
+            subset_ids[key] = q_new
+            final = inf
+            for (q, r) in subset:
+                final = plus(final, r + float(fst.final(q)))
+            if final != inf:
+                wfst.set_final(q_new, Weight(weight_type, final))
+            return q_new, True
+
+        subset_ids = {}
+        subset0 = [(fst.start(), 0.0)]
+        q0, _ = add_subset(subset0)
+        wfst.set_start(q0)
+        queue = deque([(q0, subset0)])
+        truncated = False
+        while len(queue) != 0 and not truncated:
+            src, subset = queue.popleft()
+            # Group weighted destinations by label pair
+            dests = {}
+            for (q, r) in subset:
+                for t in fst.arcs(q):
+                    key = (t.ilabel, t.olabel)
+                    if key not in dests:
+                        dests[key] = {}
+                    dest = dests[key]
+                    w = r + float(t.weight)
+                    dest[t.nextstate] = plus(dest.get(t.nextstate, inf), w)
+            for (ilabel, olabel), dest in dests.items():
+                w = inf
+                for v in dest.values():
+                    w = plus(w, v)
+                if w == inf:
+                    continue
+                subset_new = [(q, v - w) for (q, v) in dest.items()]
+                q_new, is_new = add_subset(subset_new)
+                if q_new is None:
+                    truncated = True
+                    break
+                wfst.add_arc(src, ilabel, olabel, Weight(weight_type, w),
+                             q_new)
+                if is_new:
+                    queue.append((q_new, subset_new))
+
+        if truncated:
+            warnings.warn(
+                f'determinize: exceeded max_states ({max_states}), '
+                'returning partial result', RuntimeWarning)
+        wfst.truncated = truncated
+        return wfst
+
+    @instrument.operation('minimize')
+    def minimize(self, representative=False, delta=_DELTA):
+        """
+        Minimize deterministic machine, labeling each state of the result
+        with the frozenset of labels of the original states that it
+        absorbed (or, if representative is True, with the label of the
+        lowest-numbered such state). Weights are pushed toward the
+        initial state, with the total weight kept on final weights so
+        that no super-initial state is needed; then arcs (label pair,
+        weight quantized by delta, 1/1024 as in OpenFst) and final
+        weights are encoded as labels of an unweighted acceptor, which
+        Fst.minimize() reduces without adding states. Transducers are
+        minimized over input / output label pairs. [nondestructive]
+        """
+        wfst = self.connect()
+        fst = wfst._fst
+        isymbols = fst.input_symbols()
+        osymbols = fst.output_symbols()
+        weight_type = fst.weight_type()
+        q0 = fst.start()
+        if q0 == pynini.NO_STATE_ID:
+            return wfst
+
+        # Potentials (shortest distances to final states)
+        dist = [
+            float(d) for d in pynini.shortestdistance(fst, reverse=True)
+        ]
+        total = dist[q0]
+
+        # Encoded acceptor: arcs with codes for (ilabel, olabel, pushed
+        # weight), final weights as arcs to a new super-final state
+        codes = {}  # (ilabel, olabel, quantized weight) -> code
+        code2arc = [None]  # Code -> (ilabel, olabel, weight) or final
+        fst_enc = Fst()
+        for q in fst.states():
+            fst_enc.add_state()
+        qf = fst_enc.add_state()
+        fst_enc.set_start(q0)
+        fst_enc.set_final(qf)
+        one = Weight.one(fst_enc.weight_type())
+        for q in fst.states():
+            pairs = set()
+            for t in fst.arcs(q):
+                if (t.ilabel, t.olabel) in pairs:
+                    raise ValueError('minimize() requires a deterministic '
+                                     'machine (see determinize)')
+                pairs.add((t.ilabel, t.olabel))
+                w = float(t.weight) + dist[t.nextstate] - dist[q]
+                code = _minimize_code(codes, code2arc,
+                                      (t.ilabel, t.olabel, round(w / delta)),
+                                      (t.ilabel, t.olabel, w))
+                fst_enc.add_arc(q, Arc(code, code, one, t.nextstate))
+            final = float(fst.final(q))
+            if final != float('inf'):
+                w = final - dist[q]
+                code = _minimize_code(codes, code2arc,
+                                      (None, None, round(w / delta)),
+                                      (None, None, w))
+                fst_enc.add_arc(q, Arc(code, code, one, qf))
+        fst_enc.arcsort('ilabel')  # Required by cyclic minimization
+        fst_min = fst_enc.copy()
+        fst_min.minimize()
+
+        # Provenance: traverse deterministic original and minimized
+        # machines in parallel, mapping each original state to the
+        # minimized state reached by the same code sequence
+        state_map = {q0: fst_min.start()}
+        stack = [q0]
+        while len(stack) != 0:
+            q = stack.pop()
+            dests = {t.ilabel: t.nextstate for t in fst_min.arcs(state_map[q])}
+            for t in fst_enc.arcs(q):
+                if t.nextstate not in state_map:
+                    state_map[t.nextstate] = dests[t.ilabel]
+                    stack.append(t.nextstate)
+        rf = state_map.pop(qf)
+        absorbed = {}
+        for q in sorted(state_map):
+            r = state_map[q]
+            if r not in absorbed:
+                absorbed[r] = []
+            absorbed[r].append(wfst.state_label(q))
+
+        # Decode, with the total weight multiplied into final weights
+        wfst_min = Wfst(isymbols, osymbols, fst.arc_type(), tier=self.tier)
+        for r in fst_min.states():
+            if r == rf:
+                continue
+            if representative:
+                label = absorbed[r][0]
+            else:
+                label = frozenset(absorbed[r])
+            wfst_min.add_state(label)
+        state_ids = [None] * fst_min.num_states()
+        for q, r in enumerate(sorted(absorbed)):
+            state_ids[r] = q
+        wfst_min.set_start(state_ids[fst_min.start()])
+        for r in fst_min.states():
+            if r == rf:
+                continue
+            src = state_ids[r]
+            for t in fst_min.arcs(r):
+                (ilabel, olabel, w) = code2arc[t.ilabel]
+                if t.nextstate == rf:
+                    wfst_min.set_final(src, Weight(weight_type, w + total))
+                else:
+                    wfst_min.add_arc(src, ilabel, olabel,
+                                     Weight(weight_type, w),
+                                     state_ids[t.nextstate])
+        return wfst_min
+
+    def encode(self, labels=True, weights=False, encoder=None):
+        """
+        Encode arc labels and/or weights as single labels (cf. 
+        pynini.EncodeMapper), returning encoded copy with the same state 
+        ids and labels, and the Encoder used. Passing an existing encoder 
+        reuses (and extends) its codes. Encoded transducers are acceptors 
+        when labels are encoded. [nondestructive]
+        """
+        fst = self._fst
+        if encoder is None:
+            encoder = Encoder(fst.input_symbols(), fst.output_symbols(),
+                              fst.weight_type(), labels, weights)
+        wfst = self.copy()
+        wfst._mutate()
+        fst_enc = wfst._fst
+        for q in fst_enc.states():
+            arc_iter = fst_enc.mutable_arcs(q)
+            while not arc_iter.done():
+                arc_iter.set_value(encoder.encode_arc(arc_iter.value()))
+                arc_iter.next()
+        symbols = encoder.symbols()
+        fst_enc.set_input_symbols(symbols)
+        if encoder.encode_labels:
+            fst_enc.set_output_symbols(symbols)
+        return wfst, encoder
+
+    def decode(self, encoder):
+        """
+        Decode machine encoded with encoder (see encode), restoring 
+        original arc labels, weights, and symbol tables. [nondestructive]
+        """
+        wfst = self.copy()
+        wfst._mutate()
+        fst = wfst._fst
+        for q in fst.states():
+            arc_iter = fst.mutable_arcs(q)
+            while not arc_iter.done():
+                arc_iter.set_value(encoder.decode_arc(arc_iter.value()))
+                arc_iter.next()
+        fst.set_input_symbols(encoder.input_symbols())
+        fst.set_output_symbols(encoder.output_symbols())
+        return wfst
+
     # Copying/creating
 
     def copy(self):
         """
-        Deep copy preserving input/output/state symbols and string outputs.
+        Copy preserving input/output/state symbols and string outputs. 
+        The Fst and state labels are shared (copy-on-write) until either 
+        machine is mutated: add_arc, set_final, map_weights, etc. (and 
+        access to the fst member) take a private Fst, add_state also 
+        takes private state labels. If the Fst of this machine was 
+        handed out by the fst member (or from_fst), callers may still 
+        modify it, so the copy takes a private Fst at once. Copies of 
+        frozen machines are mutable.
         """
-        fst = self.fst
-        wfst = Wfst(fst.input_symbols(), fst.output_symbols(), fst.arc_type())
-        wfst.fst = fst.copy()
-        wfst._state2label = dict(self._state2label)
-        wfst._label2state = dict(self._label2state)
+        fst = self._fst
+        share_fst = fst is not self._exposed_fst
+        wfst = Wfst(fst.input_symbols(),
+                    fst.output_symbols(),
+                    fst.arc_type(),
+                    tier=self.tier)
+        wfst._fst = fst if share_fst else _detached_copy(fst)
+        wfst._state2label = self._state2label
+        wfst._label2state = self._label2state
         wfst.sigma = dict(self.sigma)
+        wfst.truncated = self.truncated
+        wfst._shared_fst = share_fst
+        wfst._shared_labels = True
+        if not self._frozen:
+            # Frozen machines are never modified, so need not unshare
+            if share_fst:
+                self._shared_fst = True
+            self._shared_labels = True
         return wfst
 
     @classmethod
     def from_fst(cls, fst):
-        """ Wrap pynini Fst. """
-        wfst = Wfst(fst.input_symbols(), fst.output_symbols(), fst.arc_type())
-        state2label = {q: str(q) for q in fst.states()}
-        label2state = {v: k for k, v in state2label.items()}
-        wfst.fst = fst
-        wfst._state2label = state2label
-        wfst._label2state = label2state
+        """
+        Wrap pynini Fst in constant time, with default state labels str(q) 
+        computed on lookup (see labels=False in Wfst()).
+        """
+        wfst = cls._wrap_fst(fst)
+        wfst._exposed_fst = fst  # Held by caller (see copy)
+        return wfst
+
+    @classmethod
+    def _wrap_fst(cls, fst):
+        """ Wrap Fst not held elsewhere, which copies may share. """
+        wfst = Wfst(fst.input_symbols(),
+                    fst.output_symbols(),
+                    fst.arc_type(),
+                    labels=False)
+        wfst._fst = fst
         return wfst
 
     def to_fst(self):
         """ Copy and return wrapped pynini Fst. """
         # note: access fst member if do not need copy
-        return self.fst.copy()
+        return self._fst.copy()
+
+    def to_arrays(self):
+        """
+        Arcs and final weights as NumPy arrays (requires numpy). Returns 
+        dict with columns src, ilabel, olabel, weight (float), dest of arcs 
+        in state order, final (float weight of each state, inf if not 
+        final), start (state id, -1 if none), and labels (state labels 
+        in id order, or None if all are the default str(q)). Arcs are 
+        read in bulk from the binary form of a ConstFst copy rather than 
+        arc by arc. See from_arrays().
+        """
+        import numpy as np
+        fst = self._fst.copy()
+        fst.set_input_symbols(None)
+        fst.set_output_symbols(None)
+        data = pywrapfst.convert(fst, 'const').write_to_string()
+        header, offset = _read_fst_header(data)
+        n = header['num_states']
+        m = header['num_arcs']
+        w = _weight_dtype(header['arc_type'])
+        state_dtype = np.dtype([('final', w), ('pos', '<u4'), ('narcs', '<u4'),
+                                ('niepsilons', '<u4'), ('noepsilons', '<u4')],
+                               align=True)
+        arc_dtype = np.dtype([('ilabel', '<i4'), ('olabel', '<i4'),
+                              ('weight', w), ('nextstate', '<i4')],
+                             align=True)
+        states = np.frombuffer(data, state_dtype, n, offset)
+        offset += n * state_dtype.itemsize
+        arcs = np.frombuffer(data, arc_dtype, m, offset)
+        labels = self._state2label
+        if labels is not None and \
+                any(label != str(q) for q, label in enumerate(labels)):
+            labels = list(labels)
+        else:
+            labels = None
+        return {
+            'src': np.repeat(np.arange(n, dtype=np.int32), states['narcs']),
+            'ilabel': arcs['ilabel'].copy(),
+            'olabel': arcs['olabel'].copy(),
+            'weight': arcs['weight'].astype(np.float64),
+            'dest': arcs['nextstate'].copy(),
+            'final': states['final'].astype(np.float64),
+            'start': header['start'],
+            'labels': labels
+        }
+
+    @classmethod
+    def from_arrays(cls,
+                    src,
+                    ilabel,
+                    olabel,
+                    weight,
+                    dest,
+                    final,
+                    start=0,
+                    labels=None,
+                    input_symtable=None,
+                    output_symtable=None,
+                    arc_type='standard'):
+        """
+        Machine from arc columns and final weights as returned by 
+        to_arrays() (requires numpy). Arcs can be in any order; weights 
+        are floats (inf for zero). State i has label labels[i], or the 
+        default str(i) if labels is None. The Fst is built in bulk by 
+        assembling its binary form rather than arc by arc. Raises 
+        ValueError if columns differ in length, or if states or labels 
+        are out of range (labels are checked against the symbol tables 
+        when given).
+        """
+        import numpy as np
+        src = np.asarray(src, dtype=np.int64)
+        ilabel = np.asarray(ilabel, dtype=np.int64)
+        olabel = np.asarray(olabel, dtype=np.int64)
+        weight = np.asarray(weight, dtype=np.float64)
+        dest = np.asarray(dest, dtype=np.int64)
+        final = np.asarray(final, dtype=np.float64)
+        n = len(final)
+        m = len(src)
+        # Validation
+        if any(len(col) != m for col in (ilabel, olabel, weight, dest)):
+            raise ValueError('Arc columns must have the same length')
+        if not -1 <= start < n:
+            raise ValueError(f'Start state {start} out of range')
+        if m != 0:
+            if src.min() < 0 or src.max() >= n:
+                raise ValueError('Arc source state out of range')
+            if dest.min() < 0 or dest.max() >= n:
+                raise ValueError('Arc destination state out of range')
+            for (col, symtable, side) in \
+                    [(ilabel, input_symtable, 'input'),
+                     (olabel, output_symtable or input_symtable, 'output')]:
+                if col.min() < 0:
+                    raise ValueError(f'Negative {side} label')
+                if symtable is not None and \
+                        col.max() >= symtable.available_key():
+                    raise ValueError(f'{side.capitalize()} label '
+                                     f'{col.max()} not in symbol table')
+        # Arcs grouped by source state
+        order = None
+        if m > 1 and np.any(src[1:] < src[:-1]):
+            order = np.argsort(src, kind='stable')
+            src = src[order]
+        narcs = np.bincount(src, minlength=n)
+
+        # Binary VectorFst: per state, final weight and number of arcs
+        # followed by (ilabel, olabel, weight, nextstate) of each arc
+        w = _weight_dtype(arc_type)
+        state_dtype = np.dtype([('final', w), ('narcs', '<i8')])
+        arc_dtype = np.dtype([('ilabel', '<i4'), ('olabel', '<i4'),
+                              ('weight', w), ('nextstate', '<i4')])
+        states = np.empty(n, state_dtype)
+        states['final'] = final
+        states['narcs'] = narcs
+        arcs = np.empty(m, arc_dtype)
+        for (field, col) in [('ilabel', ilabel), ('olabel', olabel),
+                             ('weight', weight), ('nextstate', dest)]:
+            col = np.asarray(col)
+            arcs[field] = col if order is None else col[order]
+        # Interleave state and arc bytes: mark bytes of each state record
+        size = states.nbytes + arcs.nbytes
+        state_pos = np.zeros(n, dtype=np.int64)
+        np.cumsum(state_dtype.itemsize + narcs[:-1] * arc_dtype.itemsize,
+                  out=state_pos[1:])
+        delta = np.zeros(size + 1, dtype=np.int8)
+        delta[state_pos] = 1
+        delta[state_pos + state_dtype.itemsize] -= 1
+        mask = np.cumsum(delta[:-1], dtype=np.int8).view(np.bool_)
+        body = np.empty(size, dtype=np.uint8)
+        body[mask] = states.view(np.uint8)
+        body[~mask] = arcs.view(np.uint8)
+        data = _fst_header('vector', arc_type, start, n) + body.tobytes()
+
+        fst = Fst.read_from_string(data)
+        wfst = Wfst(input_symtable, output_symtable, arc_type, labels=False)
+        fst.set_input_symbols(wfst.input_symbols())
+        fst.set_output_symbols(wfst.output_symbols())
+        wfst._fst = fst
+        if labels is not None:
+            if len(labels) != n:
+                raise ValueError(
+                    'Number of labels must equal number of states')
+            wfst._state2label = list(labels)
+            wfst._label2state = {
+                label: q
+                for q, label in enumerate(wfst._state2label)
+            }
+        return wfst
+
+    def write_mmap(self, path):
+        """
+        Write to file in the layout read by open_mmap()
+        (see mmap_wfst.write_mmap).
+        """
+        from .mmap_wfst import write_mmap
+        return write_mmap(self, path)
+
+    @classmethod
+    def open_mmap(cls, path):
+        """
+        Open file written by write_mmap() as read-only machine backed by
+        memory-mapped arrays shared across processes (see MmapWfst).
+        """
+        from .mmap_wfst import open_mmap
+        return open_mmap(path)
+
+    def share(self):
+        """
+        Read-only copy in shared memory (see mmap_wfst.share_mmap).
+        Pickling the copy only transfers the name of the shared memory
+        block, so large machines can be handed to process pools without
+        repeated serialization. The caller owns the block and should
+        call unlink() on the copy when done.
+        """
+        from .mmap_wfst import share_mmap
+        return share_mmap(self)
+
+    # Pickling
+
+    def __getstate__(self):
+        """
+        Compact state for pickling: serialized Fst without symbol tables,
+        symbol lists, and state labels in id order (only counted if all
+        labels are the default str(q)).
+        """
+        fst = self._fst
+        isymbols = _pack_symbols(fst.input_symbols())
+        osymbols = _pack_symbols(fst.output_symbols())
+        if osymbols == isymbols:
+            osymbols = None
+        fst = fst.copy()
+        fst.set_input_symbols(None)
+        fst.set_output_symbols(None)
+        labels = self._state2label
+        if labels is not None and \
+                all(label == str(q) for q, label in enumerate(labels)):
+            labels = fst.num_states()  # Default labels
+        return {
+            'fst': fst.write_to_string(),
+            'isymbols': isymbols,
+            'osymbols': osymbols,
+            'labels': labels,  # List, count of default labels, or None
+            'sigma': self.sigma,
+            'tier': self.tier,
+            'truncated': self.truncated,
+            'frozen': self._frozen
+        }
+
+    def __setstate__(self, state):
+        fst = Fst.read_from_string(state['fst'])
+        isymbols = _unpack_symbols(state['isymbols'])
+        if state['osymbols'] is None:
+            osymbols = isymbols
+        else:
+            osymbols = _unpack_symbols(state['osymbols'])
+        fst.set_input_symbols(isymbols)
+        fst.set_output_symbols(osymbols)
+        labels = state['labels']
+        if isinstance(labels, int):
+            labels = [str(q) for q in range(labels)]
+        self._fst = fst
+        if labels is None:
+            self._state2label = self._label2state = None
+        else:
+            self._state2label = labels
+            self._label2state = {label: q for q, label in enumerate(labels)}
+        self.sigma = state['sigma']
+        self.tier = state.get('tier', None)
+        self.truncated = state.get('truncated', False)
+        self._closure = {}
+        self._pass = None
+        self._frozen = False
+        self._shared_fst = self._shared_labels = False
+        self._exposed_fst = None
+        if state.get('frozen', False):
+            self.freeze()
 
     # Printing/drawing
 
     def print(self, **kwargs):
-        fst = self.fst
+        fst = self._fst
         # State symbol table
         state_symbols = pynini.SymbolTable()
-        for q, label in self._state2label.items():
-            state_symbols.add_symbol(str(label), q)
+        for q in fst.states():
+            state_symbols.add_symbol(str(self.state_label(q)), q)
         return fst.print(
             isymbols=fst.input_symbols(),
             osymbols=fst.output_symbols(),
@@ -583,11 +1608,11 @@ class Wfst():
             **kwargs)
 
     def draw(self, source, acceptor=True, portrait=True, **kwargs):
-        fst = self.fst
+        fst = self._fst
         # State symbol table
         state_symbols = pynini.SymbolTable()
-        for q, label in self._state2label.items():
-            state_symbols.add_symbol(str(label), q)
+        for q in fst.states():
+            state_symbols.add_symbol(str(self.state_label(q)), q)
         return fst.draw(
             source,
             isymbols=fst.input_symbols(),
@@ -599,44 +1624,149 @@ class Wfst():
 
     # todo:
     # read()/write() from/to file
-    # encode()/decode() labels
-    # minimize(), prune(), rmepsilon()
 
 
-def acceptor(x, add_delim=True, weight=None, arc_type='standard'):
+class Encoder():
+    """
+    Reusable mapping from arc (ilabel, olabel, weight) triples to codes 
+    for Wfst.encode() / decode(). If encode_labels is False the olabel 
+    is kept, and if encode_weights is False the weight is kept. Code 0 
+    is reserved for epsilon arcs with weight one, which stay epsilon. 
+    Encoders hold only plain lists / dicts (including compact symbol 
+    tables of the original machine), so they can be pickled and used to 
+    decode cached machines in other processes.
+    """
+
+    def __init__(self,
+                 input_symtable,
+                 output_symtable,
+                 weight_type='tropical',
+                 encode_labels=True,
+                 encode_weights=False):
+        self.encode_labels = encode_labels
+        self.encode_weights = encode_weights
+        self.weight_type = weight_type
+        self._isymbols = _pack_symbols(input_symtable)
+        self._osymbols = _pack_symbols(output_symtable)
+        self._code2key = [None]  # Code -> (ilabel, olabel, weight)
+        self._key2code = {}  # (ilabel, olabel, weight) -> code
+
+    def encode_arc(self, arc):
+        """ Encoded copy of arc. """
+        ilabel = arc.ilabel
+        olabel = arc.olabel if self.encode_labels else 0
+        weight = float(arc.weight) if self.encode_weights else 0.0
+        if ilabel == 0 and olabel == 0 and weight == 0.0:
+            code = 0
+        else:
+            key = (ilabel, olabel, weight)
+            code = self._key2code.get(key)
+            if code is None:
+                code = len(self._code2key)
+                self._code2key.append(key)
+                self._key2code[key] = code
+        olabel = code if self.encode_labels else arc.olabel
+        if self.encode_weights:
+            weight = Weight.one(self.weight_type)
+        else:
+            weight = arc.weight
+        return Arc(code, olabel, weight, arc.nextstate)
+
+    def decode_arc(self, arc):
+        """ Decoded copy of arc. """
+        code = arc.ilabel
+        if code == 0:
+            ilabel, olabel, weight = (0, 0, 0.0)
+        else:
+            (ilabel, olabel, weight) = self._code2key[code]
+        if not self.encode_labels:
+            olabel = arc.olabel
+        if self.encode_weights:
+            weight = Weight(self.weight_type, weight)
+        else:
+            weight = arc.weight
+        return Arc(ilabel, olabel, weight, arc.nextstate)
+
+    def input_symbols(self):
+        """ Input symbol table of original machine. """
+        return _unpack_symbols(self._isymbols)
+
+    def output_symbols(self):
+        """ Output symbol table of original machine. """
+        return _unpack_symbols(self._osymbols)
+
+    def symbols(self):
+        """
+        Symbol table for codes, with symbols 'ilabel:olabel' (if labels 
+        are encoded) and '/weight' (if weights are encoded, with full 
+        precision so that distinct weights have distinct symbols).
+        """
+        isymbols = self.input_symbols()
+        osymbols = self.output_symbols()
+        symtable = pynini.SymbolTable()
+        symtable.add_symbol(isymbols.find(0), 0)
+        for code in range(1, len(self._code2key)):
+            (ilabel, olabel, weight) = self._code2key[code]
+            sym = isymbols.find(ilabel)
+            if self.encode_labels:
+                sym += ':' + osymbols.find(olabel)
+            if self.encode_weights:
+                sym += '/' + repr(weight)
+            symtable.add_symbol(sym, code)
+        assert symtable.num_symbols() == len(self._code2key), \
+            'Encoder symbols are not unique'
+        return symtable
+
+
+@instrument.operation('acceptor')
+def acceptor(x,
+             add_delim=True,
+             weight=None,
+             arc_type='standard',
+             alphabet=None):
     """
     Acceptor for space-delimited sequence (see pynini.accep).
     pynini.accep() arguments: weight (final weight) and 
     arc_type ("standard", "log", or "log64")
+    Symbols are from alphabet (config.Alphabet) if specified, otherwise 
+    from the config globals.
     """
+    if alphabet is None:
+        alphabet = config
     if not isinstance(x, str):
         x = ' '.join(x)
     if add_delim:
-        x = config.bos + ' ' + x + ' ' + config.eos
+        x = alphabet.bos + ' ' + x + ' ' + alphabet.eos
 
-    isymbols = config.symtable
+    isymbols = alphabet.symtable
     fst = pynini.accep(x, weight, arc_type, token_type=isymbols)
     fst.set_input_symbols(isymbols)
     fst.set_output_symbols(isymbols)
-    wfst = Wfst.from_fst(fst)
+    wfst = Wfst._wrap_fst(fst)
     return wfst
 
 
-def trellis_acceptor(max_len=1, sigma_tier=None):
+@instrument.operation('trellis_acceptor')
+def trellis_acceptor(max_len=1, sigma_tier=None, alphabet=None, tier=False):
     """
     Acceptor for strings up to length max_len (+2 for delimiters). 
     If sigma_tier is specified as a subset of the alphabet, makes 
     acceptor for tier/projection for that subset with other symbols 
-    labeling self-loops on interior states.
+    labeling self-loops on interior states, or passing through 
+    implicitly if tier is True (see Wfst).
     """
-    bos = config.bos
-    eos = config.eos
+    if alphabet is None:
+        alphabet = config
+    bos = alphabet.bos
+    eos = alphabet.eos
     if sigma_tier is None:
-        sigma_tier = set(config.sigma)
+        sigma_tier = set(alphabet.sigma)
         sigma_skip = set()
     else:
-        sigma_skip = set(config.sigma) - sigma_tier
-    wfst = Wfst(config.symtable)
+        sigma_skip = set(alphabet.sigma) - sigma_tier
+    wfst = Wfst(alphabet.symtable, tier=_tier(sigma_tier, tier, alphabet))
+    if tier:
+        sigma_skip = set()
 
     # Initial and peninitial states
     q0 = wfst.add_state()  # id 0
@@ -676,40 +1806,57 @@ def trellis_acceptor(max_len=1, sigma_tier=None):
     return wfst
 
 
-def ngram_acceptor(context='left', context_length=1, sigma_tier=None):
+@instrument.operation('ngram_acceptor')
+def ngram_acceptor(context='left',
+                   context_length=1,
+                   sigma_tier=None,
+                   alphabet=None,
+                   tier=False):
     """
     Acceptor (identity transducer) for segments in immediately preceding 
     (left) / following (right) / both-side contexts of specified length.
     """
     if context == 'left':
-        return ngram_acceptor_left(context_length, sigma_tier)
+        return ngram_acceptor_left(context_length, sigma_tier, alphabet,
+                                   tier)
     if context == 'right':
-        return ngram_acceptor_right(context_length, sigma_tier)
+        return ngram_acceptor_right(context_length, sigma_tier, alphabet,
+                                    tier)
     if context == 'both':
-        L = ngram_acceptor_left(context_length, sigma_tier)
-        R = ngram_acceptor_right(context_length, sigma_tier)
+        L = ngram_acceptor_left(context_length, sigma_tier, alphabet, tier)
+        R = ngram_acceptor_right(context_length, sigma_tier, alphabet, tier)
         #R.project('input')
-        LR = compose(L, R)
+        LR = compose(L, R, alphabet=alphabet)
         return LR
     print(f'Bad side argument to ngram_acceptor {side}')
     return None
 
 
-def ngram_acceptor_left(context_length=1, sigma_tier=None):
+@instrument.operation('ngram_acceptor_left')
+def ngram_acceptor_left(context_length=1,
+                        sigma_tier=None,
+                        alphabet=None,
+                        tier=False):
     """
     Acceptor (identity transducer) for segments in immediately preceding 
-    contexts (histories) of specified length. If sigma_tier is specified as a 
-    subset of sigma, only contexts over sigma_tier are tracked (other members  of sigma are skipped with self-loops on each interior state).
+    contexts (histories) of specified length. If sigma_tier is specified 
+    as a subset of sigma, only contexts over sigma_tier are tracked 
+    (other members of sigma are skipped with self-loops on each interior 
+    state, or pass through implicitly if tier is True).
     """
-    epsilon = config.epsilon
-    bos = config.bos
-    eos = config.eos
+    if alphabet is None:
+        alphabet = config
+    epsilon = alphabet.epsilon
+    bos = alphabet.bos
+    eos = alphabet.eos
     if sigma_tier is None:
-        sigma_tier = set(config.sigma)
+        sigma_tier = set(alphabet.sigma)
         sigma_skip = set()
     else:
-        sigma_skip = set(config.sigma) - sigma_tier
-    wfst = Wfst(config.symtable)
+        sigma_skip = set(alphabet.sigma) - sigma_tier
+    wfst = Wfst(alphabet.symtable, tier=_tier(sigma_tier, tier, alphabet))
+    if tier:
+        sigma_skip = set()
 
     # Initial and peninitial states
     q0 = ('λ',)
@@ -757,22 +1904,31 @@ def ngram_acceptor_left(context_length=1, sigma_tier=None):
     return wfst
 
 
-def ngram_acceptor_right(context_length=1, sigma_tier=None):
+@instrument.operation('ngram_acceptor_right')
+def ngram_acceptor_right(context_length=1,
+                         sigma_tier=None,
+                         alphabet=None,
+                         tier=False):
     """
     Acceptor (identity transducer) for segments in immediately following 
     contexts (futures) of specified length. If sigma_tier is specified as a 
     subset of sigma, only contexts over sigma_tier are tracked (other members 
-    of sigma are skipped with self-loops on each interior state)
+    of sigma are skipped with self-loops on each interior state, or pass 
+    through implicitly if tier is True)
     """
-    epsilon = config.epsilon
-    bos = config.bos
-    eos = config.eos
+    if alphabet is None:
+        alphabet = config
+    epsilon = alphabet.epsilon
+    bos = alphabet.bos
+    eos = alphabet.eos
     if sigma_tier is None:
-        sigma_tier = set(config.sigma)
+        sigma_tier = set(alphabet.sigma)
         sigma_skip = set()
     else:
-        sigma_skip = set(config.sigma) - sigma_tier
-    wfst = Wfst(config.symtable)
+        sigma_skip = set(alphabet.sigma) - sigma_tier
+    wfst = Wfst(alphabet.symtable, tier=_tier(sigma_tier, tier, alphabet))
+    if tier:
+        sigma_skip = set()
 
     # Final and penultimate state
     qf = ('λ',)
@@ -820,52 +1976,260 @@ def ngram_acceptor_right(context_length=1, sigma_tier=None):
     return wfst
 
 
-def compose(wfst1, wfst2):
+@instrument.operation('compose')
+def compose(wfst1, wfst2, workers=None, beam=None, alphabet=None):
     """
     Composition/intersection, retaining contextual info from original 
     machines by labeling each state q = (q1, q2) as (label(q1), label(q2)).
-    todo: multiply weights; matcher/filter options for compose; 
-    flatten state labels created by repeated composition
+    Arc and final weights are products of the weights in wfst1 and wfst2 
+    (sums of float weights; arc type of wfst1). note: earlier versions 
+    ignored weights, giving a standard-arc machine with weight One on 
+    all arcs and final states; weights are needed to prune by beam 
+    (below), so compose machines after map_weights('rmweight') for the 
+    old result. If workers > 1, each frontier is expanded by a process 
+    pool holding read-only copies of wfst1 and wfst2, and states and 
+    arcs are merged in bulk (see parallel.compose_parallel; the pool is 
+    only used if more than one CPU is available). If beam is given, 
+    states and arcs are expanded best-first and those not on any path 
+    within beam of the best path are dropped (see _compose_beam; workers 
+    is then ignored). If either machine declares a tier (see Wfst), 
+    symbols outside of it pass through that machine without arcs, and 
+    the result has the union of the tiers (or no tier if either has 
+    none), so composing tier machines grows with the tiers rather than 
+    the alphabet. The result uses the symbol table of alphabet 
+    (config.Alphabet) if specified, otherwise config.symtable. The 
+    result is empty if either machine has no start state.
+    todo: matcher/filter options for compose; flatten state labels 
+    created by repeated composition
     """
-    wfst = Wfst(config.symtable)
-    Zero = Weight.zero(wfst.weight_type())
+    if alphabet is None:
+        alphabet = config
+    if wfst1.start(label=False) == pynini.NO_STATE_ID or \
+            wfst2.start(label=False) == pynini.NO_STATE_ID:
+        # Empty operand (no start state)
+        return Wfst(alphabet.symtable,
+                    arc_type=wfst1.arc_type(),
+                    tier=_compose_tier(wfst1, wfst2))
+    if beam is not None:
+        return _compose_beam(wfst1, wfst2, beam, alphabet)
+    if workers is not None and workers > 1:
+        from .parallel import compose_parallel
+        return compose_parallel(wfst1, wfst2, workers, alphabet)
+
+    wfst = Wfst(alphabet.symtable,
+                arc_type=wfst1.arc_type(),
+                tier=_compose_tier(wfst1, wfst2))
+    weight_type = wfst.weight_type()
+    tiers = (_tier_ids(wfst1), _tier_ids(wfst2))
 
     q0 = (wfst1.start(), wfst2.start())
     wfst.add_state(q0)
     wfst.set_start(q0)
+    final = _compose_final(wfst1, wfst2, q0)
+    if final != math.inf:
+        wfst.set_final(q0, Weight(weight_type, final))
 
     # Lazy state and transition construction
     Q = set([q0])
     Q_old, Q_new = set(), set([q0])
     while len(Q_new) != 0:
+        instrument.frontier(len(Q_new))
         Q_old, Q_new = Q_new, Q_old
         Q_new.clear()
         for src in Q_old:
-            # State labels in M1, M2
-            src1, src2 = src
-            for t1 in wfst1.arcs(src1):
-                # todo: sort arcs wfst2
-                for t2 in wfst2.arcs(src2):
-                    if t1.olabel != t2.ilabel:
-                        continue
-                    dest1 = t1.nextstate
-                    dest2 = t2.nextstate
-                    dest = (wfst1.state_label(dest1), wfst2.state_label(dest2))
-                    wfst.add_state(dest)
-                    # note: no change if dest already exists
-                    wfst.add_arc(
-                        src=src, ilabel=t1.ilabel, olabel=t2.olabel, dest=dest)
-                    # dest is final if both dest1 and dest2 aere final
-                    if wfst1.final(dest1) != Zero and wfst2.final(
-                            dest2) != Zero:
-                        wfst.set_final(dest)
-                    if dest not in Q:
-                        Q.add(dest)
-                        Q_new.add(dest)
+            src_id = wfst.state_id(src)
+            for (ilabel, olabel, weight, dest, final) in \
+                    _compose_arcs(wfst1, wfst2, src, tiers):
+                # note: no change if dest already exists
+                dest_id = wfst.add_state(dest)
+                wfst.add_arc(src=src_id,
+                             ilabel=ilabel,
+                             olabel=olabel,
+                             weight=Weight(weight_type, weight),
+                             dest=dest_id)
+                if dest not in Q:
+                    # Final weight depends only on dest
+                    if final != math.inf:
+                        wfst.set_final(dest_id, Weight(weight_type, final))
+                    Q.add(dest)
+                    Q_new.add(dest)
 
     return wfst.connect()
 
 
+def _compose_arcs(wfst1, wfst2, src, tiers=(None, None)):
+    """
+    Arcs (ilabel, olabel, weight, dest, final) from state src = 
+    (label(q1), label(q2)) of the composition of wfst1 and wfst2, where 
+    weight is the float arc weight and final is the float final weight 
+    of dest (inf unless both components of dest are final). tiers are 
+    the symbol ids of the tiers of wfst1 and wfst2 (see _tier_ids); 
+    other symbols pass through the machine without changing its state.
+    """
+    # State labels in M1, M2
+    src1, src2 = src
+    tier1, tier2 = tiers
+    # Arcs of wfst2 by input label
+    arcs2 = {}
+    for t2 in wfst2.arcs(src2):
+        if t2.ilabel in arcs2:
+            arcs2[t2.ilabel].append(t2)
+        else:
+            arcs2[t2.ilabel] = [t2]
+    for t1 in wfst1.arcs(src1):
+        if tier2 is not None and t1.olabel != 0 and \
+                t1.olabel not in tier2:
+            # Off-tier output of wfst1 passes through wfst2
+            dest1 = t1.nextstate
+            dest = (wfst1.state_label(dest1), src2)
+            final = float(wfst1.final(dest1)) + \
+                float(wfst2.final(wfst2.state_id(src2)))
+            yield (t1.ilabel, t1.olabel, float(t1.weight), dest, final)
+            continue
+        if t1.olabel not in arcs2:
+            continue
+        dest1 = t1.nextstate
+        label1 = wfst1.state_label(dest1)
+        weight1 = float(t1.weight)
+        final1 = float(wfst1.final(dest1))
+        for t2 in arcs2[t1.olabel]:
+            dest2 = t2.nextstate
+            dest = (label1, wfst2.state_label(dest2))
+            weight = weight1 + float(t2.weight)
+            final = final1 + float(wfst2.final(dest2))
+            yield (t1.ilabel, t2.olabel, weight, dest, final)
+    if tier1 is None:
+        return
+    for t2 in wfst2.arcs(src2):
+        if t2.ilabel != 0 and t2.ilabel not in tier1:
+            # Off-tier input of wfst2 passes through wfst1
+            dest2 = t2.nextstate
+            dest = (src1, wfst2.state_label(dest2))
+            final = float(wfst1.final(wfst1.state_id(src1))) + \
+                float(wfst2.final(dest2))
+            yield (t2.ilabel, t2.olabel, float(t2.weight), dest, final)
+
+
+def _tier_ids(wfst):
+    """ Input symbol ids of tier of machine (None if no tier). """
+    if wfst.tier is None:
+        return None
+    isymbols = wfst.input_symbols()
+    return frozenset(isymbols.find(sym) for sym in wfst.tier)
+
+
+def _compose_tier(wfst1, wfst2):
+    """ Tier of composition: union of tiers, or None if either has none. """
+    if wfst1.tier is None or wfst2.tier is None:
+        return None
+    return wfst1.tier | wfst2.tier
+
+
+def _compose_final(wfst1, wfst2, q):
+    """ Float final weight of state q = (label(q1), label(q2)). """
+    q1, q2 = q
+    return float(wfst1.final(wfst1.state_id(q1))) + \
+        float(wfst2.final(wfst2.state_id(q2)))
+
+
+def _compose_beam(wfst1, wfst2, beam, alphabet):
+    """
+    Beam-pruned composition (see compose). States are expanded in order 
+    of forward weight g plus heuristic h(q1, q2) = beta1(q1) + beta2(q2), 
+    the sum of backward potentials of the operands (see potentials), 
+    which is admissible and consistent for non-negative weights (log 
+    weights are treated as tropical). The best path weight is the 
+    minimum of g + final weight over expanded states; expansion stops at 
+    states with g + h > best + beam, and states and arcs with 
+    g + weight + h above that limit are dropped. As h is a lower bound, 
+    the expanded part contains all paths within beam of the best; it is 
+    then pruned exactly (see prune), giving the same result as 
+    compose(wfst1, wfst2).prune(beam) without building the full product.
+    """
+    inf = math.inf
+    beta1 = wfst1.potentials(reverse=True)
+    beta2 = wfst2.potentials(reverse=True)
+    wfst = Wfst(alphabet.symtable,
+                arc_type=wfst1.arc_type(),
+                tier=_compose_tier(wfst1, wfst2))
+    weight_type = wfst.weight_type()
+    tiers = (_tier_ids(wfst1), _tier_ids(wfst2))
+
+    q0 = (wfst1.start(), wfst2.start())
+    h0 = beta1[wfst1.state_id(q0[0])] + beta2[wfst2.state_id(q0[1])]
+    if h0 == inf:
+        wfst.add_state(q0)
+        wfst.set_start(q0)
+        return wfst.connect()
+
+    # Best-first expansion; lazy deletion of stale heap entries
+    g = {q0: 0.0}
+    h = {q0: h0}
+    finals = {}
+    final = _compose_final(wfst1, wfst2, q0)
+    if final != inf:
+        finals[q0] = final
+    arcs = []
+    expanded = []
+    best = inf
+    limit = inf
+    heap = [(h0, 0, q0)]
+    count = 1
+    while len(heap) != 0:
+        (f, _, src) = heapq.heappop(heap)
+        if f > limit:
+            break
+        if f > g[src] + h[src]:
+            continue  # stale
+        if src in finals and g[src] + finals[src] < best:
+            best = g[src] + finals[src]
+            # note: slack for rounding (h and g sum weights in other orders)
+            limit = best + beam + 1e-6
+        expanded.append(src)
+        for (ilabel, olabel, weight, dest, final) in \
+                _compose_arcs(wfst1, wfst2, src, tiers):
+            arcs.append((src, ilabel, olabel, weight, dest))
+            if dest not in h:
+                h[dest] = beta1[wfst1.state_id(dest[0])] + \
+                    beta2[wfst2.state_id(dest[1])]
+                if final != inf:
+                    finals[dest] = final
+            g_dest = g[src] + weight
+            if h[dest] == inf or g_dest >= g.get(dest, inf):
+                continue
+            g[dest] = g_dest
+            if g_dest + h[dest] <= limit:
+                heapq.heappush(heap, (g_dest + h[dest], count, dest))
+                count += 1
+        instrument.frontier(len(heap))
+
+    # Keep expanded states and arcs within beam
+    for q in expanded:
+        if g[q] + h[q] <= limit:
+            wfst.add_state(q)
+            if q in finals and g[q] + finals[q] <= limit:
+                wfst.set_final(q, Weight(weight_type, finals[q]))
+    wfst.set_start(q0)
+    Q = wfst._label2state
+    for (src, ilabel, olabel, weight, dest) in arcs:
+        if src in Q and dest in Q and g[src] + weight + h[dest] <= limit:
+            wfst.add_arc(src=src,
+                         ilabel=ilabel,
+                         olabel=olabel,
+                         weight=Weight(weight_type, weight),
+                         dest=dest)
+    return wfst.prune(beam)
+
+
+def _minimize_code(codes, code2arc, key, val):
+    """ Code of arc or final weight in encoded acceptor (see minimize). """
+    code = codes.get(key)
+    if code is None:
+        code = codes[key] = len(code2arc)
+        code2arc.append(val)
+    return code
+
+
 def arc_equal(arc1, arc2):
     """
     Arc equality (missing from pynini?).
@@ -877,6 +2241,25 @@ def arc_equal(arc1, arc2):
     return val
 
 
+def _detached_copy(fst):
+    """
+    Copy of Fst with its own storage. Fst.copy() shares storage until 
+    either Fst is mutated, which arc iterators from mutable_arcs() 
+    taken before copying bypass, so the copy is mutated at once.
+    """
+    fst = fst.copy()
+    if fst.num_states() != 0:
+        fst.set_final(0, fst.final(0))
+    return fst
+
+
+def _tier(sigma_tier, tier, alphabet):
+    """ Declared tier of acceptor for sigma_tier (see trellis_acceptor). """
+    if not tier:
+        return None
+    return set(sigma_tier) | {alphabet.bos, alphabet.eos}
+
+
 def _prefix(x, l):
     """ Length-l prefix of tuple x """
     if l < 1:
@@ -893,3 +2276,96 @@ def _suffix(x, l):
     if len(x) < l:
         return x
     return x[-l:]
+
+
+def _pack_symbols(symtable):
+    """
+    Compact form of symbol table: list of symbols if keys are 0, 1, ...
+    in order, otherwise list of (key, symbol) pairs.
+    """
+    items = list(symtable)
+    if all(k == i for i, (k, _) in enumerate(items)):
+        return [sym for (_, sym) in items]
+    return items
+
+
+def _unpack_symbols(items):
+    """ Symbol table from compact form (see _pack_symbols). """
+    symtable = pynini.SymbolTable()
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            symtable.add_symbol(item, i)
+        else:
+            symtable.add_symbol(item[1], item[0])
+    return symtable
+
+
+def _fst_header(fst_type, arc_type, start, num_states, num_arcs=0):
+    """ OpenFst binary header (without symbol tables). """
+    fst_type = fst_type.encode('utf-8')
+    arc_type = arc_type.encode('utf-8')
+    # magic, fst type, arc type, version, flags, properties (expanded,
+    # mutable), start, number of states, number of arcs
+    return struct.pack(f'<ii{len(fst_type)}si{len(arc_type)}siiQqqq',
+                       _FST_MAGIC, len(fst_type), fst_type, len(arc_type),
+                       arc_type, 2, 0, 0x3, start, num_states, num_arcs)
+
+
+def _read_fst_header(data):
+    """ Fields of OpenFst binary header and offset of following data. """
+    magic, k = struct.unpack_from('<ii', data, 0)
+    if magic != _FST_MAGIC:
+        raise ValueError('Not an OpenFst binary')
+    fst_type = data[8:(8 + k)].decode('utf-8')
+    offset = 8 + k
+    k, = struct.unpack_from('<i', data, offset)
+    arc_type = data[(offset + 4):(offset + 4 + k)].decode('utf-8')
+    offset += 4 + k
+    version, flags, properties, start, num_states, num_arcs = \
+        struct.unpack_from('<iiQqqq', data, offset)
+    offset += struct.calcsize('<iiQqqq')
+    if flags != 0:
+        # todo: skip symbol tables, alignment padding
+        raise ValueError('Unsupported OpenFst binary header flags')
+    header = {
+        'fst_type': fst_type,
+        'arc_type': arc_type,
+        'version': version,
+        'properties': properties,
+        'start': start,
+        'num_states': num_states,
+        'num_arcs': num_arcs
+    }
+    return header, offset
+
+
+def _weight_dtype(arc_type):
+    """ NumPy dtype of binary weights for arc type. """
+    return '<f8' if arc_type == 'log64' else '<f4'
+
+
+# OpenFst binary magic number
+_FST_MAGIC = 2125659606
+
+# Passes over epsilon arcs allowed for epsilon closures to converge in
+# the log semiring (cycle weights above ~0.01, with tolerance 1e-6)
+_closure_passes = 2000
+
+
+def _plus(weight_type):
+    """
+    Semiring plus over float weights: min for tropical, negated 
+    log-sum-exp for log / log64.
+    """
+    if weight_type == 'tropical':
+        return min
+    return _log_plus
+
+
+def _log_plus(a, b):
+    """ -log(exp(-a) + exp(-b)) """
+    if a == float('inf'):
+        return b
+    if b == float('inf'):
+        return a
+    return min(a, b) - math.log1p(math.exp(-abs(a - b)))